@@ -13,17 +13,31 @@ import re
 import asyncio
 import sqlite3
 import hashlib
+import ipaddress
 import secrets
+import signal
+import heapq
+import threading
+import random
+import uuid
+from collections import Counter
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional, List, Dict, Any
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, contextmanager
 
+import httpx
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Response, Request, Depends, Cookie
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse, RedirectResponse, JSONResponse
+from fastapi.responses import StreamingResponse, RedirectResponse, JSONResponse, ORJSONResponse
 from pydantic import BaseModel
 
+# orjson is optional (no prebuilt wheels for MIPS) - fall back to stdlib json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Import tunnel management
 import tunnels as tunnel_mgr
 
@@ -42,6 +56,56 @@ SYSTEM_STATS_FILE = DATA_DIR / "system_stats.json"  # Legacy, will be removed
 STATS_DB_FILE = DATA_DIR / "stats.db"
 HISTORY_FILE = DATA_DIR / "connection_history.json"
 SETTINGS_FILE = DATA_DIR / "settings.json"
+
+# Precompiled patterns for conntrack/version/ping/adblock parsing (hot paths)
+_SRC_RE = re.compile(r'src=(\d+\.\d+\.\d+\.\d+)')
+_DST_RE = re.compile(r'dst=(\d+\.\d+\.\d+\.\d+)')
+_DPORT_RE = re.compile(r'dport=(\d+)')
+_BYTES_RE = re.compile(r'bytes=(\d+)')
+_VERSION_RE = re.compile(r'version\s+([\d.]+)')
+_PRIVATE_PREFIXES = ("10.", "172.", "192.168.", "127.")
+_MEMINFO_RE = re.compile(rb'^(MemTotal|MemFree|Buffers|Cached):\s+(\d+)', re.MULTILINE)
+_PING_TIME_RE = re.compile(r'time=([\d.]+)')
+_HOSTNAME_RE = re.compile(r'^[a-z0-9]([a-z0-9\-]*[a-z0-9])?(\.[a-z0-9]([a-z0-9\-]*[a-z0-9])?)+$')
+_ABP_DOMAIN_RE = re.compile(r'^[a-z0-9]([a-z0-9\-\.]*[a-z0-9])?$')
+
+# ============ SQLite Connection Pool ============
+
+# stats.db connections in WAL mode, reused across requests instead of reopened per call
+DB_POOL_SIZE = 4
+_db_pool: List[sqlite3.Connection] = []
+_db_pool_lock = threading.Lock()
+
+def connect_db() -> sqlite3.Connection:
+    """Open a stats.db connection (WAL: readers don't block the writer)"""
+    conn = sqlite3.connect(str(STATS_DB_FILE), check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+@contextmanager
+def db_connection():
+    """Borrow a pooled stats.db connection, committing on success"""
+    with _db_pool_lock:
+        conn = _db_pool.pop() if _db_pool else None
+    if conn is None:
+        conn = connect_db()
+    
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        with _db_pool_lock:
+            if len(_db_pool) < DB_POOL_SIZE:
+                _db_pool.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+
 # ============ Authentication System (SQLite) ============
 
 # Active sessions storage (token -> {username, expires})
@@ -51,10 +115,19 @@ def hash_password(password: str) -> str:
     """Hash password using SHA-256"""
     return hashlib.sha256(password.encode()).hexdigest()
 
+_auth_db_ready = False
+
 def init_auth_db():
-    """Initialize auth table in SQLite database"""
-    conn = sqlite3.connect(STATS_DB_FILE)
-    cursor = conn.cursor()
+    """Initialize auth table in SQLite database (once per process)"""
+    global _auth_db_ready
+    if _auth_db_ready:
+        return
+    with db_connection() as conn:
+        _create_auth_table(conn.cursor())
+    _auth_db_ready = True
+
+def _create_auth_table(cursor):
+    """Create auth table, migrate columns and insert default user"""
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS auth (
             id INTEGER PRIMARY KEY CHECK (id = 1),
@@ -79,18 +152,12 @@ def init_auth_db():
             INSERT INTO auth (id, username, password_hash, enabled, session_hours, first_login)
             VALUES (1, 'admin', ?, 1, 24, 1)
         ''', (hash_password('admin'),))
-    conn.commit()
-    conn.close()
 
 def load_auth_config() -> dict:
     """Load authentication configuration from SQLite"""
     init_auth_db()
-    conn = sqlite3.connect(STATS_DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM auth WHERE id = 1')
-    row = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        row = conn.execute('SELECT * FROM auth WHERE id = 1').fetchone()
     
     if row:
         return {
@@ -106,41 +173,32 @@ def load_auth_config() -> dict:
 def save_auth_config(config: dict):
     """Save authentication configuration to SQLite"""
     init_auth_db()
-    conn = sqlite3.connect(STATS_DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE auth SET 
-            username = ?,
-            password_hash = ?,
-            enabled = ?,
-            session_hours = ?,
-            last_login = ?
-        WHERE id = 1
-    ''', (
-        config.get("username", "admin"),
-        config.get("password_hash"),
-        1 if config.get("enabled", True) else 0,
-        config.get("session_hours", 24),
-        config.get("last_login")
-    ))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        conn.execute('''
+            UPDATE auth SET 
+                username = ?,
+                password_hash = ?,
+                enabled = ?,
+                session_hours = ?,
+                last_login = ?
+            WHERE id = 1
+        ''', (
+            config.get("username", "admin"),
+            config.get("password_hash"),
+            1 if config.get("enabled", True) else 0,
+            config.get("session_hours", 24),
+            config.get("last_login")
+        ))
 
 def update_last_login():
     """Update last login timestamp"""
-    conn = sqlite3.connect(STATS_DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE auth SET last_login = ? WHERE id = 1', (datetime.now().isoformat(),))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        conn.execute('UPDATE auth SET last_login = ? WHERE id = 1', (datetime.now().isoformat(),))
 
 def mark_first_login_complete():
     """Mark first login as completed"""
-    conn = sqlite3.connect(STATS_DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE auth SET first_login = 0 WHERE id = 1')
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        conn.execute('UPDATE auth SET first_login = 0 WHERE id = 1')
 
 def verify_password(password: str, stored_hash: str) -> bool:
     """Verify password against stored hash"""
@@ -284,6 +342,30 @@ class DeviceUpdate(BaseModel):
     custom_ips: Optional[list] = None
     enabled: Optional[bool] = None
 
+class CustomIpCreate(BaseModel):
+    ip: str = ""
+    description: str = ""
+
+class AutoUpdateTimeSet(BaseModel):
+    time: str = "05:00"
+
+class SplitDnsRule(BaseModel):
+    domain: str = ""
+    server: str = ""
+
+class SplitDnsConfig(BaseModel):
+    enabled: bool = False
+    rules: List[SplitDnsRule] = []
+
+class TelegramConfig(BaseModel):
+    bot_token: Optional[str] = None
+    chat_id: Optional[str] = None
+    enabled: Optional[bool] = None
+    notifications: Optional[Dict[str, bool]] = None
+
+class ThemeSet(BaseModel):
+    theme: str = "light"
+
 # Tunnel Management Models
 class TunnelCreate(BaseModel):
     name: str
@@ -353,21 +435,79 @@ class RoutingDefaultSet(BaseModel):
     default_outbound: str
 
 # Helper functions
+def json_loads(data):
+    """Parse JSON from str or bytes (orjson when available)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(data, indent: bool = False) -> bytes:
+    """Serialize data to UTF-8 JSON bytes (orjson when available)"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    return json.dumps(data, indent=2 if indent else None, ensure_ascii=False).encode('utf-8')
+
+# Background JSON writer: save_json only queues data, flash writes happen in a thread.
+# Pending data stays in the map until written so load_json sees the latest state.
+_pending_writes: Dict[Path, bytes] = {}
+_writes_cond = threading.Condition()
+_writer_thread: Optional[threading.Thread] = None
+
+def _json_writer():
+    """Write queued JSON files atomically, coalescing repeated saves of the same file"""
+    while True:
+        with _writes_cond:
+            while not _pending_writes:
+                _writes_cond.wait()
+            path, data = next(iter(_pending_writes.items()))
+        
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + '.tmp')
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"[pinpoint] Failed to write {path}: {e}", flush=True)
+        
+        with _writes_cond:
+            if _pending_writes.get(path) is data:
+                del _pending_writes[path]
+            _writes_cond.notify_all()
+
+def flush_json_writes():
+    """Block until all queued JSON writes are on disk"""
+    with _writes_cond:
+        while _pending_writes:
+            _writes_cond.wait()
+
 def load_json(path: Path) -> dict:
     """Load JSON file"""
+    with _writes_cond:
+        pending = _pending_writes.get(path)
+    if pending is not None:
+        return json_loads(pending)
     if path.exists():
-        with open(path) as f:
-            return json.load(f)
+        return json_loads(path.read_bytes())
     return {}
 
 def save_json(path: Path, data: dict):
-    """Save JSON file"""
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, 'w') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    """Queue JSON file for writing by the background writer"""
+    global _writer_thread
+    payload = json_dumps(data, indent=True)
+    with _writes_cond:
+        if _writer_thread is None:
+            _writer_thread = threading.Thread(target=_json_writer, name="json-writer", daemon=True)
+            _writer_thread.start()
+        _pending_writes[path] = payload
+        _writes_cond.notify_all()
 
 def run_command(cmd: list, timeout: int = 30) -> tuple:
     """Run shell command and return (success, output)"""
+    # External scripts read our data files
+    flush_json_writes()
     try:
         result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
         return result.returncode == 0, result.stdout + result.stderr
@@ -376,23 +516,248 @@ def run_command(cmd: list, timeout: int = 30) -> tuple:
     except Exception as e:
         return False, str(e)
 
+async def arun_command(cmd: list, timeout: int = 30) -> tuple:
+    """Run command without blocking the event loop and return (success, output)"""
+    # External scripts read our data files; wait for pending writes off the event loop
+    if _pending_writes:
+        await asyncio.to_thread(flush_json_writes)
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT
+        )
+    except Exception as e:
+        return False, str(e)
+    
+    try:
+        output, _ = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return False, "Command timed out"
+    
+    return proc.returncode == 0, output.decode(errors='replace')
+
+# pinpoint-update.py rewrites the list files and nft sets in place - never run two at once
+_lists_update_lock = asyncio.Lock()
+
+async def run_lists_update(timeout: int = 120) -> tuple:
+    """Run pinpoint-update.py after any update already in progress and return (success, output)"""
+    async with _lists_update_lock:
+        return await arun_command(
+            ["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"],
+            timeout=timeout
+        )
+
+async def tcp_probe(host: str, port: int, timeout: int = 5) -> int:
+    """Open a TCP connection without blocking the event loop and return latency in ms"""
+    start = time.monotonic()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"Connection to {host}:{port} timed out")
+    latency = int((time.monotonic() - start) * 1000)
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except Exception:
+        pass
+    return latency
+
+def nft_table_objects(table: str = "pinpoint") -> List[Dict]:
+    """List an inet table with one `nft -j` call and return its objects (sets, chains, rules)"""
+    success, output = run_command(["nft", "-j", "list", "table", "inet", table])
+    if not success:
+        return []
+    try:
+        return json_loads(output).get("nftables", [])
+    except ValueError:
+        return []
+
+def nft_set_elements(name: str, table: str = "pinpoint") -> set:
+    """Load an nft set with one `nft -j` call as strings: 'addr', 'addr/len' or 'first-last'"""
+    success, output = run_command(["nft", "-j", "list", "set", "inet", table, name])
+    if not success:
+        return set()
+    try:
+        objects = json_loads(output).get("nftables", [])
+    except ValueError:
+        return set()
+    
+    elements = set()
+    for obj in objects:
+        for elem in obj.get("set", {}).get("elem", ()):
+            # Elements with timeouts/counters are wrapped as {"elem": {"val": ...}}
+            if isinstance(elem, dict) and "elem" in elem:
+                elem = elem["elem"].get("val")
+            if isinstance(elem, str):
+                elements.add(elem)
+            elif isinstance(elem, dict) and "prefix" in elem:
+                elements.add(f"{elem['prefix']['addr']}/{elem['prefix']['len']}")
+            elif isinstance(elem, dict) and "range" in elem:
+                elements.add("-".join(elem["range"]))
+    return elements
+
+def _element_bounds(element: str) -> Optional[tuple]:
+    """(first, last) address of an nft_set_elements() entry, None if unparsable"""
+    try:
+        if "-" in element:
+            first, last = element.split("-", 1)
+            return ipaddress.ip_address(first), ipaddress.ip_address(last)
+        net = ipaddress.ip_network(element, strict=False)
+        return net.network_address, net.broadcast_address
+    except ValueError:
+        return None
+
+def nft_set_counters() -> Dict[str, tuple]:
+    """(packets, bytes) of the prerouting rules matching @tunnel_ips / @tunnel_nets, from one `nft -j` call"""
+    counters = {"tunnel_ips": (0, 0), "tunnel_nets": (0, 0)}
+    success, output = run_command(["nft", "-j", "list", "chain", "inet", "pinpoint", "prerouting"])
+    if not success:
+        return counters
+    try:
+        objects = json_loads(output).get("nftables", [])
+    except ValueError:
+        return counters
+    
+    for obj in objects:
+        rule = obj.get("rule")
+        if not rule:
+            continue
+        name = counter = None
+        for expr in rule.get("expr", ()):
+            if not isinstance(expr, dict):
+                continue
+            right = expr.get("match", {}).get("right")
+            if isinstance(right, str) and right.startswith("@") and right[1:] in counters:
+                name = right[1:]
+            elif "counter" in expr:
+                counter = expr["counter"]
+        if name and isinstance(counter, dict):
+            counters[name] = (counter.get("packets", 0), counter.get("bytes", 0))
+    return counters
+
+def nft_chain_counter(objects: List[Dict], chain: str) -> tuple:
+    """(packets, bytes) of the first counter in a chain of nft_table_objects() output"""
+    for obj in objects:
+        rule = obj.get("rule")
+        if not rule or rule.get("chain") != chain:
+            continue
+        for expr in rule.get("expr", ()):
+            counter = expr.get("counter") if isinstance(expr, dict) else None
+            if counter:
+                return counter.get("packets", 0), counter.get("bytes", 0)
+    return 0, 0
+
+async def wait_until(predicate, timeout: float = 5, initial: float = 0.05, factor: float = 1.5) -> bool:
+    """Poll predicate with exponential backoff until it returns true or timeout expires"""
+    deadline = time.monotonic() + timeout
+    delay = initial
+    while not predicate():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(delay, remaining))
+        delay *= factor
+    return True
+
+def tun_ifindex() -> Optional[int]:
+    """ifindex of tun1, or None when the interface does not exist"""
+    try:
+        return int(Path("/sys/class/net/tun1/ifindex").read_bytes())
+    except (OSError, ValueError):
+        return None
+
+def read_meminfo() -> dict:
+    """Read MemTotal/MemFree/Buffers/Cached (in bytes) with a single scan of /proc/meminfo"""
+    data = Path('/proc/meminfo').read_bytes()
+    return {key.decode(): int(value) * 1024 for key, value in _MEMINFO_RE.findall(data)}
+
+def find_pids(pattern: str) -> List[int]:
+    """Return PIDs whose command line matches pattern, like `pgrep -f` but without forking"""
+    regex = re.compile(pattern.encode())
+    pids = []
+    try:
+        entries = os.scandir('/proc')
+    except OSError:
+        return pids
+    with entries:
+        for entry in entries:
+            if not entry.name.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry.name}/cmdline', 'rb') as f:
+                    cmdline = f.read()
+            except OSError:
+                continue
+            if cmdline and regex.search(cmdline.replace(b'\0', b' ')):
+                pids.append(int(entry.name))
+    pids.sort()
+    return pids
+
+# Shared async HTTP client (created in lifespan)
+_http_client: Optional[httpx.AsyncClient] = None
+
+def new_http_client() -> httpx.AsyncClient:
+    """Create an HTTP client with a small keep-alive connection pool"""
+    return httpx.AsyncClient(follow_redirects=True, limits=httpx.Limits(max_connections=16))
+
+async def http_request(method: str, url: str, **kwargs) -> httpx.Response:
+    """Send request through the shared keep-alive client and raise on HTTP errors"""
+    if _http_client is not None:
+        resp = await _http_client.request(method, url, **kwargs)
+    else:
+        async with new_http_client() as client:
+            resp = await client.request(method, url, **kwargs)
+    resp.raise_for_status()
+    return resp
+
+async def fetch_text(url: str, user_agent: str = "PinPoint/1.0", timeout: int = 30, errors: str = 'strict') -> str:
+    """Fetch URL and return body as UTF-8 text without blocking the event loop"""
+    resp = await http_request("GET", url, headers={"User-Agent": user_agent}, timeout=timeout)
+    return resp.content.decode('utf-8', errors=errors)
+
+async def fetch_subscription(url: str, format_hint: str = "auto", user_agent: str = "PinPoint/1.0",
+                             timeout: int = 30) -> List[Dict]:
+    """Stream subscription body into the incremental parser and return tunnels"""
+    headers = {"User-Agent": user_agent}
+    parser = tunnel_mgr.SubscriptionStreamParser(format_hint)
+    client = _http_client or new_http_client()
+    try:
+        async with client.stream("GET", url, headers=headers, timeout=timeout) as resp:
+            resp.raise_for_status()
+            async for chunk in resp.aiter_bytes(16384):
+                parser.feed(chunk)
+    finally:
+        if client is not _http_client:
+            await client.aclose()
+    return parser.finish()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan handler"""
+    global _http_client
     # Startup
     print("[pinpoint] API server starting...", flush=True)
+    _http_client = new_http_client()
     asyncio.create_task(background_health_check())
+    asyncio.create_task(subscription_scheduler())
     print("[pinpoint] Background task created", flush=True)
     yield
     # Shutdown
     print("[pinpoint] API server stopping...", flush=True)
+    flush_json_writes()
+    await _http_client.aclose()
+    _http_client = None
 
 # Create FastAPI app
 app = FastAPI(
     title="PinPoint",
     description="Selective routing management for OpenWRT",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse if orjson is not None else JSONResponse
 )
 
 # Public paths that don't require authentication
@@ -572,32 +937,20 @@ async def get_status():
     try:
         config_path = Path("/etc/sing-box/config.json")
         if config_path.exists():
-            config = json.loads(config_path.read_text())
+            config = json_loads(config_path.read_bytes())
             outbounds = config.get("outbounds", [])
             vpn_types = ["vless", "vmess", "trojan", "shadowsocks", "hysteria2", "hysteria"]
             vpn_configured = any(ob.get("type") in vpn_types for ob in outbounds)
     except Exception:
         pass
     
-    # Get nftables counters
-    success, output = run_command(["nft", "list", "chain", "inet", "pinpoint", "prerouting"])
-    
-    packets = 0
-    bytes_count = 0
-    if success:
-        import re
-        # Parse counter from output
-        match = re.search(r'counter packets (\d+) bytes (\d+)', output)
-        if match:
-            packets = int(match.group(1))
-            bytes_count = int(match.group(2))
-    
-    # Count sets
-    success, output = run_command(["nft", "list", "set", "inet", "pinpoint", "tunnel_nets"])
-    nets_count = output.count(',') + 1 if 'elements' in output else 0
+    # Get nftables counters and set sizes from a single table listing
+    nft_objects = nft_table_objects()
+    packets, bytes_count = nft_chain_counter(nft_objects, "prerouting")
     
-    success, output = run_command(["nft", "list", "set", "inet", "pinpoint", "tunnel_ips"])
-    ips_count = output.count(',') + 1 if 'elements' in output else 0
+    set_sizes = {obj["set"].get("name"): len(obj["set"].get("elem", ())) for obj in nft_objects if "set" in obj}
+    nets_count = set_sizes.get("tunnel_nets", 0)
+    ips_count = set_sizes.get("tunnel_ips", 0)
     
     # Get last update info
     status_file = DATA_DIR / "status.json"
@@ -654,7 +1007,7 @@ async def toggle_service(service_id: str, toggle: ServiceToggle):
             save_json(SERVICES_FILE, data)
             
             # Apply changes
-            run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+            await run_lists_update()
             
             return {"status": "ok", "service_id": service_id, "enabled": toggle.enabled}
     
@@ -676,7 +1029,7 @@ async def add_service_domain(service_id: str, item: ServiceDomainAdd):
                 
                 # Apply changes if service is enabled
                 if service.get("enabled"):
-                    run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+                    await run_lists_update()
             
             return {"status": "ok", "domain": item.domain}
     
@@ -695,7 +1048,7 @@ async def delete_service_domain(service_id: str, domain: str):
                 save_json(SERVICES_FILE, data)
                 
                 if service.get("enabled"):
-                    run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+                    await run_lists_update()
             
             return {"status": "ok", "removed": domain}
     
@@ -716,7 +1069,7 @@ async def add_service_ip(service_id: str, item: ServiceIpAdd):
                 save_json(SERVICES_FILE, data)
                 
                 if service.get("enabled"):
-                    run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+                    await run_lists_update()
             
             return {"status": "ok", "ip": item.ip}
     
@@ -737,7 +1090,7 @@ async def delete_service_ip(service_id: str, ip: str):
                 save_json(SERVICES_FILE, data)
                 
                 if service.get("enabled"):
-                    run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+                    await run_lists_update()
             
             return {"status": "ok", "removed": ip_clean}
     
@@ -762,7 +1115,7 @@ async def add_service_source(service_id: str, item: ServiceSourceAdd):
             save_json(SERVICES_FILE, data)
             
             if service.get("enabled"):
-                run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+                await run_lists_update()
             
             return {"status": "ok", "url": item.url}
     
@@ -780,7 +1133,7 @@ async def delete_service_source(service_id: str, url: str):
             save_json(SERVICES_FILE, data)
             
             if service.get("enabled"):
-                run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+                await run_lists_update()
             
             return {"status": "ok", "removed": url}
     
@@ -797,10 +1150,7 @@ async def refresh_service(service_id: str):
                 raise HTTPException(status_code=400, detail="Service is disabled")
             
             # Run update
-            success, output = run_command(
-                ["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"],
-                timeout=120
-            )
+            success, output = await run_lists_update()
             
             return {"status": "ok" if success else "error", "output": output}
     
@@ -837,7 +1187,7 @@ async def add_domain(domain: DomainCreate):
     save_json(DOMAINS_FILE, data)
     
     # Apply changes
-    run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+    await run_lists_update()
     
     return new_domain
 
@@ -853,7 +1203,7 @@ async def delete_domain(domain_id: int):
             save_json(DOMAINS_FILE, data)
             
             # Apply changes
-            run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+            await run_lists_update()
             
             return {"status": "ok", "deleted": domain_id}
     
@@ -867,14 +1217,14 @@ async def get_custom_ips():
     return data.get("custom_ips", [])
 
 @app.post("/api/custom-ips")
-async def add_custom_ip(ip_data: dict):
+async def add_custom_ip(ip_data: CustomIpCreate):
     """Add custom IP"""
     data = load_json(DOMAINS_FILE)
     if "custom_ips" not in data:
         data["custom_ips"] = []
     
-    ip = ip_data.get("ip", "").strip()
-    description = ip_data.get("description", "").strip()
+    ip = ip_data.ip.strip()
+    description = ip_data.description.strip()
     
     if not ip:
         raise HTTPException(status_code=400, detail="IP is required")
@@ -894,7 +1244,7 @@ async def add_custom_ip(ip_data: dict):
     save_json(DOMAINS_FILE, data)
     
     # Apply changes
-    run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+    await run_lists_update()
     
     return new_ip
 
@@ -910,7 +1260,7 @@ async def delete_custom_ip(ip_id: int):
             save_json(DOMAINS_FILE, data)
             
             # Apply changes
-            run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+            await run_lists_update()
             
             return {"status": "ok", "deleted": ip_id}
     
@@ -929,8 +1279,6 @@ async def get_custom_services():
 @app.post("/api/custom-services")
 async def create_custom_service(service: CustomServiceCreate):
     """Create a new custom service"""
-    import uuid
-    
     data = load_json(CUSTOM_SERVICES_FILE)
     if "services" not in data:
         data["services"] = []
@@ -952,7 +1300,7 @@ async def create_custom_service(service: CustomServiceCreate):
     save_json(CUSTOM_SERVICES_FILE, data)
     
     # Apply changes
-    run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+    await run_lists_update()
     
     return new_service
 
@@ -991,7 +1339,7 @@ async def update_custom_service(service_id: str, update: CustomServiceUpdate):
             save_json(CUSTOM_SERVICES_FILE, data)
             
             # Apply changes
-            run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+            await run_lists_update()
             
             return service
     
@@ -1010,7 +1358,7 @@ async def delete_custom_service(service_id: str):
             save_json(CUSTOM_SERVICES_FILE, data)
             
             # Apply changes
-            run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+            await run_lists_update()
             
             return {"status": "ok", "deleted": service_id}
     
@@ -1029,7 +1377,7 @@ async def toggle_custom_service(service_id: str):
             save_json(CUSTOM_SERVICES_FILE, data)
             
             # Apply changes
-            run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+            await run_lists_update()
             
             return {"status": "ok", "enabled": service["enabled"]}
     
@@ -1039,10 +1387,7 @@ async def toggle_custom_service(service_id: str):
 @app.post("/api/update")
 async def update_lists():
     """Update all lists from sources"""
-    success, output = run_command(
-        ["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"],
-        timeout=120
-    )
+    success, output = await run_lists_update()
     
     return {
         "status": "ok" if success else "error",
@@ -1052,7 +1397,6 @@ async def update_lists():
 @app.get("/api/settings/auto-update")
 async def get_auto_update_time():
     """Get auto-update time from cron"""
-    import re
     try:
         with open("/etc/crontabs/root", "r") as f:
             content = f.read()
@@ -1069,10 +1413,9 @@ async def get_auto_update_time():
         return {"time": "05:00", "enabled": False}
 
 @app.post("/api/settings/auto-update")
-async def set_auto_update_time(data: dict):
+async def set_auto_update_time(data: AutoUpdateTimeSet):
     """Set auto-update time in cron"""
-    import re
-    time_str = data.get("time", "05:00")
+    time_str = data.time
     
     try:
         hour, minute = map(int, time_str.split(":"))
@@ -1118,23 +1461,18 @@ async def test_domain(test: DomainTest):
             "error": "Could not resolve domain"
         }
     
-    # Check if any IP is in the tunnel sets
-    in_tunnel = False
-    matched_ip = None
+    # Check if any IP is in the tunnel sets (each set loaded once, matched locally)
+    tunnel_ips = nft_set_elements("tunnel_ips")
+    matched_ip = next((ip for ip in ips if ip in tunnel_ips), None)
     
-    for ip in ips:
-        # Check nftables set
-        success, output = run_command([
-            "nft", "get", "element", "inet", "pinpoint", "tunnel_ips", 
-            "{", ip, "}"
-        ])
-        if success:
-            in_tunnel = True
-            matched_ip = ip
-            break
-        
-        # Also check tunnel_nets (harder to check for CIDR match)
-        # For now, we'll use a simple approach
+    if matched_ip is None:
+        bounds = [b for b in map(_element_bounds, nft_set_elements("tunnel_nets")) if b]
+        for ip in ips:
+            addr = ipaddress.ip_address(ip)
+            if any(first.version == addr.version and first <= addr <= last for first, last in bounds):
+                matched_ip = ip
+                break
+    in_tunnel = matched_ip is not None
     
     return {
         "domain": domain,
@@ -1147,29 +1485,16 @@ async def test_domain(test: DomainTest):
 @app.get("/api/stats")
 async def get_stats():
     """Get traffic statistics"""
-    # Get nftables counters
-    success, output = run_command(["nft", "list", "chain", "inet", "pinpoint", "prerouting"])
+    # Get nftables counters - tunnel_ips = DNS resolved, tunnel_nets = static lists
+    counters = nft_set_counters()
+    dns_packets, dns_bytes = counters["tunnel_ips"]
+    static_packets, static_bytes = counters["tunnel_nets"]
     
     stats = {
-        "dns_resolved": {"packets": 0, "bytes": 0},
-        "static_lists": {"packets": 0, "bytes": 0}
+        "dns_resolved": {"packets": dns_packets, "bytes": dns_bytes},
+        "static_lists": {"packets": static_packets, "bytes": static_bytes}
     }
     
-    if success:
-        import re
-        # Parse counters - tunnel_ips = DNS resolved, tunnel_nets = static lists
-        for line in output.split('\n'):
-            if '@tunnel_ips' in line or 'tunnel_ips' in line:
-                match = re.search(r'counter packets (\d+) bytes (\d+)', line)
-                if match:
-                    stats["dns_resolved"]["packets"] = int(match.group(1))
-                    stats["dns_resolved"]["bytes"] = int(match.group(2))
-            elif '@tunnel_nets' in line or 'tunnel_nets' in line:
-                match = re.search(r'counter packets (\d+) bytes (\d+)', line)
-                if match:
-                    stats["static_lists"]["packets"] = int(match.group(1))
-                    stats["static_lists"]["bytes"] = int(match.group(2))
-    
     stats["total"] = {
         "packets": stats["dns_resolved"]["packets"] + stats["static_lists"]["packets"],
         "bytes": stats["dns_resolved"]["bytes"] + stats["static_lists"]["bytes"]
@@ -1187,16 +1512,16 @@ async def get_service_status():
     }
     
     # Check PinPoint (Python/uvicorn process)
-    success, output = run_command(["pgrep", "-f", "uvicorn.*main:app"])
-    if success and output.strip():
+    pids = find_pids("uvicorn.*main:app")
+    if pids:
         result["pinpoint"]["running"] = True
-        result["pinpoint"]["pid"] = int(output.strip().split()[0])
+        result["pinpoint"]["pid"] = pids[0]
     
     # Check sing-box
-    success, output = run_command(["pgrep", "-f", "sing-box"])
-    if success and output.strip():
+    pids = find_pids("sing-box")
+    if pids:
         result["singbox"]["running"] = True
-        result["singbox"]["pid"] = int(output.strip().split()[0])
+        result["singbox"]["pid"] = pids[0]
     
     return result
 
@@ -1210,8 +1535,7 @@ async def start_services():
     results["singbox"] = success
     
     # Wait for tun1 interface to be created
-    import time
-    time.sleep(2)
+    await wait_until(Path("/sys/class/net/tun1").exists)
     
     # Restore routing rules (same as Lite version)
     success, _ = run_command(["/opt/pinpoint/scripts/pinpoint-init.sh", "start"])
@@ -1247,13 +1571,13 @@ async def restart_services():
     """Restart sing-box and routing"""
     results = {"singbox": False, "routing": False}
     
-    # Restart sing-box
+    # Restart sing-box (procd stops the old instance asynchronously)
+    old_ifindex = tun_ifindex()
     success, _ = run_command(["/etc/init.d/sing-box", "restart"])
     results["singbox"] = success
     
-    # Wait for tun1 interface to be created
-    import time
-    time.sleep(2)
+    # Wait for the new tun1 - the old one may still be there, so compare ifindex
+    await wait_until(lambda: tun_ifindex() not in (None, old_ifindex))
     
     # Re-apply routing rules (same as Lite version)
     success, _ = run_command(["/opt/pinpoint/scripts/pinpoint-init.sh", "start"])
@@ -1311,7 +1635,6 @@ async def get_service_logs(type: str = "pinpoint", lines: int = 100):
             logs = '\n'.join(lines_list[-lines:])
     
     # Strip ANSI color codes
-    import re
     logs = re.sub(r'\x1b\[[0-9;]*m', '', logs)
     
     return {"logs": logs, "type": type}
@@ -1382,7 +1705,6 @@ async def create_device(device: DeviceCreate):
         data["devices"] = []
     
     # Generate unique ID
-    import re
     device_id = re.sub(r'[^a-z0-9]', '_', device.name.lower())
     base_id = device_id
     counter = 1
@@ -1407,7 +1729,7 @@ async def create_device(device: DeviceCreate):
     save_json(DEVICES_FILE, data)
     
     # Apply routing rules
-    apply_device_routing()
+    await apply_device_routing()
     
     return new_device
 
@@ -1436,7 +1758,7 @@ async def update_device(device_id: str, update: DeviceUpdate):
                 device["enabled"] = update.enabled
             
             save_json(DEVICES_FILE, data)
-            apply_device_routing()
+            await apply_device_routing()
             
             return device
     
@@ -1452,7 +1774,7 @@ async def delete_device(device_id: str):
         if device["id"] == device_id:
             del devices[i]
             save_json(DEVICES_FILE, data)
-            apply_device_routing()
+            await apply_device_routing()
             return {"status": "ok", "deleted": device_id}
     
     raise HTTPException(status_code=404, detail="Device not found")
@@ -1469,7 +1791,7 @@ async def add_device_service(device_id: str, service_id: str):
             if service_id not in device["services"]:
                 device["services"].append(service_id)
                 save_json(DEVICES_FILE, data)
-                apply_device_routing()
+                await apply_device_routing()
             return {"status": "ok", "services": device["services"]}
     
     raise HTTPException(status_code=404, detail="Device not found")
@@ -1484,14 +1806,14 @@ async def remove_device_service(device_id: str, service_id: str):
             if service_id in device.get("services", []):
                 device["services"].remove(service_id)
                 save_json(DEVICES_FILE, data)
-                apply_device_routing()
+                await apply_device_routing()
             return {"status": "ok", "services": device.get("services", [])}
     
     raise HTTPException(status_code=404, detail="Device not found")
 
-def apply_device_routing():
+async def apply_device_routing():
     """Apply device-specific routing rules via nftables"""
-    run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+    await run_lists_update()
 
 @app.get("/api/network/hosts")
 async def get_network_hosts():
@@ -1597,7 +1919,6 @@ async def import_device(ip: str):
     name = host.get("hostname") or f"Device {ip.split('.')[-1]}"
     
     # Generate unique ID
-    import re
     device_id = re.sub(r'[^a-z0-9]', '_', name.lower())
     base_id = device_id
     counter = 1
@@ -1650,8 +1971,7 @@ class StatsDatabase:
     def _get_conn(self):
         """Get database connection (create if needed)"""
         if self._conn is None:
-            self._conn = sqlite3.connect(str(STATS_DB_FILE), check_same_thread=False)
-            self._conn.row_factory = sqlite3.Row
+            self._conn = connect_db()
         return self._conn
     
     def _init_db(self):
@@ -1766,27 +2086,11 @@ class StatsDatabase:
     
     def collect_traffic(self):
         """Collect traffic stats from nftables"""
-        success, output = run_command(["nft", "list", "chain", "inet", "pinpoint", "prerouting"])
-        
+        # tunnel_ips = DNS resolved IPs, tunnel_nets = static IP lists
+        counters = nft_set_counters()
         now = int(time.time())
-        dns_bytes = 0
-        static_bytes = 0
-        dns_packets = 0
-        static_packets = 0
-        
-        if success:
-            for line in output.split('\n'):
-                match = re.search(r'counter packets (\d+) bytes (\d+)', line)
-                if match:
-                    packets = int(match.group(1))
-                    bytes_count = int(match.group(2))
-                    # tunnel_ips = DNS resolved IPs, tunnel_nets = static IP lists
-                    if '@tunnel_ips' in line or 'tunnel_ips' in line:
-                        dns_packets = packets
-                        dns_bytes = bytes_count
-                    elif '@tunnel_nets' in line or 'tunnel_nets' in line:
-                        static_packets = packets
-                        static_bytes = bytes_count
+        dns_packets, dns_bytes = counters["tunnel_ips"]
+        static_packets, static_bytes = counters["tunnel_nets"]
         
         total_bytes = dns_bytes + static_bytes
         total_packets = dns_packets + static_packets
@@ -2082,11 +2386,7 @@ class SystemStats:
         # Get RAM usage
         meminfo = {}
         try:
-            with open('/proc/meminfo', 'r') as f:
-                for line in f:
-                    parts = line.split()
-                    if len(parts) >= 2:
-                        meminfo[parts[0].rstrip(':')] = int(parts[1]) * 1024
+            meminfo = read_meminfo()
             
             total = meminfo.get('MemTotal', 0)
             free = meminfo.get('MemFree', 0)
@@ -2101,9 +2401,9 @@ class SystemStats:
         
         # Get Pinpoint RAM
         try:
-            success, output = run_command(["pgrep", "-f", "sing-box"])
-            if success and output.strip():
-                pid = output.strip().split()[0]
+            pids = find_pids("sing-box")
+            if pids:
+                pid = pids[0]
                 with open(f'/proc/{pid}/status', 'r') as f:
                     for line in f:
                         if line.startswith('VmRSS:'):
@@ -2218,7 +2518,7 @@ async def get_traffic_by_device():
                     continue  # Skip non-VPN traffic
                 
                 # Parse conntrack line for source IP (LAN device)
-                src_match = re.search(r'src=(\d+\.\d+\.\d+\.\d+)', line)
+                src_match = _SRC_RE.search(line)
                 if src_match:
                     ip = src_match.group(1)
                     if ip.startswith("192.168."):
@@ -2227,7 +2527,7 @@ async def get_traffic_by_device():
                         device_stats[ip]["connections"] += 1
                         
                         # Get bytes - conntrack has two bytes values, sum them
-                        bytes_matches = re.findall(r'bytes=(\d+)', line)
+                        bytes_matches = _BYTES_RE.findall(line)
                         for b in bytes_matches:
                             device_stats[ip]["bytes"] += int(b)
     except:
@@ -2286,9 +2586,9 @@ async def get_connections(limit: int = 100):
                 
                 proto = parts[2]  # tcp, udp
                 
-                src_match = re.search(r'src=(\d+\.\d+\.\d+\.\d+)', line)
-                dst_match = re.search(r'dst=(\d+\.\d+\.\d+\.\d+)', line)
-                dport_match = re.search(r'dport=(\d+)', line)
+                src_match = _SRC_RE.search(line)
+                dst_match = _DST_RE.search(line)
+                dport_match = _DPORT_RE.search(line)
                 
                 if src_match and dst_match:
                     src_ip = src_match.group(1)
@@ -2408,31 +2708,29 @@ async def get_services_latency():
     data = load_json(SERVICES_FILE)
     enabled = [s for s in data.get("services", []) if s.get("enabled")]
     
+    targets = [(s, s["domains"][0]) for s in enabled[:10] if s.get("domains") and s["domains"][0]]  # Limit to 10 to avoid timeout
+    
+    # Ping all services at once so the endpoint takes one timeout, not ten
+    outputs = await asyncio.gather(*[
+        arun_command(["ping", "-c", "1", "-W", "2", "-I", "tun1", domain], timeout=5)
+        for _, domain in targets
+    ])
+    
     results = []
-    for service in enabled[:10]:  # Limit to 10 to avoid timeout
-        domain = service.get("domains", [""])[0]
-        if domain:
-            try:
-                # Quick ping
-                success, output = run_command([
-                    "ping", "-c", "1", "-W", "2", "-I", "tun1", domain
-                ], timeout=5)
-                
-                latency = None
-                if success:
-                    match = re.search(r'time=([\d.]+)', output)
-                    if match:
-                        latency = float(match.group(1))
-                
-                results.append({
-                    "id": service["id"],
-                    "name": service["name"],
-                    "domain": domain,
-                    "latency_ms": latency,
-                    "status": "ok" if latency else "timeout"
-                })
-            except:
-                pass
+    for (service, domain), (success, output) in zip(targets, outputs):
+        latency = None
+        if success:
+            match = _PING_TIME_RE.search(output)
+            if match:
+                latency = float(match.group(1))
+        
+        results.append({
+            "id": service["id"],
+            "name": service["name"],
+            "domain": domain,
+            "latency_ms": latency,
+            "status": "ok" if latency else "timeout"
+        })
     
     return {"services": results}
 
@@ -2447,10 +2745,10 @@ async def get_health():
     }
     
     # Check sing-box
-    success, output = run_command(["pgrep", "-f", "sing-box"])
+    pids = find_pids("sing-box")
     health["components"]["sing_box"] = {
-        "status": "running" if success else "stopped",
-        "pid": output.strip() if success else None
+        "status": "running" if pids else "stopped",
+        "pid": "\n".join(map(str, pids)) if pids else None
     }
     
     # Check tun1 interface
@@ -2461,8 +2759,8 @@ async def get_health():
     }
     
     # Check DNS service (dnsmasq or alternative)
-    # First try pgrep, then check if DNS resolution works
-    success, output = run_command(["pgrep", "-f", "dnsmasq"])
+    # First look for the process, then check if DNS resolution works
+    success = bool(find_pids("dnsmasq"))
     if not success:
         # Maybe it's running with different name, check if port 53 is listening
         success, output = run_command(["netstat", "-uln"])
@@ -2479,27 +2777,12 @@ async def get_health():
         "status": "ok" if success else "error"
     }
     
-    # Check DNS resolution (test actual DNS functionality)
-    dns_ok = False
-    try:
-        # Try to resolve via system DNS
-        socket.setdefaulttimeout(3)
-        socket.gethostbyname("ya.ru")
-        dns_ok = True
-    except:
-        # Try nslookup as fallback
-        success, output = run_command(["nslookup", "ya.ru"], timeout=5)
-        dns_ok = success and "Address" in output
-    
-    health["components"]["dns"] = {"status": "ok" if dns_ok else "error"}
-    
     # Check if VPN tunnel is actually configured (not just direct)
     vpn_configured = False
     try:
         config_path = Path("/etc/sing-box/config.json")
         if config_path.exists():
-            import json as json_module
-            config = json_module.loads(config_path.read_text())
+            config = json_loads(config_path.read_bytes())
             outbounds = config.get("outbounds", [])
             # Check for VPN outbounds (vless, vmess, trojan, shadowsocks, hysteria2)
             vpn_types = ["vless", "vmess", "trojan", "shadowsocks", "hysteria2", "hysteria"]
@@ -2510,13 +2793,24 @@ async def get_health():
     except Exception:
         pass
     
-    # Check internet connectivity through tunnel
-    vpn_ok = False
-    vpn_ip = None
-    
-    if vpn_configured:
+    async def check_dns():
+        """Test actual DNS functionality"""
+        try:
+            # Try to resolve via system DNS
+            await asyncio.wait_for(asyncio.get_running_loop().getaddrinfo("ya.ru", None), 3)
+            return True
+        except (OSError, asyncio.TimeoutError):
+            # Try nslookup as fallback
+            success, output = await arun_command(["nslookup", "ya.ru"], timeout=5)
+            return success and "Address" in output
+    
+    async def check_tunnel():
+        """Check internet connectivity through tunnel, return (ok, ip)"""
+        if not vpn_configured:
+            return False, None
+        
         # Try curl first (use -4 to force IPv4, api.ipify.org is more reliable)
-        success, output = run_command([
+        success, output = await arun_command([
             "curl", "-4", "-s", "--max-time", "5", "--interface", "tun1",
             "https://api.ipify.org"
         ], timeout=8)
@@ -2525,17 +2819,20 @@ async def get_health():
             # Validate it looks like an IP address
             ip_candidate = output.strip().split('\n')[0].strip()
             if re.match(r'^\d+\.\d+\.\d+\.\d+$', ip_candidate):
-                vpn_ok = True
-                vpn_ip = ip_candidate
+                return True, ip_candidate
         
         # Fallback: try ping through tunnel
-        if not vpn_ok:
-            success, output = run_command([
-                "ping", "-c", "1", "-W", "3", "-I", "tun1", "8.8.8.8"
-            ], timeout=5)
-            if success and "1 received" in output:
-                vpn_ok = True
-                vpn_ip = "connectivity ok"
+        success, output = await arun_command([
+            "ping", "-c", "1", "-W", "3", "-I", "tun1", "8.8.8.8"
+        ], timeout=5)
+        if success and "1 received" in output:
+            return True, "connectivity ok"
+        return False, None
+    
+    # The DNS and tunnel probes are independent network waits; run them together
+    dns_ok, (vpn_ok, vpn_ip) = await asyncio.gather(check_dns(), check_tunnel())
+    
+    health["components"]["dns"] = {"status": "ok" if dns_ok else "error"}
     
     health["components"]["internet_via_tunnel"] = {
         "status": "ok" if vpn_ok else ("disabled" if not vpn_configured else "error"),
@@ -2673,7 +2970,7 @@ PYTHON_PACKAGES = {
     }
 }
 
-def check_dependency(dep_id: str) -> dict:
+async def check_dependency(dep_id: str) -> dict:
     """Check if a single dependency is installed"""
     if dep_id not in DEPENDENCIES:
         return {"id": dep_id, "installed": False, "error": "Unknown dependency"}
@@ -2688,14 +2985,14 @@ def check_dependency(dep_id: str) -> dict:
     
     # If not found via file, try command
     if not installed and "check_cmd" in dep:
-        success, output = run_command(dep["check_cmd"], timeout=5)
+        success, output = await arun_command(dep["check_cmd"], timeout=5)
         installed = success
     
     # Try to get version
     if installed and dep_id == "sing-box":
-        success, output = run_command(["sing-box", "version"], timeout=5)
+        success, output = await arun_command(["sing-box", "version"], timeout=5)
         if success:
-            match = re.search(r'version\s+([\d.]+)', output)
+            match = _VERSION_RE.search(output)
             if match:
                 version = match.group(1)
     
@@ -2709,7 +3006,7 @@ def check_dependency(dep_id: str) -> dict:
         "version": version
     }
 
-def check_python_package(pkg_id: str) -> dict:
+async def check_python_package(pkg_id: str) -> dict:
     """Check if a Python package is installed"""
     if pkg_id not in PYTHON_PACKAGES:
         return {"id": pkg_id, "installed": False, "error": "Unknown package"}
@@ -2719,7 +3016,7 @@ def check_python_package(pkg_id: str) -> dict:
     version = None
     
     # Use pip show to check if package is actually installed (not cached)
-    success, output = run_command(["pip3", "show", pkg["name"]], timeout=10)
+    success, output = await arun_command(["pip3", "show", pkg["name"]], timeout=10)
     if success and "Name:" in output:
         installed = True
         # Extract version from pip show output
@@ -2738,47 +3035,48 @@ def check_python_package(pkg_id: str) -> dict:
         "type": "python"
     }
 
-@app.get("/api/dependencies")
-async def get_dependencies():
-    """Get status of all dependencies"""
-    result = {
-        "system": [],
-        "python": [],
-        "summary": {
-            "total": 0,
-            "installed": 0,
-            "missing_required": 0,
-            "missing_optional": 0
-        }
+async def _compute_dependencies() -> dict:
+    """Probe all system dependencies and Python packages concurrently"""
+    system = await asyncio.gather(*(check_dependency(dep_id) for dep_id in DEPENDENCIES))
+    python = await asyncio.gather(*(check_python_package(pkg_id) for pkg_id in PYTHON_PACKAGES))
+    return {
+        "system": {status["id"]: status for status in system},
+        "python": {status["id"]: status for status in python}
+    }
+
+def _summarize_dependencies(statuses: list) -> dict:
+    """Build dependency summary counters from a list of statuses"""
+    summary = {
+        "total": 0,
+        "installed": 0,
+        "missing_required": 0,
+        "missing_optional": 0
     }
     
-    # Check system dependencies
-    for dep_id in DEPENDENCIES:
-        status = check_dependency(dep_id)
-        result["system"].append(status)
-        result["summary"]["total"] += 1
-        if status["installed"]:
-            result["summary"]["installed"] += 1
-        elif status["required"]:
-            result["summary"]["missing_required"] += 1
-        else:
-            result["summary"]["missing_optional"] += 1
-    
-    # Check Python packages
-    for pkg_id in PYTHON_PACKAGES:
-        status = check_python_package(pkg_id)
-        result["python"].append(status)
-        result["summary"]["total"] += 1
+    for status in statuses:
+        summary["total"] += 1
         if status["installed"]:
-            result["summary"]["installed"] += 1
+            summary["installed"] += 1
         elif status["required"]:
-            result["summary"]["missing_required"] += 1
+            summary["missing_required"] += 1
         else:
-            result["summary"]["missing_optional"] += 1
+            summary["missing_optional"] += 1
     
-    result["summary"]["ready"] = result["summary"]["missing_required"] == 0
+    summary["ready"] = summary["missing_required"] == 0
+    return summary
+
+@app.get("/api/dependencies")
+async def get_dependencies():
+    """Get status of all dependencies"""
+    statuses = await _compute_dependencies()
+    system = list(statuses["system"].values())
+    python = list(statuses["python"].values())
     
-    return result
+    return {
+        "system": system,
+        "python": python,
+        "summary": _summarize_dependencies(system + python)
+    }
 
 @app.post("/api/dependencies/install/{dep_id}")
 async def install_dependency(dep_id: str):
@@ -2789,13 +3087,13 @@ async def install_dependency(dep_id: str):
             raise HTTPException(400, "This dependency cannot be installed automatically")
         
         # Run install command
-        success, output = run_command(
+        success, output = await arun_command(
             ["sh", "-c", dep["install_cmd"]], 
             timeout=120
         )
         
         # Verify installation
-        status = check_dependency(dep_id)
+        status = await check_dependency(dep_id)
         
         return {
             "success": status["installed"],
@@ -2807,13 +3105,13 @@ async def install_dependency(dep_id: str):
         pkg = PYTHON_PACKAGES[dep_id]
         
         # Run pip install
-        success, output = run_command(
+        success, output = await arun_command(
             ["sh", "-c", pkg["install_cmd"]], 
             timeout=120
         )
         
         # Verify installation
-        status = check_python_package(dep_id)
+        status = await check_python_package(dep_id)
         
         return {
             "success": status["installed"],
@@ -2829,46 +3127,55 @@ async def install_all_dependencies():
     """Install all missing required dependencies"""
     results = []
     
+    # Probe everything once up front
+    initial = await _compute_dependencies()
+    system_todo = [
+        dep_id for dep_id, dep in DEPENDENCIES.items()
+        if dep["required"] and dep.get("install_cmd") and not initial["system"][dep_id]["installed"]
+    ]
+    python_todo = [
+        pkg_id for pkg_id, pkg in PYTHON_PACKAGES.items()
+        if pkg["required"] and not initial["python"][pkg_id]["installed"]
+    ]
+    
     # First update opkg
-    run_command(["opkg", "update"], timeout=60)
-    
-    # Install missing system dependencies
-    for dep_id, dep in DEPENDENCIES.items():
-        status = check_dependency(dep_id)
-        if not status["installed"] and dep["required"]:
-            if dep.get("install_cmd"):
-                success, output = run_command(
-                    ["sh", "-c", dep["install_cmd"]], 
-                    timeout=120
-                )
-                new_status = check_dependency(dep_id)
-                results.append({
-                    "id": dep_id,
-                    "success": new_status["installed"],
-                    "output": output[:500] if output else ""
-                })
+    if system_todo:
+        await arun_command(["opkg", "update"], timeout=60)
+    
+    # Install missing system dependencies, re-probing only what was touched
+    for dep_id in system_todo:
+        success, output = await arun_command(
+            ["sh", "-c", DEPENDENCIES[dep_id]["install_cmd"]], 
+            timeout=120
+        )
+        new_status = await check_dependency(dep_id)
+        initial["system"][dep_id] = new_status
+        results.append({
+            "id": dep_id,
+            "success": new_status["installed"],
+            "output": output[:500] if output else ""
+        })
     
     # Install missing Python packages
-    for pkg_id, pkg in PYTHON_PACKAGES.items():
-        status = check_python_package(pkg_id)
-        if not status["installed"] and pkg["required"]:
-            success, output = run_command(
-                ["sh", "-c", pkg["install_cmd"]], 
-                timeout=120
-            )
-            new_status = check_python_package(pkg_id)
-            results.append({
-                "id": pkg_id,
-                "success": new_status["installed"],
-                "output": output[:500] if output else ""
-            })
+    for pkg_id in python_todo:
+        success, output = await arun_command(
+            ["sh", "-c", PYTHON_PACKAGES[pkg_id]["install_cmd"]], 
+            timeout=120
+        )
+        new_status = await check_python_package(pkg_id)
+        initial["python"][pkg_id] = new_status
+        results.append({
+            "id": pkg_id,
+            "success": new_status["installed"],
+            "output": output[:500] if output else ""
+        })
     
-    # Get final status
-    final_status = await get_dependencies()
+    # Final status is the initial probe patched with re-probed items
+    final = list(initial["system"].values()) + list(initial["python"].values())
     
     return {
         "results": results,
-        "summary": final_status["summary"]
+        "summary": _summarize_dependencies(final)
     }
 
 class RemoveRequest(BaseModel):
@@ -2888,12 +3195,12 @@ async def remove_dependency(dep_id: str, force: bool = False):
         if dep["required"] and not force:
             raise HTTPException(400, "Cannot remove required dependency. Use force=true to override.")
         
-        success, output = run_command(
+        success, output = await arun_command(
             ["sh", "-c", dep["remove_cmd"]], 
             timeout=60
         )
         
-        status = check_dependency(dep_id)
+        status = await check_dependency(dep_id)
         
         return {
             "success": not status["installed"],
@@ -2908,12 +3215,12 @@ async def remove_dependency(dep_id: str, force: bool = False):
         if pkg["required"] and not force:
             raise HTTPException(400, "Cannot remove required package. Use force=true to override.")
         
-        success, output = run_command(
+        success, output = await arun_command(
             ["pip3", "uninstall", "-y", pkg["name"]], 
             timeout=60
         )
         
-        status = check_python_package(dep_id)
+        status = await check_python_package(dep_id)
         
         return {
             "success": not status["installed"],
@@ -2935,13 +3242,13 @@ async def get_service_status():
     
     if installed:
         # Check if enabled (has symlink in /etc/rc.d/)
-        success, output = run_command(["ls", "/etc/rc.d/"], timeout=5)
-        if success:
-            enabled = "pinpoint" in output
+        try:
+            enabled = any("pinpoint" in name for name in os.listdir("/etc/rc.d"))
+        except OSError:
+            pass
         
         # Check if running
-        success, output = run_command(["pgrep", "-f", "pinpoint/backend/main.py"], timeout=5)
-        running = success and output.strip() != ""
+        running = bool(find_pids("pinpoint/backend/main.py"))
     
     return {
         "installed": installed,
@@ -2979,7 +3286,7 @@ start_service() {
         os.chmod(init_path, 0o755)
         
         # Enable service
-        run_command(["/etc/init.d/pinpoint", "enable"])
+        await arun_command(["/etc/init.d/pinpoint", "enable"])
         
         return {
             "success": True,
@@ -2996,7 +3303,7 @@ async def disable_pinpoint_service():
     try:
         if init_path.exists():
             # Disable service first
-            run_command(["/etc/init.d/pinpoint", "disable"], timeout=10)
+            await arun_command(["/etc/init.d/pinpoint", "disable"], timeout=10)
             # Remove init script
             init_path.unlink()
         
@@ -3017,7 +3324,7 @@ async def get_opkg_info():
     }
     
     # Get architecture
-    success, output = run_command(["opkg", "print-architecture"], timeout=10)
+    success, output = await arun_command(["opkg", "print-architecture"], timeout=10)
     if success:
         lines = output.strip().split('\n')
         for line in lines:
@@ -3028,9 +3335,12 @@ async def get_opkg_info():
                     break
     
     # Get feeds
-    success, output = run_command(["cat", "/etc/opkg/distfeeds.conf"], timeout=5)
-    if success:
-        for line in output.strip().split('\n'):
+    try:
+        feeds = Path("/etc/opkg/distfeeds.conf").read_text()
+    except OSError:
+        feeds = ""
+    if feeds:
+        for line in feeds.strip().split('\n'):
             if line.startswith('src/gz'):
                 parts = line.split()
                 if len(parts) >= 3:
@@ -3040,7 +3350,7 @@ async def get_opkg_info():
                     })
     
     # Count installed packages
-    success, output = run_command(["opkg", "list-installed"], timeout=30)
+    success, output = await arun_command(["opkg", "list-installed"], timeout=30)
     if success:
         result["installed_count"] = len(output.strip().split('\n'))
     
@@ -3066,10 +3376,12 @@ async def get_system_resources():
         "pinpoint_status": "stopped"
     }
     
-    # Get CPU usage from top (instant reading)
+    # Get CPU usage from top (instant reading, output reused for sing-box below)
+    top_out = ""
     try:
-        success, top_out = run_command(["top", "-b", "-n", "1"], timeout=3)
+        success, output = await arun_command(["top", "-b", "-n", "1"], timeout=3)
         if success:
+            top_out = output
             # Parse header line: CPU:   0% usr   1% sys   0% nic  98% idle   0% io   0% irq   0% sirq
             for line in top_out.split('\n'):
                 if line.startswith('CPU:') and 'idle' in line:
@@ -3086,14 +3398,7 @@ async def get_system_resources():
     
     # Get RAM usage from /proc/meminfo
     try:
-        meminfo = {}
-        with open('/proc/meminfo', 'r') as f:
-            for line in f:
-                parts = line.split()
-                if len(parts) >= 2:
-                    key = parts[0].rstrip(':')
-                    value = int(parts[1]) * 1024  # Convert from KB to bytes
-                    meminfo[key] = value
+        meminfo = read_meminfo()
         
         total = meminfo.get('MemTotal', 0)
         free = meminfo.get('MemFree', 0)
@@ -3108,21 +3413,18 @@ async def get_system_resources():
     except:
         pass
     
-    # Get disk usage
+    # Get disk usage (statvfs, same numbers as `df /overlay` without the fork)
     try:
-        success, output = run_command(["df", "/overlay"])
-        if success:
-            lines = output.strip().split('\n')
-            if len(lines) >= 2:
-                parts = lines[1].split()
-                if len(parts) >= 5:
-                    total = int(parts[1]) * 1024
-                    used = int(parts[2]) * 1024
-                    percent = int(parts[4].rstrip('%'))
-                    resources["disk_percent"] = percent
-                    resources["disk_used"] = used
-                    resources["disk_total"] = total
-    except:
+        st = os.statvfs("/overlay")
+        total = st.f_blocks * st.f_frsize
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        avail = st.f_bavail * st.f_frsize
+        if used + avail > 0:
+            # df rounds Use% up
+            resources["disk_percent"] = -(-used * 100 // (used + avail))
+        resources["disk_used"] = used
+        resources["disk_total"] = total
+    except OSError:
         pass
     
     # Get uptime
@@ -3145,28 +3447,23 @@ async def get_system_resources():
     # Get Pinpoint (sing-box) service stats
     try:
         # Find sing-box process
-        success, output = run_command(["pgrep", "-f", "sing-box"])
-        if success and output.strip():
-            pid = output.strip().split()[0]
+        pids = find_pids("sing-box")
+        if pids:
+            pid = pids[0]
             resources["pinpoint_status"] = "active"
             
-            # Get CPU from top (more accurate for instantaneous reading)
-            try:
-                success, top_out = run_command(["top", "-b", "-n", "1"], timeout=3)
-                if success:
-                    for line in top_out.split('\n'):
-                        if 'sing-box' in line:
-                            # Format: PID PPID USER STAT VSZ %VSZ %CPU COMMAND
-                            parts = line.split()
-                            if len(parts) >= 7:
-                                try:
-                                    cpu_pct = float(parts[6].replace('%', ''))
-                                    resources["pinpoint_cpu"] = cpu_pct
-                                except:
-                                    pass
-                            break
-            except:
-                pass
+            # Get CPU from the top snapshot taken above
+            for line in top_out.split('\n'):
+                if 'sing-box' in line:
+                    # Format: PID PPID USER STAT VSZ %VSZ %CPU COMMAND
+                    parts = line.split()
+                    if len(parts) >= 7:
+                        try:
+                            cpu_pct = float(parts[6].replace('%', ''))
+                            resources["pinpoint_cpu"] = cpu_pct
+                        except ValueError:
+                            pass
+                    break
             
             # Get memory usage from /proc/[pid]/status
             try:
@@ -3263,7 +3560,7 @@ async def export_config():
     }
     
     return Response(
-        content=json.dumps(config, indent=2, ensure_ascii=False),
+        content=json_dumps(config, indent=True),
         media_type="application/json",
         headers={"Content-Disposition": "attachment; filename=pinpoint_config.json"}
     )
@@ -3282,7 +3579,7 @@ async def import_config(config: dict):
             save_json(SETTINGS_FILE, config["settings"])
         
         # Apply changes
-        run_command(["python3", "/opt/pinpoint/scripts/pinpoint-update.py", "update"])
+        await run_lists_update()
         
         return {"status": "ok", "message": "Configuration imported successfully"}
     except Exception as e:
@@ -3295,21 +3592,19 @@ async def geoip_lookup(ip: str):
     """Lookup GeoIP for an IP address"""
     # Try using external service
     try:
-        import urllib.request
-        req = urllib.request.Request(
-            f"http://ip-api.com/json/{ip}",
-            headers={'User-Agent': 'PinPoint/1.0'}
+        response = await http_request(
+            "GET", f"http://ip-api.com/json/{ip}",
+            headers={'User-Agent': 'PinPoint/1.0'}, timeout=5
         )
-        with urllib.request.urlopen(req, timeout=5) as response:
-            data = json.loads(response.read().decode())
-            return {
-                "ip": ip,
-                "country": data.get("country"),
-                "country_code": data.get("countryCode"),
-                "city": data.get("city"),
-                "isp": data.get("isp"),
-                "org": data.get("org")
-            }
+        data = json_loads(response.content)
+        return {
+            "ip": ip,
+            "country": data.get("country"),
+            "country_code": data.get("countryCode"),
+            "city": data.get("city"),
+            "isp": data.get("isp"),
+            "org": data.get("org")
+        }
     except:
         return {"ip": ip, "error": "Lookup failed"}
 
@@ -3318,18 +3613,18 @@ async def get_connections_geoip():
     """Get connections with GeoIP data"""
     success, output = run_command(["conntrack", "-L"])
     
-    destinations = {}
+    destinations = Counter()
     if success:
         for line in output.split('\n'):
-            dst_match = re.search(r'dst=(\d+\.\d+\.\d+\.\d+)', line)
+            dst_match = _DST_RE.search(line)
             if dst_match:
                 ip = dst_match.group(1)
                 # Skip private IPs
-                if not ip.startswith(("10.", "172.", "192.168.", "127.")):
-                    destinations[ip] = destinations.get(ip, 0) + 1
+                if not ip.startswith(_PRIVATE_PREFIXES):
+                    destinations[ip] += 1
     
-    # Get top destinations
-    top_ips = sorted(destinations.items(), key=lambda x: x[1], reverse=True)[:20]
+    # Get top destinations (heap-based, no full sort)
+    top_ips = destinations.most_common(20)
     
     return {"destinations": [{"ip": ip, "count": count} for ip, count in top_ips]}
 
@@ -3370,8 +3665,6 @@ async def toggle_adblock(enabled: bool):
 @app.post("/api/adblock/update")
 async def update_adblock_lists():
     """Update ad blocking lists"""
-    import urllib.request
-    
     data = load_json(ADBLOCK_FILE)
     if not data.get("enabled"):
         return {"status": "disabled"}
@@ -3388,39 +3681,36 @@ async def update_adblock_lists():
         if not lst.get("enabled"):
             continue
         try:
-            req = urllib.request.Request(lst["url"], headers={'User-Agent': 'Pinpoint/1.0'})
-            with urllib.request.urlopen(req, timeout=30) as response:
-                content = response.read().decode('utf-8', errors='ignore')
+            content = await fetch_text(lst["url"], user_agent='Pinpoint/1.0', timeout=30, errors='ignore')
+            
+            for line in content.split('\n'):
+                line = line.strip()
                 
-                for line in content.split('\n'):
-                    line = line.strip()
-                    
-                    # Skip empty lines and comments
-                    if not line or line.startswith('#') or line.startswith('!') or line.startswith('['):
-                        continue
-                    
-                    # Parse hosts format: 0.0.0.0 domain.com or 127.0.0.1 domain.com
-                    if line.startswith(('0.0.0.0', '127.0.0.1')):
-                        parts = line.split()
-                        if len(parts) >= 2:
-                            domain = parts[1].lower().strip()
-                            # Validate domain format
-                            if domain and domain != 'localhost' and '.' in domain:
-                                if re.match(r'^[a-z0-9]([a-z0-9\-]*[a-z0-9])?(\.[a-z0-9]([a-z0-9\-]*[a-z0-9])?)+$', domain):
-                                    blocked_domains.add(domain)
-                    
-                    # Parse AdGuard/uBlock format: ||domain.com^
-                    elif line.startswith('||') and '^' in line:
-                        domain = line[2:].split('^')[0].lower().strip()
-                        if domain and '.' in domain and not domain.startswith('*'):
-                            if re.match(r'^[a-z0-9]([a-z0-9\-\.]*[a-z0-9])?$', domain):
+                # Skip empty lines and comments
+                if not line or line.startswith('#') or line.startswith('!') or line.startswith('['):
+                    continue
+                
+                # Parse hosts format: 0.0.0.0 domain.com or 127.0.0.1 domain.com
+                if line.startswith(('0.0.0.0', '127.0.0.1')):
+                    parts = line.split()
+                    if len(parts) >= 2:
+                        domain = parts[1].lower().strip()
+                        # Validate domain format
+                        if domain and domain != 'localhost' and '.' in domain:
+                            if _HOSTNAME_RE.match(domain):
                                 blocked_domains.add(domain)
+                
+                # Parse AdGuard/uBlock format: ||domain.com^
+                elif line.startswith('||') and '^' in line:
+                    domain = line[2:].split('^')[0].lower().strip()
+                    if domain and '.' in domain and not domain.startswith('*'):
+                        if _ABP_DOMAIN_RE.match(domain):
+                            blocked_domains.add(domain)
         except:
             pass
     
     # Filter and validate domains before writing
     valid_domains = set()
-    domain_pattern = re.compile(r'^[a-z0-9]([a-z0-9\-]*[a-z0-9])?(\.[a-z0-9]([a-z0-9\-]*[a-z0-9])?)+$')
     
     for domain in blocked_domains:
         domain = domain.lower().strip()
@@ -3431,7 +3721,7 @@ async def update_adblock_lists():
             continue
         if ' ' in domain or '/' in domain or '!' in domain or '@' in domain:
             continue
-        if not domain_pattern.match(domain):
+        if not _HOSTNAME_RE.match(domain):
             continue
         valid_domains.add(domain)
     
@@ -3483,8 +3773,6 @@ async def check_adblock_domain(domain: str):
 @app.get("/api/adblock/test-random")
 async def test_random_adblock():
     """Test a random domain from adblock list"""
-    import random
-    import socket
     
     adblock_conf = Path("/tmp/dnsmasq.d/adblock.conf")
     
@@ -3539,6 +3827,22 @@ async def test_random_adblock():
 # ============ Split DNS API ============
 
 SPLIT_DNS_FILE = DATA_DIR / "split_dns.json"
+# dnsmasq re-reads a servers-file on SIGHUP; the conf-dir snippet only points at it.
+# The servers-file lives in /var/run/dnsmasq, which is mounted into dnsmasq's ujail
+# (an arbitrary /tmp path is not readable there on OpenWrt 21.02+)
+SPLIT_DNS_CONF = Path("/tmp/dnsmasq.d/split-dns.conf")
+SPLIT_DNS_SERVERS = Path("/var/run/dnsmasq/pinpoint-split-dns.servers")
+
+def signal_dnsmasq_reload() -> bool:
+    """Send SIGHUP to running dnsmasq instances, return False if none was found"""
+    sent = False
+    for pid_file in Path("/var/run/dnsmasq").glob("dnsmasq*.pid"):
+        try:
+            os.kill(int(pid_file.read_text().strip()), signal.SIGHUP)
+            sent = True
+        except (OSError, ValueError):
+            continue
+    return sent
 
 @app.get("/api/split-dns")
 async def get_split_dns():
@@ -3550,21 +3854,27 @@ async def get_split_dns():
     }
 
 @app.post("/api/split-dns")
-async def set_split_dns(config: dict):
+async def set_split_dns(config: SplitDnsConfig):
     """Set split DNS configuration"""
-    save_json(SPLIT_DNS_FILE, config)
+    save_json(SPLIT_DNS_FILE, config.dict())
     
     # Apply to dnsmasq
-    if config.get("enabled"):
-        split_conf = Path("/tmp/dnsmasq.d/split-dns.conf")
-        with open(split_conf, 'w') as f:
-            f.write("# PinPoint Split DNS\n")
-            for rule in config.get("rules", []):
-                domain = rule.get("domain")
-                server = rule.get("server")
-                if domain and server:
-                    f.write(f"server=/{domain}/{server}\n")
-        
+    directive = f"servers-file={SPLIT_DNS_SERVERS}\n"
+    registered = SPLIT_DNS_CONF.exists() and SPLIT_DNS_CONF.read_text() == directive
+    if not config.enabled and not registered:
+        return {"status": "ok"}
+    
+    servers = []
+    if config.enabled:
+        servers = [f"server=/{rule.domain}/{rule.server}\n" for rule in config.rules if rule.domain and rule.server]
+    SPLIT_DNS_SERVERS.parent.mkdir(parents=True, exist_ok=True)
+    SPLIT_DNS_SERVERS.write_text("".join(servers))
+    
+    # Restart only when dnsmasq doesn't know about the servers-file yet, otherwise reload via SIGHUP
+    if not registered:
+        SPLIT_DNS_CONF.write_text(directive)
+        run_command(["/etc/init.d/dnsmasq", "restart"])
+    elif not signal_dnsmasq_reload():
         run_command(["/etc/init.d/dnsmasq", "restart"])
     
     return {"status": "ok"}
@@ -3589,18 +3899,12 @@ async def get_telegram_status():
     }
 
 @app.post("/api/telegram/configure")
-async def configure_telegram(config: dict):
+async def configure_telegram(config: TelegramConfig):
     """Configure Telegram bot"""
     data = load_json(TELEGRAM_FILE)
     
-    if "bot_token" in config:
-        data["bot_token"] = config["bot_token"]
-    if "chat_id" in config:
-        data["chat_id"] = config["chat_id"]
-    if "enabled" in config:
-        data["enabled"] = config["enabled"]
-    if "notifications" in config:
-        data["notifications"] = config["notifications"]
+    # Only fields present in the request are changed
+    data.update(config.dict(exclude_unset=True))
     
     save_json(TELEGRAM_FILE, data)
     return {"status": "ok"}
@@ -3617,16 +3921,16 @@ async def test_telegram():
         raise HTTPException(status_code=400, detail="Telegram not configured")
     
     try:
-        import urllib.request
         message = "🎯 PinPoint: Test message - connection successful!"
         url = f"https://api.telegram.org/bot{token}/sendMessage"
-        payload = json.dumps({"chat_id": chat_id, "text": message}).encode()
-        req = urllib.request.Request(url, data=payload, headers={'Content-Type': 'application/json'})
-        
-        with urllib.request.urlopen(req, timeout=10) as response:
-            result = json.loads(response.read().decode())
-            if result.get("ok"):
-                return {"status": "ok", "message": "Test message sent"}
+        payload = json_dumps({"chat_id": chat_id, "text": message})
+        response = await http_request(
+            "POST", url, content=payload,
+            headers={'Content-Type': 'application/json'}, timeout=10
+        )
+        result = json_loads(response.content)
+        if result.get("ok"):
+            return {"status": "ok", "message": "Test message sent"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -3641,10 +3945,10 @@ async def get_theme():
     return {"theme": data.get("theme", "light")}
 
 @app.post("/api/settings/theme")
-async def set_theme(config: dict):
+async def set_theme(config: ThemeSet):
     """Set UI theme"""
     data = load_json(SETTINGS_FILE)
-    data["theme"] = config.get("theme", "light")
+    data["theme"] = config.theme
     save_json(SETTINGS_FILE, data)
     return {"status": "ok", "theme": data["theme"]}
 
@@ -3656,6 +3960,8 @@ async def collect_traffic_now():
     stats = TrafficStats.get_instance()
     current = stats.collect()
     stats.save_history()
+    # Let the background loop restart its interval instead of collecting again
+    _wakeup.set()
     return {
         "status": "ok",
         "collected": current,
@@ -3666,6 +3972,9 @@ async def collect_traffic_now():
 
 _background_task_started = False
 
+# Set by manual endpoints to wake the background loop early
+_wakeup = asyncio.Event()
+
 async def background_health_check():
     """Background task to check health and collect stats every minute"""
     global _background_task_started
@@ -3688,10 +3997,15 @@ async def background_health_check():
     except Exception as e:
         print(f"[pinpoint] Initial collection error: {e}", flush=True)
     
-    last_subscription_check = 0
-    
     while True:
-        await asyncio.sleep(60)  # Wait 60 seconds
+        # Wait 60 seconds or until a manual trigger wakes us up
+        woken = False
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=60)
+            _wakeup.clear()
+            woken = True
+        except asyncio.TimeoutError:
+            pass
         
         try:
             # Check tunnel
@@ -3699,13 +4013,13 @@ async def background_health_check():
                 AlertManager.add_alert("critical", "VPN tunnel is down!", "tunnel")
             
             # Check sing-box
-            success, _ = run_command(["pgrep", "-f", "sing-box"])
-            if not success:
+            if not find_pids("sing-box"):
                 AlertManager.add_alert("critical", "sing-box process not running!", "sing_box")
             
-            # Collect traffic stats (stored in SQLite)
-            traffic_stats = TrafficStats.get_instance()
-            traffic_stats.collect()
+            # Collect traffic stats (stored in SQLite), unless just collected manually
+            if not woken:
+                traffic_stats = TrafficStats.get_instance()
+                traffic_stats.collect()
             
             # Collect system stats (stored in SQLite)
             try:
@@ -3714,87 +4028,135 @@ async def background_health_check():
             except Exception as e:
                 print(f"[pinpoint] SystemStats error: {e}", flush=True)
             
-            # Auto-update subscriptions (check every 5 minutes to save resources)
-            now = int(time.time())
-            if now - last_subscription_check >= 300:  # 5 minutes
-                last_subscription_check = now
-                await auto_update_subscriptions()
-            
         except Exception as e:
             print(f"[pinpoint] Background task error: {e}")
 
+async def _fetch_subscription_tunnels(sub: dict) -> List[Dict]:
+    """Fetch and parse a single subscription"""
+    return await fetch_subscription(sub["url"], sub.get("format", "auto"), user_agent="PinPoint/1.1")
+
 async def auto_update_subscriptions():
     """Check and update subscriptions that need auto-update"""
     try:
         subs = tunnel_mgr.load_subscriptions()
         now = int(time.time())
-        updated_count = 0
         
+        # Collect subscriptions whose update is due
+        due = []
         for sub in subs:
             # Skip if auto-update disabled
             if not sub.get("auto_update", False):
                 continue
             
-            # Check if update is due
             last_update = sub.get("last_update", 0)
-            interval_hours = sub.get("update_interval", 24)
-            interval_seconds = interval_hours * 3600
+            interval_seconds = sub.get("update_interval", 24) * 3600
+            if now - last_update >= interval_seconds:
+                due.append(sub)
+        
+        if not due:
+            return
+        
+        for sub in due:
+            print(f"[pinpoint] Auto-updating subscription: {sub.get('name')}", flush=True)
+        
+        # Fetch all due subscriptions concurrently
+        results = await asyncio.gather(
+            *(_fetch_subscription_tunnels(sub) for sub in due),
+            return_exceptions=True
+        )
+        
+        # Reload: subscriptions and tunnels may have been edited or deleted during the fetch
+        subs = tunnel_mgr.load_subscriptions()
+        live_subs = tunnel_mgr.subscription_index(subs)
+        tunnels = tunnel_mgr.load_tunnels()
+        updated_count = 0
+        
+        for due_sub, new_tunnels in zip(due, results):
+            sub = live_subs.get(due_sub["id"])
+            if sub is None:
+                continue
             
-            if now - last_update < interval_seconds:
+            if isinstance(new_tunnels, Exception):
+                print(f"[pinpoint] Failed to update subscription {sub.get('name')}: {new_tunnels}", flush=True)
                 continue
             
-            # Time to update this subscription
-            print(f"[pinpoint] Auto-updating subscription: {sub.get('name')}", flush=True)
+            if not new_tunnels:
+                print(f"[pinpoint] No tunnels found in subscription: {sub.get('name')}", flush=True)
+                continue
             
-            try:
-                # Fetch subscription content
-                import urllib.request
-                req = urllib.request.Request(
-                    sub["url"],
-                    headers={"User-Agent": "PinPoint/1.1"}
-                )
-                with urllib.request.urlopen(req, timeout=30) as response:
-                    content = response.read().decode('utf-8')
-                
-                # Parse new tunnels
-                new_tunnels = tunnel_mgr.parse_subscription_content(
-                    content, 
-                    sub.get("format", "auto")
-                )
-                
-                if not new_tunnels:
-                    print(f"[pinpoint] No tunnels found in subscription: {sub.get('name')}", flush=True)
-                    continue
-                
-                # Remove old tunnels from this subscription
-                tunnels = tunnel_mgr.load_tunnels()
-                tunnels = [t for t in tunnels if t.get("subscription_id") != sub["id"]]
-                
-                # Add new tunnels
-                for t in new_tunnels:
-                    t["source"] = "subscription"
-                    t["subscription_id"] = sub["id"]
-                tunnels.extend(new_tunnels)
-                tunnel_mgr.save_tunnels(tunnels)
-                
-                # Update subscription metadata
-                sub["last_update"] = now
-                sub["tunnels_count"] = len(new_tunnels)
-                
-                updated_count += 1
-                print(f"[pinpoint] Updated subscription: {sub.get('name')} ({len(new_tunnels)} tunnels)", flush=True)
-                
-            except Exception as e:
-                print(f"[pinpoint] Failed to update subscription {sub.get('name')}: {e}", flush=True)
+            # Replace old tunnels from this subscription
+            tunnels = [t for t in tunnels if t.get("subscription_id") != sub["id"]]
+            for t in new_tunnels:
+                t["source"] = "subscription"
+                t["subscription_id"] = sub["id"]
+            tunnels.extend(new_tunnels)
+            
+            # Update subscription metadata
+            sub["last_update"] = now
+            sub["tunnels_count"] = len(new_tunnels)
+            
+            updated_count += 1
+            print(f"[pinpoint] Updated subscription: {sub.get('name')} ({len(new_tunnels)} tunnels)", flush=True)
         
-        # Save updated subscriptions metadata
+        # Save updated tunnels and subscriptions metadata
         if updated_count > 0:
+            tunnel_mgr.save_tunnels(tunnels)
             tunnel_mgr.save_subscriptions(subs)
             print(f"[pinpoint] Auto-update complete: {updated_count} subscriptions updated", flush=True)
             
     except Exception as e:
         print(f"[pinpoint] Auto-update error: {e}", flush=True)
 
+# ============ Subscription Scheduler ============
+
+SUBSCRIPTION_RETRY_DELAY = 300  # Retry failed auto-updates after 5 minutes
+SUBSCRIPTION_MAX_SLEEP = 3600   # Re-read deadlines at least hourly (wall clock may jump)
+
+# Set when subscriptions are created/changed so the scheduler recomputes deadlines
+_subscriptions_changed = asyncio.Event()
+
+def _subscription_deadlines(retry_at: Dict[str, float]) -> List[tuple]:
+    """Heap of (next update time, subscription id) for auto-updating subscriptions"""
+    heap = []
+    for sub in tunnel_mgr.load_subscriptions():
+        if not sub.get("auto_update", False):
+            continue
+        due = sub.get("last_update", 0) + sub.get("update_interval", 24) * 3600
+        heap.append((max(due, retry_at.get(sub["id"], 0)), sub["id"]))
+    heapq.heapify(heap)
+    return heap
+
+async def subscription_scheduler():
+    """Auto-update subscriptions, sleeping until the nearest deadline instead of polling"""
+    retry_at: Dict[str, float] = {}
+    
+    while True:
+        try:
+            heap = _subscription_deadlines(retry_at)
+            now = time.time()
+            
+            if heap and heap[0][0] <= now:
+                await auto_update_subscriptions()
+                # Subscriptions that are still due failed to update - back off instead of spinning
+                now = time.time()
+                retry_at = {
+                    sub_id: now + SUBSCRIPTION_RETRY_DELAY
+                    for deadline, sub_id in _subscription_deadlines({})
+                    if deadline <= now
+                }
+                continue
+            
+            timeout = min(heap[0][0] - now, SUBSCRIPTION_MAX_SLEEP) if heap else SUBSCRIPTION_MAX_SLEEP
+        except Exception as e:
+            print(f"[pinpoint] Subscription scheduler error: {e}", flush=True)
+            timeout = SUBSCRIPTION_RETRY_DELAY
+        
+        try:
+            await asyncio.wait_for(_subscriptions_changed.wait(), timeout=timeout)
+            _subscriptions_changed.clear()
+        except asyncio.TimeoutError:
+            pass
+
 # Note: Background tasks are started in the lifespan handler above
 
 
@@ -3838,40 +4200,40 @@ async def create_tunnel(data: TunnelCreate):
 async def get_tunnel(tunnel_id: str):
     """Get tunnel by ID"""
     tunnels = tunnel_mgr.load_tunnels()
+    tunnel = tunnel_mgr.tunnel_index(tunnels).get(tunnel_id)
     
-    for tunnel in tunnels:
-        if tunnel["id"] == tunnel_id:
-            return tunnel
+    if not tunnel:
+        raise HTTPException(status_code=404, detail="Tunnel not found")
     
-    raise HTTPException(status_code=404, detail="Tunnel not found")
+    return tunnel
 
 
 @app.put("/api/tunnels/{tunnel_id}")
 async def update_tunnel(tunnel_id: str, data: TunnelUpdate):
     """Update tunnel"""
     tunnels = tunnel_mgr.load_tunnels()
+    tunnel = tunnel_mgr.tunnel_index(tunnels).get(tunnel_id)
     
-    for i, tunnel in enumerate(tunnels):
-        if tunnel["id"] == tunnel_id:
-            if data.name is not None:
-                tunnels[i]["name"] = data.name
-            if data.enabled is not None:
-                tunnels[i]["enabled"] = data.enabled
-            if data.server is not None:
-                tunnels[i]["server"] = data.server
-            if data.port is not None:
-                tunnels[i]["port"] = data.port
-            if data.settings is not None:
-                tunnels[i]["settings"] = data.settings
-            if data.tls is not None:
-                tunnels[i]["tls"] = data.tls
-            if data.transport is not None:
-                tunnels[i]["transport"] = data.transport
-            
-            tunnel_mgr.save_tunnels(tunnels)
-            return {"status": "ok", "tunnel": tunnels[i]}
+    if not tunnel:
+        raise HTTPException(status_code=404, detail="Tunnel not found")
+    
+    if data.name is not None:
+        tunnel["name"] = data.name
+    if data.enabled is not None:
+        tunnel["enabled"] = data.enabled
+    if data.server is not None:
+        tunnel["server"] = data.server
+    if data.port is not None:
+        tunnel["port"] = data.port
+    if data.settings is not None:
+        tunnel["settings"] = data.settings
+    if data.tls is not None:
+        tunnel["tls"] = data.tls
+    if data.transport is not None:
+        tunnel["transport"] = data.transport
     
-    raise HTTPException(status_code=404, detail="Tunnel not found")
+    tunnel_mgr.save_tunnels(tunnels)
+    return {"status": "ok", "tunnel": tunnel}
 
 
 @app.delete("/api/tunnels/{tunnel_id}")
@@ -3892,69 +4254,124 @@ async def delete_tunnel(tunnel_id: str):
     return {"status": "ok"}
 
 
+# Debounced sing-box apply: the restart happens once changes stop for SINGBOX_APPLY_DELAY
+SINGBOX_APPLY_DELAY = 0.25
+_singbox_apply_at = 0.0
+_singbox_apply_task: Optional[asyncio.Task] = None
+_singbox_apply_lock = asyncio.Lock()
+
+async def _singbox_apply_worker():
+    """Wait until no new changes arrive for the debounce delay, then apply config"""
+    global _singbox_apply_task
+    while True:
+        delay = _singbox_apply_at - time.monotonic()
+        if delay <= 0:
+            break
+        await asyncio.sleep(delay)
+    # Changes from now on schedule a new apply
+    _singbox_apply_task = None
+    
+    async with _singbox_apply_lock:
+        try:
+            active = load_json(SETTINGS_FILE).get("active_outbound", "direct")
+            config = tunnel_mgr.build_singbox_config(active)
+            await asyncio.to_thread(tunnel_mgr.apply_singbox_config, config)
+        except Exception as e:
+            print(f"Warning: Failed to apply config after toggle: {e}")
+
+def schedule_singbox_apply():
+    """Regenerate and apply sing-box config shortly, debouncing bursts of changes"""
+    global _singbox_apply_at, _singbox_apply_task
+    _singbox_apply_at = time.monotonic() + SINGBOX_APPLY_DELAY
+    if _singbox_apply_task is None:
+        _singbox_apply_task = asyncio.create_task(_singbox_apply_worker())
+
+
 @app.post("/api/tunnels/{tunnel_id}/toggle")
 async def toggle_tunnel(tunnel_id: str):
     """Toggle tunnel enabled state and regenerate config"""
     tunnels = tunnel_mgr.load_tunnels()
+    tunnel = tunnel_mgr.tunnel_index(tunnels).get(tunnel_id)
     
-    for tunnel in tunnels:
-        if tunnel["id"] == tunnel_id:
-            tunnel["enabled"] = not tunnel.get("enabled", True)
-            tunnel_mgr.save_tunnels(tunnels)
-            
-            # Regenerate and apply sing-box config
-            try:
-                groups = tunnel_mgr.load_groups()
-                routing_rules = tunnel_mgr.load_routing_rules()
-                settings = load_settings()
-                active = settings.get("active_outbound", "direct")
-                config = tunnel_mgr.generate_singbox_config(tunnels, groups, active, routing_rules)
-                tunnel_mgr.apply_singbox_config(config)
-            except Exception as e:
-                print(f"Warning: Failed to apply config after toggle: {e}")
-            
-            return {"status": "ok", "enabled": tunnel["enabled"]}
+    if not tunnel:
+        raise HTTPException(status_code=404, detail="Tunnel not found")
+    
+    tunnel["enabled"] = not tunnel.get("enabled", True)
+    tunnel_mgr.save_tunnels(tunnels)
+    
+    # Regenerate and apply sing-box config (rapid toggles collapse into one restart)
+    schedule_singbox_apply()
+    
+    return {"status": "ok", "enabled": tunnel["enabled"]}
+
+
+@app.post("/api/tunnels/test-all")
+async def test_all_tunnels():
+    """Test all enabled tunnels concurrently and save results once"""
+    tunnels = tunnel_mgr.load_tunnels()
+    targets = [t for t in tunnels if t.get("enabled", True)]
+    sem = asyncio.Semaphore(32)
+    
+    async def probe(tunnel):
+        async with sem:
+            return await tcp_probe(tunnel["server"], tunnel["port"])
     
-    raise HTTPException(status_code=404, detail="Tunnel not found")
+    latencies = await asyncio.gather(*[probe(t) for t in targets], return_exceptions=True)
+    
+    now = int(time.time())
+    results = []
+    checks = {}
+    for tunnel, latency in zip(targets, latencies):
+        reachable = not isinstance(latency, BaseException)
+        result = {"id": tunnel["id"], "latency": latency if reachable else None, "reachable": reachable}
+        if not reachable:
+            result["error"] = str(latency)
+        results.append(result)
+        checks[tunnel["id"]] = (result["latency"], now)
+    
+    # Reload: tunnels may have been edited or deleted while the probes ran
+    if checks:
+        tunnels = tunnel_mgr.load_tunnels()
+        for tunnel in tunnels:
+            check = checks.get(tunnel["id"])
+            if check is not None:
+                tunnel["latency"], tunnel["last_check"] = check
+        tunnel_mgr.save_tunnels(tunnels)
+    
+    return {
+        "status": "ok",
+        "tested": len(results),
+        "reachable": sum(1 for r in results if r["reachable"]),
+        "results": results
+    }
 
 
 @app.post("/api/tunnels/{tunnel_id}/test")
 async def test_tunnel(tunnel_id: str):
     """Test tunnel connection and measure latency"""
     tunnels = tunnel_mgr.load_tunnels()
-    
-    tunnel = None
-    for t in tunnels:
-        if t["id"] == tunnel_id:
-            tunnel = t
-            break
+    tunnel = tunnel_mgr.tunnel_index(tunnels).get(tunnel_id)
     
     if not tunnel:
         raise HTTPException(status_code=404, detail="Tunnel not found")
     
     # Simple TCP connection test
-    import socket
-    import time
-    
     try:
-        start = time.time()
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(5)
-        sock.connect((tunnel["server"], tunnel["port"]))
-        sock.close()
-        latency = int((time.time() - start) * 1000)
-        
-        # Update tunnel latency
-        tunnel["latency"] = latency
-        tunnel["last_check"] = int(time.time())
-        tunnel_mgr.save_tunnels(tunnels)
-        
-        return {"status": "ok", "latency": latency, "reachable": True}
+        latency = await tcp_probe(tunnel["server"], tunnel["port"])
+        result = {"status": "ok", "latency": latency, "reachable": True}
     except Exception as e:
-        tunnel["latency"] = None
+        latency = None
+        result = {"status": "error", "error": str(e), "reachable": False}
+    
+    # Reload after the probe so edits made meanwhile are not overwritten
+    tunnels = tunnel_mgr.load_tunnels()
+    tunnel = tunnel_mgr.tunnel_index(tunnels).get(tunnel_id)
+    if tunnel:
+        tunnel["latency"] = latency
         tunnel["last_check"] = int(time.time())
         tunnel_mgr.save_tunnels(tunnels)
-        return {"status": "error", "error": str(e), "reachable": False}
+    
+    return result
 
 
 @app.post("/api/tunnels/import")
@@ -4010,21 +4427,14 @@ async def get_subscriptions():
 @app.post("/api/subscriptions")
 async def create_subscription(data: SubscriptionCreate):
     """Add a new subscription"""
-    import urllib.request
-    
     subs = tunnel_mgr.load_subscriptions()
     
-    # Fetch subscription content
+    # Fetch and parse subscription content
     try:
-        req = urllib.request.Request(data.url, headers={'User-Agent': 'PinPoint/1.0'})
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            content = resp.read().decode('utf-8')
+        new_tunnels = await fetch_subscription(data.url, data.format)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to fetch subscription: {e}")
     
-    # Parse tunnels
-    new_tunnels = tunnel_mgr.parse_subscription_content(content, data.format)
-    
     if not new_tunnels:
         raise HTTPException(status_code=400, detail="No tunnels found in subscription")
     
@@ -4049,6 +4459,7 @@ async def create_subscription(data: SubscriptionCreate):
     # Save
     subs.append(subscription)
     tunnel_mgr.save_subscriptions(subs)
+    _subscriptions_changed.set()
     
     tunnels = tunnel_mgr.load_tunnels()
     tunnels.extend(new_tunnels)
@@ -4064,30 +4475,18 @@ async def create_subscription(data: SubscriptionCreate):
 @app.post("/api/subscriptions/{sub_id}/update")
 async def update_subscription_tunnels(sub_id: str):
     """Update subscription - fetch and sync tunnels"""
-    import urllib.request
-    
     subs = tunnel_mgr.load_subscriptions()
-    
-    sub = None
-    for s in subs:
-        if s["id"] == sub_id:
-            sub = s
-            break
+    sub = tunnel_mgr.subscription_index(subs).get(sub_id)
     
     if not sub:
         raise HTTPException(status_code=404, detail="Subscription not found")
     
-    # Fetch subscription content
+    # Fetch and parse subscription content
     try:
-        req = urllib.request.Request(sub["url"], headers={'User-Agent': 'PinPoint/1.0'})
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            content = resp.read().decode('utf-8')
+        new_tunnels = await fetch_subscription(sub["url"], sub.get("format", "auto"))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to fetch subscription: {e}")
     
-    # Parse tunnels
-    new_tunnels = tunnel_mgr.parse_subscription_content(content, sub.get("format", "auto"))
-    
     # Remove old tunnels from this subscription
     tunnels = tunnel_mgr.load_tunnels()
     tunnels = [t for t in tunnels if t.get("subscription_id") != sub_id]
@@ -4103,6 +4502,7 @@ async def update_subscription_tunnels(sub_id: str):
     sub["last_update"] = int(time.time())
     sub["tunnels_count"] = len(new_tunnels)
     tunnel_mgr.save_subscriptions(subs)
+    _subscriptions_changed.set()
     
     return {
         "status": "ok",
@@ -4114,35 +4514,40 @@ async def update_subscription_tunnels(sub_id: str):
 async def update_subscription(sub_id: str, data: SubscriptionUpdate):
     """Update subscription settings"""
     subs = tunnel_mgr.load_subscriptions()
+    sub = tunnel_mgr.subscription_index(subs).get(sub_id)
     
-    for sub in subs:
-        if sub["id"] == sub_id:
-            if data.name is not None:
-                sub["name"] = data.name
-            if data.url is not None:
-                sub["url"] = data.url
-            if data.auto_update is not None:
-                sub["auto_update"] = data.auto_update
-            if data.update_interval is not None:
-                sub["update_interval"] = data.update_interval
-            
-            tunnel_mgr.save_subscriptions(subs)
-            return {"status": "ok", "subscription": sub}
+    if not sub:
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    
+    if data.name is not None:
+        sub["name"] = data.name
+    if data.url is not None:
+        sub["url"] = data.url
+    if data.auto_update is not None:
+        sub["auto_update"] = data.auto_update
+    if data.update_interval is not None:
+        sub["update_interval"] = data.update_interval
     
-    raise HTTPException(status_code=404, detail="Subscription not found")
+    tunnel_mgr.save_subscriptions(subs)
+    _subscriptions_changed.set()
+    return {"status": "ok", "subscription": sub}
 
 
 @app.delete("/api/subscriptions/{sub_id}")
 async def delete_subscription(sub_id: str):
     """Delete subscription and its tunnels"""
     subs = tunnel_mgr.load_subscriptions()
-    subs = [s for s in subs if s["id"] != sub_id]
-    tunnel_mgr.save_subscriptions(subs)
+    sub = tunnel_mgr.subscription_index(subs).get(sub_id)
+    if sub:
+        subs.remove(sub)
+        tunnel_mgr.save_subscriptions(subs)
+        _subscriptions_changed.set()
     
-    # Remove tunnels from this subscription
+    # Remove tunnels from this subscription (single pass, write only if something changed)
     tunnels = tunnel_mgr.load_tunnels()
-    tunnels = [t for t in tunnels if t.get("subscription_id") != sub_id]
-    tunnel_mgr.save_tunnels(tunnels)
+    remaining = [t for t in tunnels if t.get("subscription_id") != sub_id]
+    if len(remaining) != len(tunnels):
+        tunnel_mgr.save_tunnels(remaining)
     
     return {"status": "ok"}
 
@@ -4181,23 +4586,23 @@ async def create_tunnel_group(data: TunnelGroupCreate):
 async def update_tunnel_group(group_id: str, data: TunnelGroupUpdate):
     """Update tunnel group"""
     groups = tunnel_mgr.load_groups()
+    group = tunnel_mgr.group_index(groups).get(group_id)
     
-    for group in groups:
-        if group["id"] == group_id:
-            if data.name is not None:
-                group["name"] = data.name
-                group["tag"] = f"group-{data.name.lower().replace(' ', '-')}"
-            if data.tunnels is not None:
-                group["tunnels"] = data.tunnels
-            if data.interval is not None:
-                group["interval"] = data.interval
-            if data.tolerance is not None:
-                group["tolerance"] = data.tolerance
-            
-            tunnel_mgr.save_groups(groups)
-            return {"status": "ok", "group": group}
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    if data.name is not None:
+        group["name"] = data.name
+        group["tag"] = f"group-{data.name.lower().replace(' ', '-')}"
+    if data.tunnels is not None:
+        group["tunnels"] = data.tunnels
+    if data.interval is not None:
+        group["interval"] = data.interval
+    if data.tolerance is not None:
+        group["tolerance"] = data.tolerance
     
-    raise HTTPException(status_code=404, detail="Group not found")
+    tunnel_mgr.save_groups(groups)
+    return {"status": "ok", "group": group}
 
 
 @app.delete("/api/tunnel-groups/{group_id}")
@@ -4243,24 +4648,24 @@ async def create_routing_rule(data: RoutingRuleCreate):
 async def update_routing_rule(rule_id: str, data: RoutingRuleUpdate):
     """Update a routing rule"""
     rules_data = tunnel_mgr.load_routing_rules()
+    rule = tunnel_mgr.rule_index(rules_data).get(rule_id)
     
-    for i, rule in enumerate(rules_data["rules"]):
-        if rule["id"] == rule_id:
-            if data.name is not None:
-                rules_data["rules"][i]["name"] = data.name
-            if data.outbound is not None:
-                rules_data["rules"][i]["outbound"] = data.outbound
-            if data.domains is not None:
-                rules_data["rules"][i]["domains"] = data.domains
-            if data.domain_keywords is not None:
-                rules_data["rules"][i]["domain_keywords"] = data.domain_keywords
-            if data.enabled is not None:
-                rules_data["rules"][i]["enabled"] = data.enabled
-            
-            tunnel_mgr.save_routing_rules(rules_data)
-            return {"status": "ok", "rule": rules_data["rules"][i]}
+    if not rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    
+    if data.name is not None:
+        rule["name"] = data.name
+    if data.outbound is not None:
+        rule["outbound"] = data.outbound
+    if data.domains is not None:
+        rule["domains"] = data.domains
+    if data.domain_keywords is not None:
+        rule["domain_keywords"] = data.domain_keywords
+    if data.enabled is not None:
+        rule["enabled"] = data.enabled
     
-    raise HTTPException(status_code=404, detail="Rule not found")
+    tunnel_mgr.save_routing_rules(rules_data)
+    return {"status": "ok", "rule": rule}
 
 
 @app.delete("/api/routing-rules/{rule_id}")
@@ -4268,12 +4673,11 @@ async def delete_routing_rule(rule_id: str):
     """Delete a routing rule"""
     rules_data = tunnel_mgr.load_routing_rules()
     
-    original_count = len(rules_data["rules"])
-    rules_data["rules"] = [r for r in rules_data["rules"] if r["id"] != rule_id]
-    
-    if len(rules_data["rules"]) == original_count:
+    if rule_id not in tunnel_mgr.rule_index(rules_data):
         raise HTTPException(status_code=404, detail="Rule not found")
     
+    rules_data["rules"] = [r for r in rules_data["rules"] if r["id"] != rule_id]
+    
     tunnel_mgr.save_routing_rules(rules_data)
     return {"status": "ok"}
 
@@ -4282,14 +4686,14 @@ async def delete_routing_rule(rule_id: str):
 async def toggle_routing_rule(rule_id: str):
     """Toggle routing rule enabled state"""
     rules_data = tunnel_mgr.load_routing_rules()
+    rule = tunnel_mgr.rule_index(rules_data).get(rule_id)
     
-    for rule in rules_data["rules"]:
-        if rule["id"] == rule_id:
-            rule["enabled"] = not rule.get("enabled", True)
-            tunnel_mgr.save_routing_rules(rules_data)
-            return {"status": "ok", "enabled": rule["enabled"]}
+    if not rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
     
-    raise HTTPException(status_code=404, detail="Rule not found")
+    rule["enabled"] = not rule.get("enabled", True)
+    tunnel_mgr.save_routing_rules(rules_data)
+    return {"status": "ok", "enabled": rule["enabled"]}
 
 
 @app.post("/api/routing-rules/set-default")
@@ -4335,19 +4739,15 @@ async def reorder_routing_rules(rule_ids: List[str]):
     """Reorder routing rules (first rule has highest priority)"""
     rules_data = tunnel_mgr.load_routing_rules()
     
-    # Create a map of existing rules
-    rules_map = {r["id"]: r for r in rules_data["rules"]}
+    # Map of existing rules
+    rules_map = tunnel_mgr.rule_index(rules_data)
     
     # Reorder based on provided IDs
-    new_rules = []
-    for rule_id in rule_ids:
-        if rule_id in rules_map:
-            new_rules.append(rules_map[rule_id])
+    new_rules = [rules_map[rule_id] for rule_id in rule_ids if rule_id in rules_map]
     
     # Add any rules not in the provided list at the end
-    for rule in rules_data["rules"]:
-        if rule["id"] not in rule_ids:
-            new_rules.append(rule)
+    ordered_ids = set(rule_ids)
+    new_rules.extend(rule for rule in rules_data["rules"] if rule["id"] not in ordered_ids)
     
     rules_data["rules"] = new_rules
     tunnel_mgr.save_routing_rules(rules_data)
@@ -4362,9 +4762,8 @@ async def get_singbox_config():
     """Get current sing-box configuration"""
     if tunnel_mgr.SINGBOX_CONFIG.exists():
         try:
-            with open(tunnel_mgr.SINGBOX_CONFIG) as f:
-                return json.load(f)
-        except:
+            return json_loads(tunnel_mgr.SINGBOX_CONFIG.read_bytes())
+        except (OSError, ValueError):
             pass
     return {}
 
@@ -4372,15 +4771,11 @@ async def get_singbox_config():
 @app.post("/api/singbox/generate")
 async def generate_singbox_config():
     """Generate sing-box config from tunnels, groups, and routing rules"""
-    tunnels = tunnel_mgr.load_tunnels()
-    groups = tunnel_mgr.load_groups()
-    routing_rules = tunnel_mgr.load_routing_rules()
-    
     # Get active outbound from settings
     settings = load_json(SETTINGS_FILE)
     active = settings.get("active_outbound")
     
-    config = tunnel_mgr.generate_singbox_config(tunnels, groups, active, routing_rules)
+    config = tunnel_mgr.build_singbox_config(active)
     
     return {"status": "ok", "config": config}
 
@@ -4388,14 +4783,10 @@ async def generate_singbox_config():
 @app.post("/api/singbox/apply")
 async def apply_singbox_config():
     """Generate and apply sing-box config"""
-    tunnels = tunnel_mgr.load_tunnels()
-    groups = tunnel_mgr.load_groups()
-    routing_rules = tunnel_mgr.load_routing_rules()
-    
     settings = load_json(SETTINGS_FILE)
     active = settings.get("active_outbound")
     
-    config = tunnel_mgr.generate_singbox_config(tunnels, groups, active, routing_rules)
+    config = tunnel_mgr.build_singbox_config(active)
     success = tunnel_mgr.apply_singbox_config(config)
     
     if success:
@@ -4420,29 +4811,30 @@ async def get_available_outbounds():
     tunnels = tunnel_mgr.load_tunnels()
     groups = tunnel_mgr.load_groups()
     
-    outbounds = []
-    
     # Add enabled tunnels
-    for t in tunnels:
-        if t.get("enabled"):
-            outbounds.append({
-                "tag": f"{t['type']}-{t['id']}",
-                "name": t["name"],
-                "type": "tunnel",
-                "tunnel_type": t["type"],
-                "server": t["server"],
-                "latency": t.get("latency")
-            })
+    outbounds = [
+        {
+            "tag": f"{t['type']}-{t['id']}",
+            "name": t["name"],
+            "type": "tunnel",
+            "tunnel_type": t["type"],
+            "server": t["server"],
+            "latency": t.get("latency")
+        }
+        for t in tunnel_mgr.enabled_tunnels(tunnels)
+    ]
     
     # Add groups
-    for g in groups:
-        outbounds.append({
+    outbounds.extend(
+        {
             "tag": g.get("tag", f"group-{g['id']}"),
             "name": g["name"],
             "type": "group",
             "group_type": g["type"],
             "tunnels_count": len(g.get("tunnels", []))
-        })
+        }
+        for g in groups
+    )
     
     # Get current active
     settings = load_json(SETTINGS_FILE)
@@ -4455,20 +4847,49 @@ async def get_available_outbounds():
 
 
 # Serve frontend
+# path -> ((st_mtime_ns, st_size), content, etag); re-read only when the file changes
+_page_cache: Dict[Path, tuple] = {}
+
+def _load_page(path: Path) -> Optional[tuple]:
+    """Return (content, ETag) for an HTML page, re-reading it only after a frontend update"""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _page_cache.get(path)
+    if cached is None or cached[0] != key:
+        try:
+            content = path.read_bytes()
+        except OSError:
+            return None
+        cached = (key, content, '"' + hashlib.sha256(content).hexdigest()[:16] + '"')
+        _page_cache[path] = cached
+    return cached[1], cached[2]
+
+def page_response(page: tuple, request: Request) -> Response:
+    """Serve a cached page, answering 304 when the browser already has it"""
+    content, etag = page
+    # no-cache: browser revalidates every time, so updates show up immediately
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="text/html", headers=headers)
+
 @app.get("/")
-async def serve_index():
+async def serve_index(request: Request):
     """Serve frontend index.html"""
-    index_path = FRONTEND_DIR / "index.html"
-    if index_path.exists():
-        return FileResponse(index_path)
+    page = _load_page(FRONTEND_DIR / "index.html")
+    if page:
+        return page_response(page, request)
     return {"message": "PinPoint API", "docs": "/docs"}
 
 @app.get("/login.html")
-async def serve_login():
+async def serve_login(request: Request):
     """Serve login page"""
-    login_path = FRONTEND_DIR / "login.html"
-    if login_path.exists():
-        return FileResponse(login_path)
+    page = _load_page(FRONTEND_DIR / "login.html")
+    if page:
+        return page_response(page, request)
     return RedirectResponse(url="/")
 
 # Mount static files if frontend exists
@@ -3,17 +3,47 @@ PinPoint - Tunnel Management Module
 Handles parsing, storage, and configuration of sing-box tunnels
 """
 
+import hashlib
+import io
 import json
+import os
 import base64
+import shutil
+import subprocess
 import re
-import uuid
 import time
 import urllib.parse
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Optional, List, Dict, Any
 from dataclasses import dataclass, asdict
 from enum import Enum
 
+# orjson is optional (no prebuilt wheels for MIPS) - fall back to stdlib json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# pybase64 (SIMD decoder, same API) is optional - fall back to stdlib base64
+try:
+    import pybase64 as b64
+except ImportError:
+    b64 = base64
+
+# ijson (streaming JSON, pure-Python backend available) is optional - fall back to a full parse
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# PyYAML is only needed for Clash subscriptions; prefer LibYAML's C loader when built with it
+try:
+    import yaml
+    _YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+except ImportError:
+    yaml = None
+
 
 class TunnelType(str, Enum):
     VLESS = "vless"
@@ -37,84 +67,375 @@ GROUPS_FILE = DATA_DIR / "tunnel_groups.json"
 ROUTING_RULES_FILE = DATA_DIR / "routing_rules.json"
 SINGBOX_CONFIG = Path("/etc/sing-box/config.json")
 SINGBOX_BACKUP = DATA_DIR / "singbox_config_backup.json"
+SINGBOX_BIN = "/usr/bin/sing-box"
+SINGBOX_INIT = Path("/etc/init.d/sing-box")
+# Same deprecated-feature switches the init script runs sing-box with
+SINGBOX_ENV = {"ENABLE_DEPRECATED_TUN_ADDRESS_X": "true", "ENABLE_DEPRECATED_SPECIAL_OUTBOUNDS": "true"}
+RULE_SET_DIR = DATA_DIR / "rulesets"
+
+
+# ============ Share Link Helpers ============
+
+# base64 '=' padding indexed by len(data) & 3
+_PAD = ('', '===', '==', '=')
+
+
+def _new_tunnel(tunnel_type: Optional[TunnelType], name: str, server: str, port: int,
+                source: TunnelSource = TunnelSource.IMPORT, settings: Dict = None,
+                tls: Dict = None, transport: Dict = None) -> Dict:
+    """Build a tunnel record with the common fields shared by all parsers"""
+    return {
+        "id": generate_id(),
+        "name": name,
+        "type": tunnel_type,
+        "enabled": True,
+        "server": server,
+        "port": port,
+        "source": source,
+        "subscription_id": None,
+        "latency": None,
+        "last_check": None,
+        "settings": settings if settings is not None else {},
+        "tls": tls if tls is not None else {},
+        "transport": transport if transport is not None else {}
+    }
+
+
+# What malformed share links raise: bad ints/base64/UTF-8/JSON and failed
+# unpacking are ValueError; the rest cover JSON of the wrong shape
+_LINK_ERRORS = (ValueError, TypeError, AttributeError)
+
+
+def _split_share_link(content: str, default_name: str, last_at: bool = True) -> tuple:
+    """Split 'userinfo@host:port?query#name' by index scans, without intermediate lists
+    
+    Returns (userinfo or None, host_port, params, name).
+    """
+    end = content.rfind('#')
+    if end >= 0:
+        name = urllib.parse.unquote(content[end + 1:])
+    else:
+        name = default_name
+        end = len(content)
+    
+    params = {}
+    query = content.find('?', 0, end)
+    if query >= 0:
+        params = _parse_query(content[query + 1:end])
+        end = query
+    
+    at = content.rfind('@', 0, end) if last_at else content.find('@', 0, end)
+    if at < 0:
+        return None, content[:end], params, name
+    return content[:at], content[at + 1:end], params, name
+
+
+def _split_host_port(server_port: str) -> Optional[tuple]:
+    """Split 'host:port' or '[ipv6]:port' into (host, port string)"""
+    if server_port.startswith('['):
+        # Port is the digit run after ']:' - anything after it (e.g. a '/' before the query) is ignored
+        close = server_port.find(']')
+        if close < 2 or server_port[close + 1:close + 2] != ':':
+            return None
+        start = end = close + 2
+        while end < len(server_port) and server_port[end].isdigit():
+            end += 1
+        if end == start:
+            return None
+        return server_port[1:close], server_port[start:end]
+    
+    colon = server_port.rfind(':')
+    if colon < 0:
+        return None
+    return server_port[:colon], server_port[colon + 1:]
+
+
+def _ws_transport(params: Dict, server: str) -> Dict:
+    return {"type": "ws", "path": params.get("path", "/"), "host": params.get("host", server)}
+
+
+def _grpc_transport(params: Dict, server: str) -> Dict:
+    return {"type": "grpc", "service_name": params.get("serviceName", "")}
+
+
+def _tcp_transport(params: Dict, server: str) -> Dict:
+    return {"type": "tcp"}
+
+
+# Transport from share link query params (?type=...), unknown types fall back to tcp
+_LINK_TRANSPORTS = {
+    "ws": _ws_transport,
+    "grpc": _grpc_transport,
+    "tcp": _tcp_transport,
+}
+
+
+def _parse_query(query: str) -> Dict[str, str]:
+    """Parse share link query string, same result as dict(urllib.parse.parse_qsl(query))
+    
+    Most link parameters are plain ASCII, so values are only unquoted when
+    they actually contain escapes - this runs once per link on subscription import.
+    """
+    params = {}
+    for pair in query.split('&'):
+        key, _, value = pair.partition('=')
+        if not value:
+            continue
+        if '+' in key or '%' in key:
+            key = urllib.parse.unquote_plus(key)
+        if '+' in value or '%' in value:
+            value = urllib.parse.unquote_plus(value)
+        params[key] = value
+    return params
 
 
 # ============ Data Models ============
 
 def generate_id() -> str:
-    return str(uuid.uuid4())[:8]
+    return os.urandom(4).hex()
 
 
-def load_tunnels() -> List[Dict]:
-    """Load tunnels from storage"""
-    if TUNNELS_FILE.exists():
+def _json_loads(data):
+    """Parse JSON from str/bytes using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(data) -> bytes:
+    """Serialize to indented UTF-8 JSON bytes using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+
+def _json_dumps_compact(data) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode('utf-8')
+
+
+def _write_json_stream(f, value, depth: int):
+    """Write value as compact JSON, descending `depth` container levels
+    
+    Large arrays (outbounds, route rules) are serialized one item at a time
+    instead of building the whole document as a single string first.
+    """
+    if depth and isinstance(value, dict):
+        f.write(b"{")
+        for i, (key, item) in enumerate(value.items()):
+            if i:
+                f.write(b",")
+            f.write(_json_dumps_compact(str(key)))
+            f.write(b":")
+            _write_json_stream(f, item, depth - 1)
+        f.write(b"}")
+    elif depth and isinstance(value, list):
+        f.write(b"[")
+        for i, item in enumerate(value):
+            if i:
+                f.write(b",")
+            _write_json_stream(f, item, depth - 1)
+        f.write(b"]")
+    else:
+        f.write(_json_dumps_compact(value))
+
+
+@contextmanager
+def _atomic_open(path: Path, buffering: int = -1):
+    """Open a tmp file for writing that replaces path on success, so a crash never leaves a truncated file"""
+    tmp = path.with_name(f"{path.name}.tmp.{os.getpid()}")
+    try:
+        with open(tmp, 'wb', buffering=buffering) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
         try:
-            with open(TUNNELS_FILE) as f:
-                return json.load(f)
-        except:
+            tmp.unlink()
+        except OSError:
             pass
-    return []
+        raise
+
+
+def _atomic_write(path: Path, data: bytes):
+    """Write file via tmp + rename"""
+    with _atomic_open(path) as f:
+        f.write(data)
+
+
+# Parsed JSON cache: path -> [(st_mtime_ns, st_size), data, id_index, derived]
+# id_index and derived are (source list, value) pairs, rebuilt when the source list object changes
+# (derived: enabled tunnels for tunnels.json, rule matchers for routing_rules.json)
+_json_cache: Dict[Path, list] = {}
+# Bumped by every save, so results derived from several files notice our own writes
+# even when mtime granularity hides them
+_write_generation = 0
+
+
+def _file_key(path: Path) -> tuple:
+    st = path.stat()
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _load_json_cached(path: Path, default):
+    """Load JSON file, reusing the parsed object while the file is unchanged"""
+    try:
+        key = _file_key(path)
+    except OSError:
+        return default()
+    
+    cached = _json_cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    
+    try:
+        data = _json_loads(path.read_bytes())
+    except Exception:
+        return default()
+    
+    _json_cache[path] = [key, data, None, None]
+    return data
+
+
+def _index_by_id(path: Path, owner, items: List[Dict]) -> Dict[str, Dict]:
+    """Map id -> item, memoized alongside the cached file contents"""
+    cached = _json_cache.get(path)
+    if cached is None or cached[1] is not owner:
+        return {item["id"]: item for item in items}
+    
+    if cached[2] is None or cached[2][0] is not items:
+        cached[2] = (items, {item["id"]: item for item in items})
+    return cached[2][1]
+
+
+def _save_json_cached(path: Path, data):
+    """Save JSON file and drop its cache entry (next load re-parses from disk)"""
+    global _write_generation
+    # Dropped before writing so an edited-but-unsaved object never stays cached
+    # (not caching `data` itself: freshly parsed tunnels still hold Enum members)
+    _json_cache.pop(path, None)
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        _atomic_write(path, _json_dumps(data))
+    finally:
+        _write_generation += 1
+
+
+def _default_routing_rules() -> Dict:
+    return {"default_outbound": None, "rules": []}
+
+
+def load_tunnels() -> List[Dict]:
+    """Load tunnels from storage"""
+    return _load_json_cached(TUNNELS_FILE, list)
 
 
 def save_tunnels(tunnels: List[Dict]):
     """Save tunnels to storage"""
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    with open(TUNNELS_FILE, 'w') as f:
-        json.dump(tunnels, f, indent=2, ensure_ascii=False)
+    _save_json_cached(TUNNELS_FILE, tunnels)
 
 
 def load_subscriptions() -> List[Dict]:
     """Load subscriptions from storage"""
-    if SUBSCRIPTIONS_FILE.exists():
-        try:
-            with open(SUBSCRIPTIONS_FILE) as f:
-                return json.load(f)
-        except:
-            pass
-    return []
+    return _load_json_cached(SUBSCRIPTIONS_FILE, list)
 
 
 def save_subscriptions(subs: List[Dict]):
     """Save subscriptions to storage"""
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    with open(SUBSCRIPTIONS_FILE, 'w') as f:
-        json.dump(subs, f, indent=2, ensure_ascii=False)
+    _save_json_cached(SUBSCRIPTIONS_FILE, subs)
 
 
 def load_groups() -> List[Dict]:
     """Load tunnel groups from storage"""
-    if GROUPS_FILE.exists():
-        try:
-            with open(GROUPS_FILE) as f:
-                return json.load(f)
-        except:
-            pass
-    return []
+    return _load_json_cached(GROUPS_FILE, list)
 
 
 def save_groups(groups: List[Dict]):
     """Save tunnel groups to storage"""
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    with open(GROUPS_FILE, 'w') as f:
-        json.dump(groups, f, indent=2, ensure_ascii=False)
+    _save_json_cached(GROUPS_FILE, groups)
 
 
 def load_routing_rules() -> Dict:
     """Load routing rules from storage"""
-    if ROUTING_RULES_FILE.exists():
-        try:
-            with open(ROUTING_RULES_FILE) as f:
-                return json.load(f)
-        except:
-            pass
-    return {"default_outbound": None, "rules": []}
+    return _load_json_cached(ROUTING_RULES_FILE, _default_routing_rules)
 
 
 def save_routing_rules(rules: Dict):
     """Save routing rules to storage"""
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    with open(ROUTING_RULES_FILE, 'w') as f:
-        json.dump(rules, f, indent=2, ensure_ascii=False)
+    _save_json_cached(ROUTING_RULES_FILE, rules)
+
+
+def tunnel_index(tunnels: List[Dict]) -> Dict[str, Dict]:
+    """id -> tunnel lookup for a list returned by load_tunnels()"""
+    return _index_by_id(TUNNELS_FILE, tunnels, tunnels)
+
+
+def enabled_tunnels(tunnels: List[Dict]) -> List[Dict]:
+    """Enabled subset of a list returned by load_tunnels(), memoized while the file is unchanged"""
+    cached = _json_cache.get(TUNNELS_FILE)
+    if cached is None or cached[1] is not tunnels:
+        return [t for t in tunnels if t.get("enabled")]
+    
+    if cached[3] is None or cached[3][0] is not tunnels:
+        cached[3] = (tunnels, [t for t in tunnels if t.get("enabled")])
+    return cached[3][1]
+
+
+def subscription_index(subs: List[Dict]) -> Dict[str, Dict]:
+    """id -> subscription lookup for a list returned by load_subscriptions()"""
+    return _index_by_id(SUBSCRIPTIONS_FILE, subs, subs)
+
+
+def group_index(groups: List[Dict]) -> Dict[str, Dict]:
+    """id -> group lookup for a list returned by load_groups()"""
+    return _index_by_id(GROUPS_FILE, groups, groups)
+
+
+def rule_index(rules_data: Dict) -> Dict[str, Dict]:
+    """id -> rule lookup for data returned by load_routing_rules()"""
+    return _index_by_id(ROUTING_RULES_FILE, rules_data, rules_data["rules"])
+
+
+def _rule_matchers(rule: Dict) -> Dict[str, List[str]]:
+    """Classify a rule's domains into sing-box domain/domain_suffix/domain_keyword lists"""
+    domains = []
+    domain_suffixes = []
+    for d in rule.get("domains") or ():
+        d = d.strip().lower()
+        if d.startswith("*."):
+            domain_suffixes.append(d[2:])
+        elif d.startswith("."):
+            domain_suffixes.append(d[1:])
+        else:
+            domains.append(d)
+    
+    matchers = {}
+    if domains:
+        matchers["domain"] = domains
+    if domain_suffixes:
+        matchers["domain_suffix"] = compress_suffixes(domain_suffixes)
+    if rule.get("domain_keywords"):
+        matchers["domain_keyword"] = rule["domain_keywords"]
+    return matchers
+
+
+def routing_rule_matchers(rules_data: Dict) -> List[Dict[str, List[str]]]:
+    """Per-rule sing-box matchers for data returned by load_routing_rules()
+    
+    Memoized while routing_rules.json is unchanged, so tunnel or group
+    edits that regenerate the config do not re-classify every domain.
+    """
+    rules = rules_data.get("rules") or []
+    cached = _json_cache.get(ROUTING_RULES_FILE)
+    if cached is None or cached[1] is not rules_data:
+        return [_rule_matchers(rule) for rule in rules]
+    
+    if cached[3] is None or cached[3][0] is not rules:
+        cached[3] = (rules, [_rule_matchers(rule) for rule in rules])
+    return cached[3][1]
 
 
 # ============ Link Parsers ============
@@ -128,60 +449,24 @@ def parse_vless_link(link: str) -> Optional[Dict]:
         return None
     
     try:
-        # Remove prefix
-        content = link[8:]
-        
-        # Split name (fragment)
-        if '#' in content:
-            content, name = content.rsplit('#', 1)
-            name = urllib.parse.unquote(name)
-        else:
-            name = "VLESS Server"
-        
-        # Split params
-        params = {}
-        if '?' in content:
-            content, query = content.split('?', 1)
-            params = dict(urllib.parse.parse_qsl(query))
-        
-        # Parse uuid@server:port
-        if '@' not in content:
+        # Parse uuid@server:port?params#name
+        user_uuid, server_port, params, name = _split_share_link(link[8:], "VLESS Server", last_at=False)
+        if user_uuid is None:
             return None
         
-        user_uuid, server_port = content.split('@', 1)
-        
-        # Handle IPv6
-        if server_port.startswith('['):
-            match = re.match(r'\[([^\]]+)\]:(\d+)', server_port)
-            if match:
-                server, port = match.groups()
-            else:
-                return None
-        else:
-            if ':' in server_port:
-                server, port = server_port.rsplit(':', 1)
-            else:
-                return None
+        host_port = _split_host_port(server_port)
+        if host_port is None:
+            return None
+        server, port = host_port
         
-        tunnel = {
-            "id": generate_id(),
-            "name": name,
-            "type": TunnelType.VLESS,
-            "enabled": True,
-            "server": server,
-            "port": int(port),
-            "source": TunnelSource.IMPORT,
-            "subscription_id": None,
-            "latency": None,
-            "last_check": None,
-            "settings": {
+        tunnel = _new_tunnel(
+            TunnelType.VLESS, name, server, int(port),
+            settings={
                 "uuid": user_uuid,
                 "flow": params.get("flow", ""),
                 "encryption": params.get("encryption", "none"),
-            },
-            "tls": {},
-            "transport": {}
-        }
+            }
+        )
         
         # TLS settings
         security = params.get("security", "none")
@@ -204,24 +489,12 @@ def parse_vless_link(link: str) -> Optional[Dict]:
             }
         
         # Transport settings
-        transport_type = params.get("type", "tcp")
-        if transport_type == "ws":
-            tunnel["transport"] = {
-                "type": "ws",
-                "path": params.get("path", "/"),
-                "host": params.get("host", server)
-            }
-        elif transport_type == "grpc":
-            tunnel["transport"] = {
-                "type": "grpc",
-                "service_name": params.get("serviceName", "")
-            }
-        elif transport_type == "tcp":
-            tunnel["transport"] = {"type": "tcp"}
+        build = _LINK_TRANSPORTS.get(params.get("type", "tcp"), _tcp_transport)
+        tunnel["transport"] = build(params, server)
         
         return tunnel
         
-    except Exception as e:
+    except _LINK_ERRORS as e:
         print(f"Error parsing VLESS link: {e}")
         return None
 
@@ -238,32 +511,19 @@ def parse_vmess_link(link: str) -> Optional[Dict]:
         # Decode base64 content
         content = link[8:]
         # Add padding if needed
-        padding = 4 - len(content) % 4
-        if padding != 4:
-            content += '=' * padding
+        content += _PAD[len(content) & 3]
         
-        decoded = base64.b64decode(content).decode('utf-8')
-        data = json.loads(decoded)
+        decoded = b64.b64decode(content).decode('utf-8')
+        data = _json_loads(decoded)
         
-        tunnel = {
-            "id": generate_id(),
-            "name": data.get("ps", "VMess Server"),
-            "type": TunnelType.VMESS,
-            "enabled": True,
-            "server": data.get("add", ""),
-            "port": int(data.get("port", 443)),
-            "source": TunnelSource.IMPORT,
-            "subscription_id": None,
-            "latency": None,
-            "last_check": None,
-            "settings": {
+        tunnel = _new_tunnel(
+            TunnelType.VMESS, data.get("ps", "VMess Server"), data.get("add", ""), int(data.get("port", 443)),
+            settings={
                 "uuid": data.get("id", ""),
                 "alter_id": int(data.get("aid", 0)),
                 "security": data.get("scy", "auto")
-            },
-            "tls": {},
-            "transport": {}
-        }
+            }
+        )
         
         # TLS
         if data.get("tls") == "tls":
@@ -298,7 +558,7 @@ def parse_vmess_link(link: str) -> Optional[Dict]:
         
         return tunnel
         
-    except Exception as e:
+    except _LINK_ERRORS as e:
         print(f"Error parsing VMess link: {e}")
         return None
 
@@ -327,57 +587,38 @@ def parse_ss_link(link: str) -> Optional[Dict]:
             
             # Decode user info
             try:
-                padding = 4 - len(user_info) % 4
-                if padding != 4:
-                    user_info += '=' * padding
-                decoded = base64.urlsafe_b64decode(user_info).decode('utf-8')
+                user_info += _PAD[len(user_info) & 3]
+                decoded = b64.urlsafe_b64decode(user_info).decode('utf-8')
                 method, password = decoded.split(':', 1)
-            except:
+            except ValueError:
                 # Already decoded
                 method, password = user_info.split(':', 1)
             
             # Parse server:port
-            if server_port.startswith('['):
-                match = re.match(r'\[([^\]]+)\]:(\d+)', server_port)
-                if match:
-                    server, port = match.groups()
-                else:
-                    return None
-            else:
-                server, port = server_port.rsplit(':', 1)
+            host_port = _split_host_port(server_port)
+            if host_port is None:
+                return None
+            server, port = host_port
         else:
             # Legacy format: base64(method:password@server:port)
-            padding = 4 - len(content) % 4
-            if padding != 4:
-                content += '=' * padding
-            decoded = base64.urlsafe_b64decode(content).decode('utf-8')
+            content += _PAD[len(content) & 3]
+            decoded = b64.urlsafe_b64decode(content).decode('utf-8')
             
             method_pass, server_port = decoded.rsplit('@', 1)
             method, password = method_pass.split(':', 1)
             server, port = server_port.rsplit(':', 1)
         
-        tunnel = {
-            "id": generate_id(),
-            "name": name,
-            "type": TunnelType.SHADOWSOCKS,
-            "enabled": True,
-            "server": server,
-            "port": int(port),
-            "source": TunnelSource.IMPORT,
-            "subscription_id": None,
-            "latency": None,
-            "last_check": None,
-            "settings": {
+        tunnel = _new_tunnel(
+            TunnelType.SHADOWSOCKS, name, server, int(port),
+            settings={
                 "method": method,
                 "password": password
-            },
-            "tls": {},
-            "transport": {}
-        }
+            }
+        )
         
         return tunnel
         
-    except Exception as e:
+    except _LINK_ERRORS as e:
         print(f"Error parsing Shadowsocks link: {e}")
         return None
 
@@ -391,75 +632,36 @@ def parse_trojan_link(link: str) -> Optional[Dict]:
         return None
     
     try:
-        content = link[9:]
-        
-        # Extract name
-        name = "Trojan Server"
-        if '#' in content:
-            content, name = content.rsplit('#', 1)
-            name = urllib.parse.unquote(name)
-        
-        # Extract params
-        params = {}
-        if '?' in content:
-            content, query = content.split('?', 1)
-            params = dict(urllib.parse.parse_qsl(query))
-        
-        # Parse password@server:port
-        password, server_port = content.rsplit('@', 1)
+        # Parse password@server:port?params#name
+        password, server_port, params, name = _split_share_link(link[9:], "Trojan Server")
+        if password is None:
+            return None
         
-        # Handle IPv6
-        if server_port.startswith('['):
-            match = re.match(r'\[([^\]]+)\]:(\d+)', server_port)
-            if match:
-                server, port = match.groups()
-            else:
-                return None
-        else:
-            server, port = server_port.rsplit(':', 1)
+        host_port = _split_host_port(server_port)
+        if host_port is None:
+            return None
+        server, port = host_port
         
-        tunnel = {
-            "id": generate_id(),
-            "name": name,
-            "type": TunnelType.TROJAN,
-            "enabled": True,
-            "server": server,
-            "port": int(port),
-            "source": TunnelSource.IMPORT,
-            "subscription_id": None,
-            "latency": None,
-            "last_check": None,
-            "settings": {
+        tunnel = _new_tunnel(
+            TunnelType.TROJAN, name, server, int(port),
+            settings={
                 "password": password
             },
-            "tls": {
+            tls={
                 "enabled": True,
                 "type": "tls",
                 "server_name": params.get("sni", server),
                 "alpn": params.get("alpn", "").split(",") if params.get("alpn") else []
-            },
-            "transport": {}
-        }
+            }
+        )
         
         # Transport
-        transport_type = params.get("type", "tcp")
-        if transport_type == "ws":
-            tunnel["transport"] = {
-                "type": "ws",
-                "path": params.get("path", "/"),
-                "host": params.get("host", server)
-            }
-        elif transport_type == "grpc":
-            tunnel["transport"] = {
-                "type": "grpc",
-                "service_name": params.get("serviceName", "")
-            }
-        else:
-            tunnel["transport"] = {"type": "tcp"}
+        build = _LINK_TRANSPORTS.get(params.get("type", "tcp"), _tcp_transport)
+        tunnel["transport"] = build(params, server)
         
         return tunnel
         
-    except Exception as e:
+    except _LINK_ERRORS as e:
         print(f"Error parsing Trojan link: {e}")
         return None
 
@@ -478,107 +680,105 @@ def parse_hysteria2_link(link: str) -> Optional[Dict]:
         return None
     
     try:
-        # Extract name
-        name = "Hysteria2 Server"
-        if '#' in content:
-            content, name = content.rsplit('#', 1)
-            name = urllib.parse.unquote(name)
-        
-        # Extract params
-        params = {}
-        if '?' in content:
-            content, query = content.split('?', 1)
-            params = dict(urllib.parse.parse_qsl(query))
-        
-        # Parse password@server:port
-        if '@' in content:
-            password, server_port = content.rsplit('@', 1)
-        else:
+        # Parse password@server:port?params#name (password is optional)
+        password, server_port, params, name = _split_share_link(content, "Hysteria2 Server")
+        if password is None:
             password = ""
-            server_port = content
         
-        # Handle IPv6
-        if server_port.startswith('['):
-            match = re.match(r'\[([^\]]+)\]:(\d+)', server_port)
-            if match:
-                server, port = match.groups()
-            else:
-                return None
-        else:
-            server, port = server_port.rsplit(':', 1)
+        host_port = _split_host_port(server_port)
+        if host_port is None:
+            return None
+        server, port = host_port
         
-        tunnel = {
-            "id": generate_id(),
-            "name": name,
-            "type": TunnelType.HYSTERIA2,
-            "enabled": True,
-            "server": server,
-            "port": int(port),
-            "source": TunnelSource.IMPORT,
-            "subscription_id": None,
-            "latency": None,
-            "last_check": None,
-            "settings": {
+        tunnel = _new_tunnel(
+            TunnelType.HYSTERIA2, name, server, int(port),
+            settings={
                 "password": password,
                 "obfs_type": params.get("obfs", ""),
                 "obfs_password": params.get("obfs-password", ""),
                 "up_mbps": int(params.get("up", 0)) if params.get("up") else None,
                 "down_mbps": int(params.get("down", 0)) if params.get("down") else None
             },
-            "tls": {
+            tls={
                 "enabled": True,
                 "type": "tls",
                 "server_name": params.get("sni", server),
                 "insecure": params.get("insecure", "0") == "1"
-            },
-            "transport": {}
-        }
+            }
+        )
         
         return tunnel
         
-    except Exception as e:
+    except _LINK_ERRORS as e:
         print(f"Error parsing Hysteria2 link: {e}")
         return None
 
 
+# Scheme -> parser dispatch for share links
+_SHARE_LINK_PARSERS = {
+    "vless": parse_vless_link,
+    "vmess": parse_vmess_link,
+    "ss": parse_ss_link,
+    "trojan": parse_trojan_link,
+    "hy2": parse_hysteria2_link,
+    "hysteria2": parse_hysteria2_link,
+}
+
+
 def parse_share_link(link: str) -> Optional[Dict]:
     """Parse any supported share link"""
     link = link.strip()
     
-    if link.startswith("vless://"):
-        return parse_vless_link(link)
-    elif link.startswith("vmess://"):
-        return parse_vmess_link(link)
-    elif link.startswith("ss://"):
-        return parse_ss_link(link)
-    elif link.startswith("trojan://"):
-        return parse_trojan_link(link)
-    elif link.startswith("hy2://") or link.startswith("hysteria2://"):
-        return parse_hysteria2_link(link)
-    
-    return None
+    scheme, sep, _ = link.partition("://")
+    parser = _SHARE_LINK_PARSERS.get(scheme) if sep else None
+    if parser is None:
+        return None
+    return parser(link)
 
 
 # ============ Subscription Parsers ============
 
+_WHITESPACE = b' \t\r\n'
+
+
+def _parse_link_lines(buf, tunnels: List[Dict], end: int = None):
+    """Parse newline-separated share links in buf[:end] into tunnels
+    
+    Walks the raw bytes once, trimming each line by index, so no list of
+    lines or stripped copies is built. Lines that are not valid UTF-8 are skipped.
+    """
+    if end is None:
+        end = len(buf)
+    start = 0
+    while start < end:
+        stop = buf.find(b'\n', start, end)
+        if stop < 0:
+            stop = end
+        lo, hi = start, stop
+        while lo < hi and buf[lo] in _WHITESPACE:
+            lo += 1
+        while hi > lo and buf[hi - 1] in _WHITESPACE:
+            hi -= 1
+        if lo < hi:
+            try:
+                link = buf[lo:hi].decode('utf-8')
+            except UnicodeDecodeError:
+                link = None
+            if link:
+                tunnel = parse_share_link(link)
+                if tunnel:
+                    tunnels.append(tunnel)
+        start = stop + 1
+
+
 def parse_base64_subscription(content: str) -> List[Dict]:
     """Parse Base64 encoded subscription (list of share links)"""
     tunnels = []
     
     try:
-        # Decode base64
-        padding = 4 - len(content) % 4
-        if padding != 4:
-            content += '=' * padding
-        decoded = base64.b64decode(content).decode('utf-8')
-        
-        # Parse each line as a share link
-        for line in decoded.strip().split('\n'):
-            line = line.strip()
-            if line:
-                tunnel = parse_share_link(line)
-                if tunnel:
-                    tunnels.append(tunnel)
+        # Decode base64 and parse each line as a share link
+        content += _PAD[len(content) & 3]
+        _parse_link_lines(b64.b64decode(content), tunnels)
     except Exception as e:
         print(f"Error parsing Base64 subscription: {e}")
     
@@ -589,96 +789,90 @@ def parse_clash_subscription(content: str) -> List[Dict]:
     """Parse Clash YAML subscription"""
     tunnels = []
     
+    if yaml is None:
+        print("PyYAML not installed, cannot parse Clash config")
+        return tunnels
+    
     try:
-        import yaml
-        data = yaml.safe_load(content)
+        data = yaml.load(content, Loader=_YAML_LOADER)
         proxies = data.get("proxies", [])
         
         for proxy in proxies:
-            proxy_type = proxy.get("type", "").lower()
+            get = proxy.get
+            proxy_type = get("type", "").lower()
             
-            tunnel = {
-                "id": generate_id(),
-                "name": proxy.get("name", "Proxy"),
-                "enabled": True,
-                "server": proxy.get("server", ""),
-                "port": int(proxy.get("port", 443)),
-                "source": TunnelSource.SUBSCRIPTION,
-                "subscription_id": None,
-                "latency": None,
-                "last_check": None,
-                "settings": {},
-                "tls": {},
-                "transport": {}
-            }
+            tunnel = _new_tunnel(
+                None, get("name", "Proxy"), get("server", ""), int(get("port", 443)),
+                source=TunnelSource.SUBSCRIPTION
+            )
             
             if proxy_type == "vless":
                 tunnel["type"] = TunnelType.VLESS
                 tunnel["settings"] = {
-                    "uuid": proxy.get("uuid", ""),
-                    "flow": proxy.get("flow", ""),
+                    "uuid": get("uuid", ""),
+                    "flow": get("flow", ""),
                     "encryption": "none"
                 }
             elif proxy_type == "vmess":
                 tunnel["type"] = TunnelType.VMESS
                 tunnel["settings"] = {
-                    "uuid": proxy.get("uuid", ""),
-                    "alter_id": int(proxy.get("alterId", 0)),
-                    "security": proxy.get("cipher", "auto")
+                    "uuid": get("uuid", ""),
+                    "alter_id": int(get("alterId", 0)),
+                    "security": get("cipher", "auto")
                 }
             elif proxy_type in ("ss", "shadowsocks"):
                 tunnel["type"] = TunnelType.SHADOWSOCKS
                 tunnel["settings"] = {
-                    "method": proxy.get("cipher", ""),
-                    "password": proxy.get("password", "")
+                    "method": get("cipher", ""),
+                    "password": get("password", "")
                 }
             elif proxy_type == "trojan":
                 tunnel["type"] = TunnelType.TROJAN
                 tunnel["settings"] = {
-                    "password": proxy.get("password", "")
+                    "password": get("password", "")
                 }
             elif proxy_type == "hysteria2":
                 tunnel["type"] = TunnelType.HYSTERIA2
                 tunnel["settings"] = {
-                    "password": proxy.get("password", ""),
-                    "obfs_type": proxy.get("obfs", ""),
-                    "obfs_password": proxy.get("obfs-password", "")
+                    "password": get("password", ""),
+                    "obfs_type": get("obfs", ""),
+                    "obfs_password": get("obfs-password", "")
                 }
             else:
                 continue
             
             # TLS
-            if proxy.get("tls"):
+            if get("tls"):
                 tunnel["tls"] = {
                     "enabled": True,
                     "type": "tls",
-                    "server_name": proxy.get("sni", proxy.get("servername", tunnel["server"])),
-                    "skip_verify": proxy.get("skip-cert-verify", False)
+                    "server_name": get("sni", get("servername", tunnel["server"])),
+                    "skip_verify": get("skip-cert-verify", False)
                 }
             
             # Reality
-            if proxy.get("reality-opts"):
+            if get("reality-opts"):
                 reality = proxy["reality-opts"]
                 tunnel["tls"] = {
                     "enabled": True,
                     "type": "reality",
-                    "server_name": proxy.get("sni", proxy.get("servername", "")),
-                    "fingerprint": proxy.get("client-fingerprint", "chrome"),
+                    "server_name": get("sni", get("servername", "")),
+                    "fingerprint": get("client-fingerprint", "chrome"),
                     "public_key": reality.get("public-key", ""),
                     "short_id": reality.get("short-id", "")
                 }
             
             # Transport
-            network = proxy.get("network", "tcp")
+            network = get("network", "tcp")
             if network == "ws":
-                ws_opts = proxy.get("ws-opts", {})
+                ws_opts = get("ws-opts", {})
                 tunnel["transport"] = {
                     "type": "ws",
                     "path": ws_opts.get("path", "/"),
                     "host": ws_opts.get("headers", {}).get("Host", tunnel["server"])
                 }
             elif network == "grpc":
-                grpc_opts = proxy.get("grpc-opts", {})
+                grpc_opts = get("grpc-opts", {})
                 tunnel["transport"] = {
                     "type": "grpc",
                     "service_name": grpc_opts.get("grpc-service-name", "")
@@ -688,83 +882,87 @@ def parse_clash_subscription(content: str) -> List[Dict]:
             
             tunnels.append(tunnel)
             
-    except ImportError:
-        print("PyYAML not installed, cannot parse Clash config")
     except Exception as e:
         print(f"Error parsing Clash subscription: {e}")
     
     return tunnels
 
 
+# sing-box configs at least this large are streamed one outbound at a time
+SINGBOX_STREAM_THRESHOLD = 64 * 1024
+
+
+def _load_singbox_outbounds(content: str) -> List[Dict]:
+    """Return outbounds without building the whole config when it is large"""
+    if ijson is None or len(content) < SINGBOX_STREAM_THRESHOLD:
+        return _json_loads(content).get("outbounds", [])
+    
+    data = content.encode('utf-8') if isinstance(content, str) else content
+    # A truncated body is only detected at its end - never hand out part of the list
+    try:
+        return list(ijson.items(io.BytesIO(data), 'outbounds.item', use_float=True))
+    except ijson.JSONError as e:
+        print(f"Error parsing sing-box subscription: {e}")
+        return []
+
+
 def parse_singbox_subscription(content: str) -> List[Dict]:
     """Parse sing-box JSON subscription/config"""
     tunnels = []
     
     try:
-        data = json.loads(content)
-        outbounds = data.get("outbounds", [])
-        
-        for ob in outbounds:
-            ob_type = ob.get("type", "")
+        for ob in _load_singbox_outbounds(content):
+            get = ob.get
+            ob_type = get("type", "")
             
             # Skip non-proxy types
             if ob_type in ("direct", "block", "dns", "selector", "urltest"):
                 continue
             
-            tunnel = {
-                "id": generate_id(),
-                "name": ob.get("tag", ob_type),
-                "enabled": True,
-                "server": ob.get("server", ""),
-                "port": int(ob.get("server_port", 443)),
-                "source": TunnelSource.SUBSCRIPTION,
-                "subscription_id": None,
-                "latency": None,
-                "last_check": None,
-                "settings": {},
-                "tls": {},
-                "transport": {}
-            }
+            tunnel = _new_tunnel(
+                None, get("tag", ob_type), get("server", ""), int(get("server_port", 443)),
+                source=TunnelSource.SUBSCRIPTION
+            )
             
             if ob_type == "vless":
                 tunnel["type"] = TunnelType.VLESS
                 tunnel["settings"] = {
-                    "uuid": ob.get("uuid", ""),
-                    "flow": ob.get("flow", ""),
+                    "uuid": get("uuid", ""),
+                    "flow": get("flow", ""),
                     "encryption": "none"
                 }
             elif ob_type == "vmess":
                 tunnel["type"] = TunnelType.VMESS
                 tunnel["settings"] = {
-                    "uuid": ob.get("uuid", ""),
-                    "alter_id": int(ob.get("alter_id", 0)),
-                    "security": ob.get("security", "auto")
+                    "uuid": get("uuid", ""),
+                    "alter_id": int(get("alter_id", 0)),
+                    "security": get("security", "auto")
                 }
             elif ob_type == "shadowsocks":
                 tunnel["type"] = TunnelType.SHADOWSOCKS
                 tunnel["settings"] = {
-                    "method": ob.get("method", ""),
-                    "password": ob.get("password", "")
+                    "method": get("method", ""),
+                    "password": get("password", "")
                 }
             elif ob_type == "trojan":
                 tunnel["type"] = TunnelType.TROJAN
                 tunnel["settings"] = {
-                    "password": ob.get("password", "")
+                    "password": get("password", "")
                 }
             elif ob_type == "hysteria2":
                 tunnel["type"] = TunnelType.HYSTERIA2
                 tunnel["settings"] = {
-                    "password": ob.get("password", ""),
-                    "obfs_type": ob.get("obfs", {}).get("type", "") if ob.get("obfs") else "",
-                    "obfs_password": ob.get("obfs", {}).get("password", "") if ob.get("obfs") else "",
-                    "up_mbps": ob.get("up_mbps"),
-                    "down_mbps": ob.get("down_mbps")
+                    "password": get("password", ""),
+                    "obfs_type": get("obfs", {}).get("type", "") if get("obfs") else "",
+                    "obfs_password": get("obfs", {}).get("password", "") if get("obfs") else "",
+                    "up_mbps": get("up_mbps"),
+                    "down_mbps": get("down_mbps")
                 }
             else:
                 continue
             
             # TLS
-            tls = ob.get("tls", {})
+            tls = get("tls", {})
             if tls:
                 if tls.get("reality", {}).get("enabled"):
                     reality = tls["reality"]
@@ -786,7 +984,7 @@ def parse_singbox_subscription(content: str) -> List[Dict]:
                     }
             
             # Transport
-            transport = ob.get("transport", {})
+            transport = get("transport", {})
             if transport:
                 t_type = transport.get("type", "tcp")
                 if t_type == "ws":
@@ -840,12 +1038,217 @@ def parse_subscription_content(content: str, format_hint: str = "auto") -> List[
     return tunnels
 
 
+_BASE64_LINE_RE = re.compile(rb'^[A-Za-z0-9+/=_-]*$')
+
+
+class SubscriptionStreamParser:
+    """Incrementally parse subscription content fed in chunks
+    
+    Share link lists (plain or Base64) are decoded and parsed line by line
+    as data arrives, so large subscriptions are never held in memory as a
+    whole. sing-box JSON and Clash YAML need the full document and are
+    buffered until finish().
+    """
+    
+    DETECT_BYTES = 256
+    
+    def __init__(self, format_hint: str = "auto"):
+        self.format_hint = format_hint
+        self.mode = None  # "document", "links" or "base64"
+        self.tunnels: List[Dict] = []
+        self._pending = bytearray()  # undetected head, document body or partial line
+        self._b64 = bytearray()      # Base64 characters not yet aligned to 4
+        self._raw = None             # Base64 body kept until it yields a tunnel (plain-links fallback)
+        self._failed = False
+    
+    def _detect(self, final: bool = False) -> bool:
+        head = bytes(self._pending).lstrip()
+        newline = head.find(b'\n')
+        if newline < 0 and len(head) < self.DETECT_BYTES and not final:
+            return False
+        
+        first_line = (head[:newline] if newline >= 0 else head)[:self.DETECT_BYTES].strip()
+        hint = self.format_hint
+        if hint in ("singbox", "clash") or (hint == "auto" and (
+                first_line.startswith(b"{") or first_line.startswith(b"proxies:"))):
+            self.mode = "document"
+            return True
+        
+        data = self._pending
+        self._pending = bytearray()
+        if b"://" in first_line or not _BASE64_LINE_RE.match(first_line):
+            self.mode = "links"
+            self._feed_links(data)
+        else:
+            self.mode = "base64"
+            self._raw = bytearray()
+            self._feed_base64(data)
+        return True
+    
+    def _feed_links(self, data: bytes):
+        self._pending += data
+        end = self._pending.rfind(b'\n')
+        if end < 0:
+            return
+        _parse_link_lines(self._pending, self.tunnels, end)
+        del self._pending[:end + 1]
+    
+    def _feed_base64(self, data: bytes, final: bool = False):
+        if self._raw is not None:
+            self._raw += data
+        if self._failed:
+            return
+        self._b64 += bytes(data).translate(None, _WHITESPACE)
+        aligned = len(self._b64) if final else len(self._b64) - len(self._b64) % 4
+        if not aligned:
+            return
+        
+        block = bytes(self._b64[:aligned])
+        del self._b64[:aligned]
+        if final and len(block) % 4:
+            block += b'=' * (4 - len(block) % 4)
+        try:
+            decoded = b64.b64decode(block)
+        except Exception as e:
+            print(f"Error parsing Base64 subscription: {e}")
+            self._failed = True
+            self.tunnels = []
+            return
+        self._feed_links(decoded)
+        if self.tunnels:
+            # Decoding works, the plain-links fallback is no longer needed
+            self._raw = None
+    
+    def feed(self, chunk: bytes):
+        """Consume the next chunk of subscription data"""
+        if self.mode is None:
+            self._pending += chunk
+            self._detect()
+        elif self.mode == "document":
+            self._pending += chunk
+        elif self.mode == "links":
+            self._feed_links(chunk)
+        else:
+            self._feed_base64(chunk)
+    
+    def finish(self) -> List[Dict]:
+        """Flush buffered data and return parsed tunnels"""
+        if self.mode is None:
+            self._detect(final=True)
+        
+        if self.mode == "document":
+            content = bytes(self._pending).decode('utf-8', errors='replace')
+            self._pending = bytearray()
+            return parse_subscription_content(content, self.format_hint)
+        
+        if self.mode == "base64":
+            self._feed_base64(b"", final=True)
+        if not self._failed:
+            _parse_link_lines(self._pending, self.tunnels)
+        self._pending = bytearray()
+        
+        if not self.tunnels and self._raw is not None:
+            # Not Base64 after all (or nothing in it): parse the body as plain share links
+            self.tunnels = []
+            _parse_link_lines(self._raw, self.tunnels)
+        self._raw = None
+        return self.tunnels
+
+
 # ============ Sing-box Config Generator ============
 
-def generate_tunnel_outbound(tunnel: Dict) -> Dict:
+def _build_vless(outbound: Dict, settings: Dict):
+    outbound["uuid"] = settings.get("uuid", "")
+    if settings.get("flow"):
+        outbound["flow"] = settings["flow"]
+
+
+def _build_vmess(outbound: Dict, settings: Dict):
+    outbound["uuid"] = settings.get("uuid", "")
+    outbound["alter_id"] = settings.get("alter_id", 0)
+    outbound["security"] = settings.get("security", "auto")
+
+
+def _build_shadowsocks(outbound: Dict, settings: Dict):
+    outbound["method"] = settings.get("method", "")
+    outbound["password"] = settings.get("password", "")
+
+
+def _build_trojan(outbound: Dict, settings: Dict):
+    outbound["password"] = settings.get("password", "")
+
+
+def _build_hysteria2(outbound: Dict, settings: Dict):
+    outbound["password"] = settings.get("password", "")
+    if settings.get("obfs_type"):
+        outbound["obfs"] = {
+            "type": settings["obfs_type"],
+            "password": settings.get("obfs_password", "")
+        }
+    if settings.get("up_mbps"):
+        outbound["up_mbps"] = settings["up_mbps"]
+    if settings.get("down_mbps"):
+        outbound["down_mbps"] = settings["down_mbps"]
+
+
+# Protocol-specific settings, keyed by tunnel type
+_PROTO_BUILDERS = {
+    "vless": _build_vless,
+    "vmess": _build_vmess,
+    "shadowsocks": _build_shadowsocks,
+    "trojan": _build_trojan,
+    "hysteria2": _build_hysteria2,
+}
+
+
+def _build_reality_tls(tls: Dict, tls_config: Dict, server: str):
+    tls["server_name"] = tls_config.get("server_name", "")
+    tls["utls"] = {"enabled": True, "fingerprint": tls_config.get("fingerprint", "chrome")}
+    tls["reality"] = {
+        "enabled": True,
+        "public_key": tls_config.get("public_key", ""),
+        "short_id": tls_config.get("short_id", "")
+    }
+
+
+def _build_standard_tls(tls: Dict, tls_config: Dict, server: str):
+    tls["server_name"] = tls_config.get("server_name", server)
+    if tls_config.get("insecure"):
+        tls["insecure"] = True
+    if tls_config.get("alpn"):
+        tls["alpn"] = tls_config["alpn"]
+    if tls_config.get("fingerprint"):
+        tls["utls"] = {"enabled": True, "fingerprint": tls_config["fingerprint"]}
+
+
+# TLS settings, keyed by tls type (anything else is plain TLS)
+_TLS_BUILDERS = {
+    "reality": _build_reality_tls,
+}
+
+
+def _build_ws_transport(t: Dict, transport: Dict):
+    t["path"] = transport.get("path", "/")
+    if transport.get("host"):
+        t["headers"] = {"Host": transport["host"]}
+
+
+def _build_grpc_transport(t: Dict, transport: Dict):
+    t["service_name"] = transport.get("service_name", "")
+
+
+# Transport settings, keyed by transport type
+_TRANSPORT_BUILDERS = {
+    "ws": _build_ws_transport,
+    "grpc": _build_grpc_transport,
+}
+
+
+def generate_tunnel_outbound(tunnel: Dict, tag: str = None) -> Dict:
     """Generate sing-box outbound config from tunnel data"""
     t_type = tunnel["type"]
-    tag = f"{t_type}-{tunnel['id']}"
+    if tag is None:
+        tag = f"{t_type}-{tunnel['id']}"
     
     outbound = {
         "type": t_type,
@@ -859,82 +1262,39 @@ def generate_tunnel_outbound(tunnel: Dict) -> Dict:
     transport = tunnel.get("transport", {})
     
     # Protocol-specific settings
-    if t_type == "vless":
-        outbound["uuid"] = settings.get("uuid", "")
-        if settings.get("flow"):
-            outbound["flow"] = settings["flow"]
-    
-    elif t_type == "vmess":
-        outbound["uuid"] = settings.get("uuid", "")
-        outbound["alter_id"] = settings.get("alter_id", 0)
-        outbound["security"] = settings.get("security", "auto")
-    
-    elif t_type == "shadowsocks":
-        outbound["method"] = settings.get("method", "")
-        outbound["password"] = settings.get("password", "")
-    
-    elif t_type == "trojan":
-        outbound["password"] = settings.get("password", "")
-    
-    elif t_type == "hysteria2":
-        outbound["password"] = settings.get("password", "")
-        if settings.get("obfs_type"):
-            outbound["obfs"] = {
-                "type": settings["obfs_type"],
-                "password": settings.get("obfs_password", "")
-            }
-        if settings.get("up_mbps"):
-            outbound["up_mbps"] = settings["up_mbps"]
-        if settings.get("down_mbps"):
-            outbound["down_mbps"] = settings["down_mbps"]
+    build = _PROTO_BUILDERS.get(t_type)
+    if build:
+        build(outbound, settings)
     
     # TLS
     if tls_config.get("enabled"):
         tls = {"enabled": True}
-        
-        if tls_config.get("type") == "reality":
-            tls["server_name"] = tls_config.get("server_name", "")
-            tls["utls"] = {"enabled": True, "fingerprint": tls_config.get("fingerprint", "chrome")}
-            tls["reality"] = {
-                "enabled": True,
-                "public_key": tls_config.get("public_key", ""),
-                "short_id": tls_config.get("short_id", "")
-            }
-        else:
-            tls["server_name"] = tls_config.get("server_name", tunnel["server"])
-            if tls_config.get("insecure"):
-                tls["insecure"] = True
-            if tls_config.get("alpn"):
-                tls["alpn"] = tls_config["alpn"]
-            if tls_config.get("fingerprint"):
-                tls["utls"] = {"enabled": True, "fingerprint": tls_config["fingerprint"]}
-        
+        build = _TLS_BUILDERS.get(tls_config.get("type"), _build_standard_tls)
+        build(tls, tls_config, tunnel["server"])
         outbound["tls"] = tls
     
     # Transport
-    if transport.get("type") and transport["type"] != "tcp":
-        t = {"type": transport["type"]}
-        
-        if transport["type"] == "ws":
-            t["path"] = transport.get("path", "/")
-            if transport.get("host"):
-                t["headers"] = {"Host": transport["host"]}
-        elif transport["type"] == "grpc":
-            t["service_name"] = transport.get("service_name", "")
-        
+    transport_type = transport.get("type")
+    if transport_type and transport_type != "tcp":
+        t = {"type": transport_type}
+        build = _TRANSPORT_BUILDERS.get(transport_type)
+        if build:
+            build(t, transport)
         outbound["transport"] = t
     
     return outbound
 
 
-def generate_group_outbound(group: Dict, tunnels: List[Dict]) -> Dict:
+def _enabled_tunnel_tags(tunnels: List[Dict]) -> Dict[str, str]:
+    """Map enabled tunnel id -> outbound tag"""
+    return {t["id"]: f"{t['type']}-{t['id']}" for t in tunnels if t.get("enabled")}
+
+
+def generate_group_outbound(group: Dict, tunnels: List[Dict], enabled_tags: Dict[str, str] = None) -> Dict:
     """Generate sing-box selector/urltest outbound from group"""
-    tunnel_tags = []
-    for t_id in group.get("tunnels", []):
-        for t in tunnels:
-            if t["id"] == t_id and t.get("enabled"):
-                tunnel_tags.append(f"{t['type']}-{t['id']}")
-                break
+    if enabled_tags is None:
+        enabled_tags = _enabled_tunnel_tags(tunnels)
+    tunnel_tags = [enabled_tags[t_id] for t_id in group.get("tunnels", []) if t_id in enabled_tags]
     
     if group["type"] == "urltest":
         return {
@@ -962,6 +1322,44 @@ def generate_group_outbound(group: Dict, tunnels: List[Dict]) -> Dict:
         }
 
 
+def compress_suffixes(suffixes: List[str]) -> List[str]:
+    """Drop duplicate suffixes and ones already covered by a shorter suffix
+    
+    Suffixes are inserted label by label, reversed (com -> example -> foo),
+    into a trie, shortest first; 'foo.example.com' is dropped once
+    'example.com' is terminal on its path. Original order is kept.
+    """
+    kept = set()
+    trie = {}
+    for suffix in sorted(set(suffixes), key=lambda s: s.count(".")):
+        node = trie
+        for label in reversed(suffix.split(".")):
+            if True in node:
+                break
+            node = node.setdefault(label, {})
+        else:
+            node[True] = True
+            kept.add(suffix)
+    return [s for s in dict.fromkeys(suffixes) if s in kept]
+
+
+def _emit_route_rules(routing_rules: Dict, valid_tags: set):
+    """Yield sing-box route rules for enabled rules with a valid outbound and domain matchers"""
+    # Domain classification is memoized per routing_rules.json version
+    matchers = routing_rule_matchers(routing_rules)
+    for rule, rule_matchers in zip(routing_rules["rules"], matchers):
+        if not rule_matchers or not rule.get("enabled", True):
+            continue
+        
+        outbound_tag = rule.get("outbound")
+        if not outbound_tag or outbound_tag not in valid_tags:
+            continue
+        
+        singbox_rule = {"outbound": outbound_tag}
+        singbox_rule.update(rule_matchers)
+        yield singbox_rule
+
+
 def generate_singbox_config(tunnels: List[Dict], groups: List[Dict], active_outbound: str = None, routing_rules: Dict = None) -> Dict:
     """Generate complete sing-box config from tunnels, groups, and routing rules"""
     
@@ -986,66 +1384,30 @@ def generate_singbox_config(tunnels: List[Dict], groups: List[Dict], active_outb
             {"type": "direct", "tag": "direct-out"}
         ],
         "route": {
-            "auto_detect_interface": True
+            "auto_detect_interface": True,
+            "rules": []
         }
     }
     
-    # Add tunnel outbounds
+    # Add tunnel outbounds (tags are formatted once and shared with groups and routing)
     enabled_tunnels = [t for t in tunnels if t.get("enabled")]
+    enabled_tags = _enabled_tunnel_tags(enabled_tunnels)
+    valid_tags = {"direct-out"}
     for tunnel in enabled_tunnels:
-        outbound = generate_tunnel_outbound(tunnel)
-        config["outbounds"].append(outbound)
+        tag = enabled_tags[tunnel["id"]]
+        config["outbounds"].append(generate_tunnel_outbound(tunnel, tag))
+        valid_tags.add(tag)
     
-    # Add group outbounds
+    # Add group outbounds (member tags resolved through an id map, not a scan per member)
     for group in groups:
-        group_outbound = generate_group_outbound(group, tunnels)
+        group_outbound = generate_group_outbound(group, tunnels, enabled_tags)
         if group_outbound.get("outbounds"):
             config["outbounds"].append(group_outbound)
-    
-    # Build set of valid outbound tags
-    valid_tags = {ob.get("tag") for ob in config["outbounds"]}
+            valid_tags.add(group_outbound["tag"])
     
     # Add routing rules (service -> tunnel mapping)
     if routing_rules and routing_rules.get("rules"):
-        for rule in routing_rules["rules"]:
-            if not rule.get("enabled", True):
-                continue
-            
-            outbound_tag = rule.get("outbound")
-            if not outbound_tag or outbound_tag not in valid_tags:
-                continue
-            
-            # Collect domains from rule
-            domains = []
-            domain_suffixes = []
-            
-            # Add explicit domains
-            if rule.get("domains"):
-                for d in rule["domains"]:
-                    d = d.strip().lower()
-                    if d.startswith("*."):
-                        domain_suffixes.append(d[2:])
-                    elif d.startswith("."):
-                        domain_suffixes.append(d[1:])
-                    else:
-                        domains.append(d)
-            
-            # Add domain keywords (partial match)
-            domain_keywords = rule.get("domain_keywords", [])
-            
-            # Build the sing-box rule
-            singbox_rule = {"outbound": outbound_tag}
-            
-            if domains:
-                singbox_rule["domain"] = domains
-            if domain_suffixes:
-                singbox_rule["domain_suffix"] = domain_suffixes
-            if domain_keywords:
-                singbox_rule["domain_keyword"] = domain_keywords
-            
-            # Only add rule if it has domain matchers
-            if len(singbox_rule) > 1:
-                config["route"]["rules"].append(singbox_rule)
+        config["route"]["rules"].extend(_emit_route_rules(routing_rules, valid_tags))
     
     # Set default outbound for all tun traffic
     default_outbound = None
@@ -1061,43 +1423,225 @@ def generate_singbox_config(tunnels: List[Dict], groups: List[Dict], active_outb
         })
     elif enabled_tunnels:
         # Use first enabled tunnel
-        first_tag = f"{enabled_tunnels[0]['type']}-{enabled_tunnels[0]['id']}"
         config["route"]["rules"].append({
             "inbound": ["tun-in"],
-            "outbound": first_tag
+            "outbound": enabled_tags[enabled_tunnels[0]["id"]]
         })
     
     return config
 
 
+_singbox_cache: Optional[tuple] = None
+
+
+def _source_key(path: Path) -> Optional[tuple]:
+    try:
+        return _file_key(path)
+    except OSError:
+        return None
+
+
+def build_singbox_config(active_outbound: str = None) -> Dict:
+    """Generate sing-box config from stored data, reusing the last result while sources are unchanged"""
+    global _singbox_cache
+    key = (
+        _write_generation,
+        _source_key(TUNNELS_FILE),
+        _source_key(GROUPS_FILE),
+        _source_key(ROUTING_RULES_FILE),
+        active_outbound
+    )
+    if _singbox_cache is not None and _singbox_cache[0] == key:
+        return _singbox_cache[1]
+    
+    config = generate_singbox_config(load_tunnels(), load_groups(), active_outbound, load_routing_rules())
+    _singbox_cache = (key, config)
+    return config
+
+
+# Route rules with at least this many domain matchers are compiled to binary rule-sets
+RULE_SET_MIN_ENTRIES = 256
+_DOMAIN_MATCHERS = ("domain", "domain_suffix", "domain_keyword")
+
+
+def _compile_rule_set(rule: Dict) -> Optional[tuple]:
+    """Compile a headless rule to RULE_SET_DIR/<tag>.srs and return (tag, path)
+    
+    Tags are derived from the rule contents, so a compiled file never changes
+    under a config that already references it (the backup restored after a
+    failed check keeps working) and unchanged rules skip sing-box entirely.
+    """
+    data = _json_dumps_compact({"version": 1, "rules": [rule]})
+    tag = f"pinpoint-rules-{hashlib.blake2b(data, digest_size=8).hexdigest()}"
+    binary = RULE_SET_DIR / f"{tag}.srs"
+    if binary.exists():
+        return tag, binary
+    
+    source = RULE_SET_DIR / f"{tag}.json.tmp"
+    output = RULE_SET_DIR / f"{tag}.srs.tmp"
+    result = None
+    try:
+        RULE_SET_DIR.mkdir(parents=True, exist_ok=True)
+        source.write_bytes(data)
+        result = subprocess.run(
+            [SINGBOX_BIN, "rule-set", "compile", "--output", str(output), str(source)],
+            capture_output=True,
+            timeout=60
+        )
+        if result.returncode == 0:
+            os.replace(output, binary)
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Error compiling rule-set {tag}: {e}")
+        result = None
+    finally:
+        for tmp in (source, output):
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+    
+    if result is None or result.returncode != 0:
+        if result is not None:
+            print(f"Error compiling rule-set {tag}: {result.stderr.decode(errors='replace').strip()}")
+        return None
+    return tag, binary
+
+
+def export_rule_sets(config: Dict) -> Dict:
+    """Replace large domain rules with references to compiled sing-box rule-sets
+    
+    Each rule keeps its position, so first-match order is unchanged. Rules
+    whose compile fails stay inline. The passed config (possibly the cached
+    one from build_singbox_config) is not modified; a copy is returned.
+    """
+    route = config["route"]
+    rules = []
+    rule_sets = {}
+    for rule in route["rules"]:
+        matchers = {k: rule[k] for k in _DOMAIN_MATCHERS if k in rule}
+        if sum(len(v) for v in matchers.values()) >= RULE_SET_MIN_ENTRIES:
+            compiled = _compile_rule_set(matchers)
+            if compiled is not None:
+                tag, path = compiled
+                # Identical rules share one rule-set (tags must be unique)
+                rule_sets.setdefault(tag, {"type": "local", "tag": tag, "format": "binary", "path": str(path)})
+                rules.append({"rule_set": tag, "outbound": rule["outbound"]})
+                continue
+        rules.append(rule)
+    
+    if not rule_sets:
+        return config
+    route = dict(route, rules=rules, rule_set=route.get("rule_set", []) + list(rule_sets.values()))
+    return dict(config, route=route)
+
+
+def prune_rule_sets(config: Dict):
+    """Delete compiled rule-sets that the applied config no longer references"""
+    keep = {entry.get("path") for entry in config.get("route", {}).get("rule_set", [])}
+    try:
+        entries = list(os.scandir(RULE_SET_DIR))
+    except OSError:
+        return
+    for entry in entries:
+        if entry.name.startswith("pinpoint-rules-") and entry.path not in keep:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+
+# Write buffer for streaming the sing-box config to flash
+SINGBOX_WRITE_BUFFER = 256 * 1024
+
+
+def _snapshot_file(src: Path, dst: Path):
+    """Make dst a hard link to src's current inode, copying when they are on different filesystems
+    
+    Works as a backup because apply_singbox_config() then replaces the config by
+    rename, leaving the old inode to the backup name alone.
+    """
+    try:
+        dst.unlink()
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
+
+
+def check_singbox_config() -> bool:
+    """Run 'sing-box check' on the written config (passes when the binary is unavailable)"""
+    try:
+        result = subprocess.run(
+            [SINGBOX_BIN, "check", "-c", str(SINGBOX_CONFIG)],
+            capture_output=True,
+            timeout=5,
+            env={**os.environ, **SINGBOX_ENV}
+        )
+    except (OSError, subprocess.SubprocessError):
+        return True
+    if result.returncode != 0:
+        print(f"sing-box config check failed: {result.stderr.decode(errors='replace').strip()}")
+    return result.returncode == 0
+
+
+def _singbox_can_reload() -> bool:
+    """Whether the installed init script reloads sing-box with SIGHUP (older installs only restart)"""
+    try:
+        return b"reload_signal" in SINGBOX_INIT.read_bytes()
+    except OSError:
+        return False
+
+
 def apply_singbox_config(config: Dict) -> bool:
-    """Save config and restart sing-box"""
-    import subprocess
+    """Save config and reload (or restart) sing-box"""
     
     try:
         # Backup current config
         if SINGBOX_CONFIG.exists():
-            import shutil
-            shutil.copy(SINGBOX_CONFIG, SINGBOX_BACKUP)
+            _snapshot_file(SINGBOX_CONFIG, SINGBOX_BACKUP)
         
-        # Write new config
+        # Write new config (large domain lists go to compiled rule-sets)
+        config = export_rule_sets(config)
         SINGBOX_CONFIG.parent.mkdir(parents=True, exist_ok=True)
-        with open(SINGBOX_CONFIG, 'w') as f:
-            json.dump(config, f, indent=2)
+        with _atomic_open(SINGBOX_CONFIG, buffering=SINGBOX_WRITE_BUFFER) as f:
+            _write_json_stream(f, config, depth=3)
+        
+        # Validate before touching the running instance
+        if not check_singbox_config():
+            if SINGBOX_BACKUP.exists():
+                os.replace(SINGBOX_BACKUP, SINGBOX_CONFIG)
+            return False
+        
+        # Hot-reload (SIGHUP) when the init script supports it, full restart otherwise
+        if _singbox_can_reload():
+            result = subprocess.run(
+                [str(SINGBOX_INIT), "reload"],
+                capture_output=True,
+                timeout=10
+            )
+            if result.returncode == 0:
+                prune_rule_sets(config)
+                return True
         
-        # Restart sing-box
         result = subprocess.run(
-            ["/etc/init.d/sing-box", "restart"],
+            [str(SINGBOX_INIT), "restart"],
             capture_output=True,
             timeout=30
         )
         
-        return result.returncode == 0
+        if result.returncode != 0:
+            return False
+        prune_rule_sets(config)
+        return True
         
     except Exception as e:
         print(f"Error applying sing-box config: {e}")
         # Restore backup
         if SINGBOX_BACKUP.exists():
-            import shutil
-            shutil.copy(SINGBOX_BACKUP, SINGBOX_CONFIG)
+            try:
+                os.replace(SINGBOX_BACKUP, SINGBOX_CONFIG)
+            except OSError:
+                shutil.copy(SINGBOX_BACKUP, SINGBOX_CONFIG)
         return False
@@ -1708,6 +1708,7 @@ function renderDeviceServicesGrid() {
     });
     
     // Render grouped
+    const selected = new Set(deviceServicesData.selected);
     let html = '';
     const categoryOrder = ['social', 'messenger', 'video', 'music', 'gaming', 'ai', 'work', 'education', 'shopping', 'crypto', 'infra', 'other'];
     
@@ -1725,7 +1726,7 @@ function renderDeviceServicesGrid() {
                             <input type="checkbox" 
                                    id="dev-svc-${svc.id}" 
                                    value="${svc.id}"
-                                   ${deviceServicesData.selected.includes(svc.id) ? 'checked' : ''}
+                                   ${selected.has(svc.id) ? 'checked' : ''}
                                    onchange="updateDeviceServiceSelection('${svc.id}', this.checked)">
                             <label for="dev-svc-${svc.id}">${svc.name}</label>
                         </div>
@@ -3473,12 +3474,8 @@ async function testAllTunnels() {
     showLoading('Проверка серверов...', 'Это может занять время');
     
     try {
-        for (const t of tunnelsData) {
-            if (t.enabled) {
-                await api(`/tunnels/${t.id}/test`, { method: 'POST' });
-            }
-        }
-        showToast('Проверка завершена', 'success');
+        const data = await api('/tunnels/test-all', { method: 'POST' });
+        showToast(`Проверка завершена: доступно ${data.reachable} из ${data.tested}`, 'success');
         await loadTunnelsList();
     } catch (error) {
         showToast('Ошибка проверки', 'error');
@@ -4050,9 +4047,10 @@ async function applyServiceRoutes() {
     try {
         // Build rules from service routes
         const rules = [];
+        const servicesById = new Map(allServicesData.map(s => [s.id, s]));
         
         for (const [serviceId, outbound] of Object.entries(serviceRoutesData)) {
-            const service = allServicesData.find(s => s.id === serviceId);
+            const service = servicesById.get(serviceId);
             if (service && service.domains.length > 0) {
                 rules.push({
                     name: service.name,
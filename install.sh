@@ -54,6 +54,17 @@ step() {
     echo -e "${CYAN}[→]${NC} $1"
 }
 
+# Poll a shell condition every 0.2s until it holds or the timeout (seconds) runs out
+wait_for() {
+    WAIT_TRIES=$(($1 * 5))
+    while ! eval "$2" >/dev/null 2>&1; do
+        WAIT_TRIES=$((WAIT_TRIES - 1))
+        [ "$WAIT_TRIES" -le 0 ] && return 1
+        sleep 0.2
+    done
+    return 0
+}
+
 # Quiet opkg - filter out noise but keep errors
 opkg_quiet() {
     opkg "$@" 2>&1 | grep -v "no valid architecture" | grep -v "^Package .* ignoring.$" || true
@@ -775,10 +786,9 @@ install_dependencies() {
     if [ -x /etc/init.d/https-dns-proxy ]; then
         /etc/init.d/https-dns-proxy enable 2>/dev/null || true
         /etc/init.d/https-dns-proxy start 2>/dev/null || true
-        sleep 2
         
         # Check if https-dns-proxy is actually running and responding
-        if netstat -ln 2>/dev/null | grep -q ":5053" || ss -ln 2>/dev/null | grep -q ":5053"; then
+        if wait_for 2 'netstat -ln | grep -q ":5053" || ss -ln | grep -q ":5053"'; then
             # Use local DoH proxy (127.0.0.1:5053)
             uci set dhcp.@dnsmasq[0].noresolv='1' 2>/dev/null || true
             uci -q delete dhcp.@dnsmasq[0].server 2>/dev/null || true
@@ -835,11 +845,13 @@ install_dependencies() {
     
     # Increase LuCI/RPC timeouts for slow operations (GitHub updates, IP loading, etc.)
     step "Configuring LuCI/RPC timeouts..."
-    uci set rpcd.@rpcd[0].socket_timeout='180' 2>/dev/null || true
-    uci commit rpcd 2>/dev/null || true
-    uci set uhttpd.main.script_timeout='180' 2>/dev/null || true
-    uci set uhttpd.main.network_timeout='180' 2>/dev/null || true
-    uci commit uhttpd 2>/dev/null || true
+    uci batch >/dev/null 2>&1 <<'UCIEOF' || true
+set rpcd.@rpcd[0].socket_timeout='180'
+set uhttpd.main.script_timeout='180'
+set uhttpd.main.network_timeout='180'
+commit rpcd
+commit uhttpd
+UCIEOF
     /etc/init.d/rpcd restart 2>/dev/null || true
     /etc/init.d/uhttpd restart 2>/dev/null || true
     info "LuCI/RPC timeouts set to 180 seconds (prevents XHR timeout errors)"
@@ -1385,6 +1397,9 @@ start_service() {
     procd_open_instance
     procd_set_param command /usr/bin/sing-box run -c /etc/sing-box/config.json
     procd_set_param env ENABLE_DEPRECATED_TUN_ADDRESS_X=true ENABLE_DEPRECATED_SPECIAL_OUTBOUNDS=true
+    # "reload" after a config change sends SIGHUP instead of restarting the instance
+    procd_set_param file /etc/sing-box/config.json
+    procd_set_param reload_signal HUP
     procd_set_param respawn
     procd_set_param stdout 1
     procd_set_param stderr 1
@@ -1546,8 +1561,8 @@ ROUTESCRIPT
 # Idempotent. Run from /etc/init.d/sing-box start.
 CONF="/etc/sing-box/config.json"
 [ ! -f "$CONF" ] && exit 0
-sed -i 's/"inet4_address": "10\.0\.0\.1\/30",/"address": ["10.0.0.1\/30"],/' "$CONF" 2>/dev/null
-sed -i 's/"inet4_address": "10\.0\.0\.1\/30"/"address": ["10.0.0.1\/30"]/' "$CONF" 2>/dev/null
+sed -i 's/"inet4_address": *"10\.0\.0\.1\/30",/"address": ["10.0.0.1\/30"],/' "$CONF" 2>/dev/null
+sed -i 's/"inet4_address": *"10\.0\.0\.1\/30"/"address": ["10.0.0.1\/30"]/' "$CONF" 2>/dev/null
 exit 0
 FIXTUN
     chmod +x "$PINPOINT_DIR/scripts/fix-tun-config.sh"
@@ -2005,10 +2020,9 @@ install_luci_app() {
     if [ -x /etc/init.d/https-dns-proxy ]; then
         /etc/init.d/https-dns-proxy enable 2>/dev/null || true
         /etc/init.d/https-dns-proxy start 2>/dev/null || true
-        sleep 2
         
         # Check if https-dns-proxy is actually running and responding
-        if netstat -ln 2>/dev/null | grep -q ":5053" || ss -ln 2>/dev/null | grep -q ":5053"; then
+        if wait_for 2 'netstat -ln | grep -q ":5053" || ss -ln | grep -q ":5053"'; then
             # Use local DoH proxy (127.0.0.1:5053)
             uci set dhcp.@dnsmasq[0].noresolv='1' 2>/dev/null || true
             uci -q delete dhcp.@dnsmasq[0].server 2>/dev/null || true
@@ -2065,12 +2079,14 @@ install_luci_app() {
     
     # Increase LuCI/RPC timeouts for slow operations (GitHub updates, IP loading, etc.)
     step "Configuring LuCI/RPC timeouts..."
-    uci set rpcd.@rpcd[0].socket_timeout='180' 2>/dev/null || true
-    uci commit rpcd 2>/dev/null || true
-    uci set uhttpd.main.script_timeout='180' 2>/dev/null || true
-    uci set uhttpd.main.network_timeout='180' 2>/dev/null || true
-    uci commit uhttpd 2>/dev/null || true
-    /etc/init.d/rpcd restart 2>/dev/null || true
+    uci batch >/dev/null 2>&1 <<'UCIEOF' || true
+set rpcd.@rpcd[0].socket_timeout='180'
+set uhttpd.main.script_timeout='180'
+set uhttpd.main.network_timeout='180'
+commit rpcd
+commit uhttpd
+UCIEOF
+    # rpcd picks up the new timeout when it is restarted for the ucode/ACL below
     /etc/init.d/uhttpd restart 2>/dev/null || true
     info "LuCI/RPC timeouts set to 180 seconds (prevents XHR timeout errors)"
     
@@ -2229,6 +2245,9 @@ start_service() {
     procd_open_instance
     procd_set_param command /usr/bin/sing-box run -c /etc/sing-box/config.json
     procd_set_param env ENABLE_DEPRECATED_TUN_ADDRESS_X=true ENABLE_DEPRECATED_SPECIAL_OUTBOUNDS=true
+    # "reload" after a config change sends SIGHUP instead of restarting the instance
+    procd_set_param file /etc/sing-box/config.json
+    procd_set_param reload_signal HUP
     procd_set_param respawn
     procd_set_param stdout 1
     procd_set_param stderr 1
@@ -2258,9 +2277,8 @@ SBINIT
     rm -rf /tmp/ucode-* 2>/dev/null || true
     
     # Verify installation
-    sleep 2
     step "Verifying installation..."
-    if ubus list 2>/dev/null | grep -q "luci.pinpoint"; then
+    if wait_for 2 'ubus list | grep -q "luci.pinpoint"'; then
         info "luci.pinpoint registered successfully!"
     else
         warn "luci.pinpoint not found in ubus. Check: logread | grep rpcd"
@@ -2484,8 +2502,7 @@ main() {
         if [ -f /etc/dnsmasq.d/pinpoint.conf ]; then
             step "Restarting dnsmasq..."
             /etc/init.d/dnsmasq restart >/dev/null 2>&1 || true
-            sleep 1
-            if /etc/init.d/dnsmasq running >/dev/null 2>&1; then
+            if wait_for 1 '/etc/init.d/dnsmasq running'; then
                 info "dnsmasq restarted with new configuration"
             else
                 warn "dnsmasq failed to restart (check logs: logread | grep dnsmasq)"
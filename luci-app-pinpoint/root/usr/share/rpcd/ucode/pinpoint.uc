@@ -475,34 +475,42 @@ function get_status() {
 		doh_running = true;
 	}
 	
-	// Get nftables stats
+	// Get nftables stats, set sizes and routing state from one JSON dump
 	let packets = 0, bytes = 0, nets = 0, ips = 0;
-	let nft_out = run_cmd('nft list chain inet pinpoint prerouting 2>/dev/null');
+	let routing_active = false;
+	let counter_found = false;
+	let nft_data = null;
+	let nft_out = run_cmd('nft -j list table inet pinpoint 2>/dev/null');
 	if (nft_out) {
-		let m = match(nft_out, /counter packets (\d+) bytes (\d+)/);
-		if (m) {
-			packets = +m[1];
-			bytes = +m[2];
+		try {
+			nft_data = json(nft_out);
+		} catch(e) {
+			nft_data = null;
+		}
+	}
+	if (nft_data && type(nft_data.nftables) == 'array') {
+		for (let obj in nft_data.nftables) {
+			if (obj.table) {
+				routing_active = true;
+			} else if (obj.set) {
+				let count = obj.set.elem ? length(obj.set.elem) : 0;
+				if (obj.set.name == 'tunnel_nets')
+					nets = count;
+				else if (obj.set.name == 'tunnel_ips')
+					ips = count;
+			} else if (obj.rule && obj.rule.chain == 'prerouting' && !counter_found) {
+				for (let expr in (obj.rule.expr || [])) {
+					if (expr.counter) {
+						packets = +expr.counter.packets;
+						bytes = +expr.counter.bytes;
+						counter_found = true;
+						break;
+					}
+				}
+			}
 		}
 	}
 	
-	// Count set elements
-	let nets_out = run_cmd('nft list set inet pinpoint tunnel_nets 2>/dev/null');
-	if (nets_out) {
-		nets = length(split(nets_out, ','));
-	}
-	let ips_out = run_cmd('nft list set inet pinpoint tunnel_ips 2>/dev/null');
-	if (ips_out) {
-		ips = length(split(ips_out, ','));
-	}
-	
-	// Check if routing is active (nftables rules exist)
-	let routing_active = false;
-	let nft_check = run_cmd('nft list table inet pinpoint 2>/dev/null');
-	if (nft_check && length(trim(nft_check)) > 0) {
-		routing_active = true;
-	}
-	
 	// Count enabled services
 	let services_data = read_json(SERVICES_FILE);
 	let enabled_services = 0;
@@ -1946,7 +1954,7 @@ function get_network_hosts() {
 	}
 	
 	// Read ARP table for additional hosts (filter by LAN subnet and interface)
-	let arp = run_cmd('cat /proc/net/arp 2>/dev/null');
+	let arp = readfile('/proc/net/arp');
 	if (arp) {
 		arp = trim(arp);
 		let lines = split(arp, '\n');
@@ -2061,13 +2069,16 @@ function test_domain(params) {
 	if (!domain) {
 		return { error: 'Domain required' };
 	}
+	if (!match(domain, /^[A-Za-z0-9.-]+$/)) {
+		return { error: 'Invalid domain' };
+	}
 	
-	// Resolve domain
-	let dig_out = run_cmd('nslookup ' + domain + ' 2>/dev/null | grep -A1 "Name:" | tail -1');
+	// Resolve domain: parse the answer section here instead of piping through grep/tail
+	let ns_out = run_cmd('nslookup ' + domain + ' 2>/dev/null');
 	let ips = [];
-	if (dig_out) {
-		let m = match(dig_out, /Address:\s*([0-9.]+)/);
-		if (m) {
+	let answer = ns_out ? index(ns_out, 'Name:') : -1;
+	if (answer >= 0) {
+		for (let m in (match(substr(ns_out, answer), /Address:[ \t]*([0-9]+\.[0-9]+\.[0-9]+\.[0-9]+)[ \t]*(\n|$)/g) || [])) {
 			push(ips, m[1]);
 		}
 	}
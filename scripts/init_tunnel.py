@@ -1,6 +1,29 @@
 #!/usr/bin/env python3
 """Initialize tunnels.json from existing sing-box config"""
 import json
+import os
+import tempfile
+
+
+def atomic_write_json(path, obj):
+    """Write compact JSON via tmp + rename so a reboot mid-write can't truncate it
+
+    Besides the backend, settings.json is read by the LuCI rpcd handler and
+    grepped by install.sh; both accept the compact form.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(obj, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates 0600; keep the mode the files had with open()
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
 
 tunnel = {
     "id": "vless-lux",
@@ -29,12 +52,10 @@ tunnel = {
     "transport": {"type": "tcp"}
 }
 
-with open("/opt/pinpoint/data/tunnels.json", "w") as f:
-    json.dump([tunnel], f, indent=2)
+atomic_write_json("/opt/pinpoint/data/tunnels.json", [tunnel])
 
 # Set active outbound
 settings = {"active_outbound": "vless-vless-lux"}
-with open("/opt/pinpoint/data/settings.json", "w") as f:
-    json.dump(settings, f, indent=2)
+atomic_write_json("/opt/pinpoint/data/settings.json", settings)
 
 print("Tunnel imported and set as active!")
@@ -4,16 +4,24 @@ Pinpoint - List Downloader and Parser
 Downloads IP lists from various sources and converts them to CIDR format
 """
 
+import hashlib
 import json
+import logging
+import logging.handlers
 import os
 import re
+import shutil
+import socket
 import subprocess
 import sys
-import urllib.request
-import urllib.error
+import threading
+import http.client
+import urllib.parse
 from pathlib import Path
-from ipaddress import ip_address, ip_network, IPv4Address, IPv4Network
+from ipaddress import ip_address, ip_network, collapse_addresses, IPv4Address, IPv4Network
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 
 PINPOINT_DIR = Path("/opt/pinpoint")
 DATA_DIR = PINPOINT_DIR / "data"
@@ -23,89 +31,260 @@ DEVICES_FILE = DATA_DIR / "devices.json"
 # OpenWRT uses /tmp/dnsmasq.d/ for additional configs
 DNSMASQ_CONF = Path("/tmp/dnsmasq.d/pinpoint.conf")
 DEVICES_NFT = DATA_DIR / "devices.nft"
+# ETag/Last-Modified per source URL and fingerprint per processed service, for conditional GET
+# (only validators are kept on flash - an unchanged service keeps its existing list files)
+SOURCES_STATE = DATA_DIR / "sources_state.json"
+# download_source() result for a 304 answer
+NOT_MODIFIED = object()
+# Parallel source downloads (kept low: bodies in flight are held in RAM until parsed)
+DOWNLOAD_WORKERS = 4
+
+# route add IP mask NETMASK [gateway] - any case
+_KEENETIC_RE = re.compile(r'^\s*route\s+add\s+(\S+)\s+\S+\s+(\S+)', re.IGNORECASE)
+# Essential Meta/Instagram ranges, loaded when any of these services is enabled
+_META_SERVICES = frozenset({'instagram', 'meta', 'facebook', 'whatsapp'})
+_META_ESSENTIAL_RANGES = (
+    "31.13.24.0/21",      # Facebook
+    "31.13.64.0/18",      # Facebook/Instagram
+    "157.240.0.0/16",     # Meta
+    "179.60.192.0/22",    # Meta
+    "185.60.216.0/22",    # Meta
+    "66.220.144.0/20",    # Facebook
+    "69.63.176.0/20",     # Facebook
+    "69.171.224.0/19",    # Facebook
+    "74.119.76.0/22",     # Facebook
+    "102.132.96.0/20",    # Meta
+    "129.134.0.0/16",     # Meta
+    "147.75.208.0/20",    # Meta
+    "163.70.128.0/17",    # Meta
+)
+
+# YouTube domains answered with :: in dnsmasq to force IPv4 (through the tunnel)
+_YOUTUBE_SERVICES = frozenset({'youtube', 'youtubemusic', 'googlevideo'})
+_YOUTUBE_V6_LINES = tuple(f"address=/{domain}/::" for domain in (
+    "googlevideo.com", "youtube.com", "music.youtube.com",
+    "ytimg.com", "ggpht.com", "youtubei.googleapis.com",
+    "wide-youtube.l.google.com", "youtube-ui.l.google.com",
+))
+
+# `nft -a list` rule handles and device set names
+_HANDLE_RE = re.compile(r'# handle (\d+)')
+_DEVICE_SET_RE = re.compile(r'set (device_\w+)')
+
+# One syslog socket for the whole run instead of forking `logger` per message
+_syslog = None
+if os.path.exists("/dev/log"):
+    try:
+        _syslog_handler = logging.handlers.SysLogHandler(address="/dev/log")
+        _syslog_handler.ident = "pinpoint: "
+        _syslog = logging.getLogger("pinpoint")
+        _syslog.addHandler(_syslog_handler)
+        _syslog.setLevel(logging.INFO)
+        _syslog.propagate = False
+    except OSError:
+        _syslog = None
 
 def log(msg):
     """Log message to syslog and stdout"""
     print(f"[pinpoint] {msg}")
-    subprocess.run(["logger", "-t", "pinpoint", msg], capture_output=True)
+    if _syslog is not None:
+        _syslog.info(msg)
+    else:
+        subprocess.run(["logger", "-t", "pinpoint", msg], capture_output=True)
 
 def mask_to_cidr(mask):
-    """Convert netmask to CIDR prefix length"""
-    masks = {
-        "255.255.255.255": 32, "255.255.255.254": 31, "255.255.255.252": 30,
-        "255.255.255.248": 29, "255.255.255.240": 28, "255.255.255.224": 27,
-        "255.255.255.192": 26, "255.255.255.128": 25, "255.255.255.0": 24,
-        "255.255.254.0": 23, "255.255.252.0": 22, "255.255.248.0": 21,
-        "255.255.240.0": 20, "255.255.224.0": 19, "255.255.192.0": 18,
-        "255.255.128.0": 17, "255.255.0.0": 16, "255.254.0.0": 15,
-        "255.252.0.0": 14, "255.248.0.0": 13, "255.240.0.0": 12,
-        "255.224.0.0": 11, "255.192.0.0": 10, "255.128.0.0": 9, "255.0.0.0": 8,
-    }
-    return masks.get(mask, 32)
+    """Convert netmask to CIDR prefix length (32 for invalid masks)"""
+    try:
+        bits = int.from_bytes(socket.inet_aton(mask), 'big')
+    except OSError:
+        return 32
+    prefix = bin(bits).count('1')
+    # Masks wider than /8 are treated as invalid so a stray default route can't swallow all traffic
+    if prefix < 8 or bits != (0xFFFFFFFF << (32 - prefix)) & 0xFFFFFFFF:
+        return 32
+    return prefix
 
-def download_file(url, timeout=60):
-    """Download file from URL with timeout"""
+# Keep-alive HTTP connections, one per (scheme, host) per download thread;
+# _http_open lists all of them so a run can close them when it is done
+_http = threading.local()
+_http_open = []
+_http_open_lock = threading.Lock()
+
+def _http_connection(scheme, host, timeout):
+    """Return this thread's open connection to scheme://host, creating it on first use"""
+    conns = getattr(_http, 'conns', None)
+    if conns is None:
+        conns = _http.conns = {}
+    conn = conns.get((scheme, host))
+    if conn is None:
+        cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        conn = conns[(scheme, host)] = cls(host, timeout=timeout)
+        with _http_open_lock:
+            _http_open.append(conn)
+    return conn
+
+def close_http_connections():
+    """Close every keep-alive connection opened so far"""
+    with _http_open_lock:
+        conns = _http_open[:]
+        _http_open.clear()
+    for conn in conns:
+        conn.close()
+
+@contextmanager
+def download_pool():
+    """Download threads shared by every service of a run, so their keep-alive
+    connections carry over between services; the connections are closed at the end"""
+    try:
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+            yield pool
+    finally:
+        close_http_connections()
+
+def http_get(url, headers=None, timeout=60, max_redirects=5):
+    """GET url reusing a keep-alive connection, following redirects; return (status, response, body)"""
+    request_headers = {'User-Agent': 'Pinpoint/1.0', **(headers or {})}
+    for _ in range(max_redirects + 1):
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        for attempt in range(2):
+            conn = _http_connection(parts.scheme, parts.netloc, timeout)
+            try:
+                conn.request('GET', path, headers=request_headers)
+                response = conn.getresponse()
+                body = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # Server may have dropped the idle connection - reconnect once
+                conn.close()
+                _http.conns.pop((parts.scheme, parts.netloc), None)
+                if attempt:
+                    raise
+        location = response.getheader('Location')
+        if response.status in (301, 302, 303, 307, 308) and location:
+            url = urllib.parse.urljoin(url, location)
+            continue
+        return response.status, response, body
+    raise http.client.HTTPException("too many redirects")
+
+def download_source(url, validators=None, timeout=60):
+    """Download url, conditionally when validators from the last run are given; return (content, validators)"""
+    headers = {}
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    
     try:
-        req = urllib.request.Request(url, headers={'User-Agent': 'Pinpoint/1.0'})
-        with urllib.request.urlopen(req, timeout=timeout) as response:
-            return response.read().decode('utf-8', errors='ignore')
-    except urllib.error.URLError as e:
+        status, response, body = http_get(url, headers=headers, timeout=timeout)
+        if status == 304 and headers:
+            return NOT_MODIFIED, validators
+        if status != 200:
+            log(f"Download failed: {url} - HTTP {status}")
+            return None, None
+        
+        validators = {'etag': response.getheader('ETag'), 'last_modified': response.getheader('Last-Modified')}
+        if not (validators['etag'] or validators['last_modified']):
+            validators = None
+        return body.decode('utf-8', errors='ignore'), validators
+    except (http.client.HTTPException, OSError) as e:
         log(f"Download failed: {url} - {e}")
-        return None
+        return None, None
     except Exception as e:
         log(f"Download error: {url} - {e}")
-        return None
+        return None, None
+
+def download_file(url, timeout=60):
+    """Download file from URL with timeout"""
+    return download_source(url, timeout=timeout)[0]
+
+def load_sources_state():
+    """Validators and service fingerprints saved by the last update (empty if missing or unreadable)"""
+    try:
+        with open(SOURCES_STATE) as f:
+            state = json.load(f)
+        return {'validators': dict(state['validators']), 'services': dict(state['services'])}
+    except (OSError, ValueError, KeyError, TypeError):
+        return {'validators': {}, 'services': {}}
+
+def save_sources_state(state):
+    """Write sources state atomically (tmp + rename)"""
+    tmp = SOURCES_STATE.with_name(SOURCES_STATE.name + '.tmp')
+    try:
+        SOURCES_STATE.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, SOURCES_STATE)
+    except OSError as e:
+        log(f"Failed to save sources state: {e}")
+
+def service_fingerprint(service):
+    """Hash of a service definition, to tell whether its list files can be kept as they are"""
+    return hashlib.blake2b(json.dumps(service, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+def load_services():
+    """Read services.json once per run (empty config if it does not exist)"""
+    if not SERVICES_FILE.exists():
+        return {}
+    with open(SERVICES_FILE) as f:
+        return json.load(f)
+
+def is_github_tree_url(url):
+    """GitHub directory URLs are expanded via the API instead of downloaded directly"""
+    return 'github.com' in url and '/tree/' in url
+
+def iter_lines(content):
+    """Yield lines of a downloaded body one at a time instead of splitting it into a list"""
+    find = content.find
+    start = 0
+    while True:
+        end = find('\n', start)
+        if end < 0:
+            yield content[start:]
+            return
+        yield content[start:end]
+        start = end + 1
 
 def parse_keenetic_format(content):
-    """Parse Keenetic route format: route add IP mask NETMASK 0.0.0.0 (case-insensitive)"""
-    cidrs = set()
-    for line in content.split('\n'):
-        line = line.strip()
-        # Case-insensitive match for 'route add' or 'route ADD'
-        if line.lower().startswith('route add'):
-            parts = line.split()
-            if len(parts) >= 5:
-                ip = parts[2]
-                mask = parts[4]
-                cidr = mask_to_cidr(mask)
-                cidrs.add(f"{ip}/{cidr}")
-    return sorted(cidrs)
+    """Parse Keenetic route format: route add IP mask NETMASK 0.0.0.0 (case-insensitive) into a set of networks"""
+    nets = set()
+    for line in iter_lines(content):
+        match = _KEENETIC_RE.match(line)
+        if match:
+            try:
+                nets.add(IPv4Network(f"{match.group(1)}/{mask_to_cidr(match.group(2))}", strict=False))
+            except ValueError:
+                continue
+    return nets
 
 def parse_plain_ip(content):
-    """Parse plain IP/CIDR list and normalize to CIDR"""
-    cidrs = set()
-    for line in content.split('\n'):
+    """Parse plain IP/CIDR list into a set of networks"""
+    nets = set()
+    for line in iter_lines(content):
         line = line.strip()
         if line and not line.startswith('#'):
-            # Try to normalize IP to CIDR
-            normalized = normalize_ip_to_cidr(line)
-            if normalized:
-                cidrs.add(normalized)
-            else:
-                # Try pattern matching as fallback
-                ip_pattern = re.compile(r'^(\d+\.\d+\.\d+\.\d+)(/\d+)?$')
-                match = ip_pattern.match(line)
-                if match:
-                    ip = match.group(1)
-                    prefix = match.group(2) or '/32'
-                    cidr = f"{ip}{prefix}"
-                    # Normalize again
-                    normalized = normalize_ip_to_cidr(cidr)
-                    if normalized:
-                        cidrs.add(normalized)
-    return sorted(cidrs)
+            try:
+                # IPv6 is kept in CIDR form for the list files; the ipv4 nft sets skip it on load
+                nets.add(ip_network(line, strict=False) if '/' in line else IPv4Network(line))
+            except ValueError:
+                continue
+    return nets
 
 def parse_domains_list(content):
     """Parse plain domain list (one domain per line)"""
     domains = set()
-    for line in content.split('\n'):
+    for line in iter_lines(content):
         line = line.strip()
-        if line and not line.startswith('#'):
-            # Remove any wildcards like *.domain.com -> domain.com
-            if line.startswith('*.'):
-                line = line[2:]
-            if '.' in line and not line.startswith('.'):
-                domains.add(line.lower())
+        if not line or line[0] == '#':
+            continue
+        # Remove any wildcards like *.domain.com -> domain.com
+        if line[0] == '*' and line[1:2] == '.':
+            line = line[2:]
+        if line and line[0] != '.' and '.' in line:
+            domains.add(line.lower())
     return sorted(domains)
 
 def normalize_ip_to_cidr(ip_str):
@@ -132,29 +311,15 @@ def normalize_ip_to_cidr(ip_str):
     
     return None
 
-def merge_cidr_networks(cidrs):
-    """Merge overlapping CIDR networks and remove duplicates"""
-    if not cidrs:
-        return set()
-    
-    networks = set()
-    for cidr in cidrs:
-        try:
-            network = ip_network(cidr, strict=False)
-            networks.add(network)
-        except:
-            continue
-    
-    if not networks:
-        return set()
-    
-    # Sort by network address
-    sorted_networks = sorted(networks, key=lambda x: (x.network_address, x.prefixlen))
+def merge_cidr_networks(networks):
+    """Merge overlapping networks and remove duplicates, return them in network order (IPv4 first)"""
+    # Sort once, here: IPv4 before IPv6, the two are never compared
+    sorted_networks = sorted(networks, key=lambda net: (net.version, net))
     
     # Merge overlapping networks
     merged = []
     for net in sorted_networks:
-        if not merged:
+        if not merged or merged[-1].version != net.version:
             merged.append(net)
         else:
             last = merged[-1]
@@ -179,24 +344,25 @@ def merge_cidr_networks(cidrs):
             else:
                 merged.append(net)
     
-    return {str(net) for net in merged}
+    return merged
 
 def get_github_directory_contents(path, base_url="https://api.github.com/repos/RockBlack-VPN/ip-address/contents"):
     """Get list of files in GitHub directory using API"""
     api_url = f"{base_url}/{path}"
     try:
-        req = urllib.request.Request(api_url, headers={'User-Agent': 'Pinpoint/1.0', 'Accept': 'application/vnd.github.v3+json'})
-        with urllib.request.urlopen(req, timeout=30) as response:
-            data = json.loads(response.read().decode('utf-8'))
-            return [item for item in data if item.get('type') == 'file']
+        status, _, body = http_get(api_url, headers={'Accept': 'application/vnd.github.v3+json'}, timeout=30)
+        if status != 200:
+            raise http.client.HTTPException(f"HTTP {status}")
+        data = json.loads(body.decode('utf-8'))
+        return [item for item in data if item.get('type') == 'file']
     except Exception as e:
         log(f"GitHub API error for {path}: {e}")
         return []
 
 def parse_content(content, format_type='auto'):
-    """Auto-detect and parse content format"""
+    """Auto-detect and parse content format: domains as a sorted list, IP lists as a set of networks"""
     if not content:
-        return []
+        return set()
     
     # Handle domains type separately
     if format_type == 'domains':
@@ -216,8 +382,16 @@ def parse_content(content, format_type='auto'):
     else:
         return parse_plain_ip(content)
 
-def process_service(service):
-    """Process a single service - download sources and extract domains/IPs"""
+def process_service(service, pool, previous=None, current=None):
+    """Process a single service - download sources and extract domains/IPs
+    
+    Plain sources are downloaded on pool (see download_pool()).
+    
+    With sources state from the last run (previous) plain sources are requested
+    conditionally; when all of them are unchanged, the service definition is the
+    same and its list files are still there, the files are kept as they are.
+    Validators and the fingerprint for this run are recorded in current.
+    """
     service_id = service['id']
     enabled = service.get('enabled', False)
     
@@ -230,18 +404,11 @@ def process_service(service):
     # Create lists directory
     LISTS_DIR.mkdir(parents=True, exist_ok=True)
     
-    # Extract domains to file (including custom domains)
+    # Domains (including custom ones) are written once, after sources are merged in
     domains = set(service.get('domains', []))
     custom_domains = set(service.get('custom_domains', []))
     all_domains = domains | custom_domains
     
-    if all_domains:
-        domains_file = LISTS_DIR / f"{service_id}_domains.txt"
-        with open(domains_file, 'w') as f:
-            for domain in sorted(all_domains):
-                f.write(f"{domain}\n")
-        log(f"  Saved {len(all_domains)} domains ({len(custom_domains)} custom)")
-    
     # Extract static IP ranges (including custom IPs)
     ip_ranges = set(service.get('ip_ranges', []))
     custom_ips = set(service.get('custom_ips', []))
@@ -250,14 +417,24 @@ def process_service(service):
     if all_static:
         static_file = LISTS_DIR / f"{service_id}_static.txt"
         with open(static_file, 'w') as f:
-            for ip in sorted(all_static):
-                f.write(f"{ip}\n")
+            f.write('\n'.join(sorted(all_static)) + '\n')
         log(f"  Saved {len(all_static)} static IPs ({len(custom_ips)} custom)")
     
     # Download and process external sources
     sources = service.get('sources', [])
     all_cidrs = set()
     extra_domains = set()
+    plain_sources = []
+    written = [static_file.name] if all_static else []
+    
+    fingerprint = service_fingerprint(service)
+    kept = (previous or {}).get('services', {}).get(service_id)
+    can_keep = (
+        kept is not None and kept.get('fingerprint') == fingerprint
+        and all((LISTS_DIR / name).exists() for name in kept.get('files', []))
+        and not any(is_github_tree_url(source.get('url') or '') for source in sources)
+    )
+    old_validators = previous['validators'] if can_keep else {}
     
     for source in sources:
         url = source.get('url')
@@ -267,7 +444,7 @@ def process_service(service):
             continue
         
         # Check if this is a GitHub directory URL
-        if 'github.com' in url and '/tree/' in url:
+        if is_github_tree_url(url):
             # Extract path from GitHub URL
             # e.g., https://github.com/RockBlack-VPN/ip-address/tree/main/Global/Youtube
             # -> Global/Youtube
@@ -300,40 +477,59 @@ def process_service(service):
                                     extra_domains.update(parsed_domains)
                                     log(f"      Parsed {len(parsed_domains)} domains")
                                 else:
+                                    # Parsers return networks, sorted once when merged
                                     cidrs = parse_content(content, source_type)
-                                    # Normalize to CIDR
-                                    normalized_cidrs = set()
-                                    for cidr in cidrs:
-                                        normalized = normalize_ip_to_cidr(cidr)
-                                        if normalized:
-                                            normalized_cidrs.add(normalized)
-                                    all_cidrs.update(normalized_cidrs)
-                                    log(f"      Parsed {len(normalized_cidrs)} CIDRs")
+                                    all_cidrs.update(cidrs)
+                                    log(f"      Parsed {len(cidrs)} CIDRs")
             except Exception as e:
                 log(f"  Error processing GitHub directory: {e}")
                 continue
         else:
-            # Regular URL
+            plain_sources.append((url, source_type))
+    
+    # Regular URLs download concurrently; each body is parsed as soon as it
+    # arrives and dropped, so at most DOWNLOAD_WORKERS bodies are in RAM
+    def download_and_parse(batch, validators):
+        """Fetch (url, type) pairs, parse fresh bodies, return the pairs answered 304"""
+        unchanged = []
+        futures = {}
+        for url, source_type in batch:
             log(f"  Downloading: {url}")
-            content = download_file(url)
+            futures[pool.submit(download_source, url, validators.get(url))] = (url, source_type)
+        
+        for future in as_completed(futures):
+            url, source_type = futures.pop(future)
+            content, new_validators = future.result()
+            if current is not None and new_validators:
+                current['validators'][url] = new_validators
+            if content is NOT_MODIFIED:
+                unchanged.append((url, source_type))
+                continue
+            if not content:
+                continue
             
-            if content:
-                if source_type == 'domains':
-                    # Parse as domain list and add to domains
-                    parsed_domains = parse_content(content, source_type)
-                    extra_domains.update(parsed_domains)
-                    log(f"  Parsed {len(parsed_domains)} domains from source")
-                else:
-                    # Parse as IP/CIDR list
-                    cidrs = parse_content(content, source_type)
-                    # Normalize to CIDR
-                    normalized_cidrs = set()
-                    for cidr in cidrs:
-                        normalized = normalize_ip_to_cidr(cidr)
-                        if normalized:
-                            normalized_cidrs.add(normalized)
-                    all_cidrs.update(normalized_cidrs)
-                    log(f"  Parsed {len(normalized_cidrs)} CIDRs")
+            if source_type == 'domains':
+                # Parse as domain list and add to domains
+                parsed_domains = parse_content(content, source_type)
+                extra_domains.update(parsed_domains)
+                log(f"  Parsed {len(parsed_domains)} domains from source")
+            else:
+                # Parse as IP/CIDR list (networks, sorted once when merged)
+                cidrs = parse_content(content, source_type)
+                all_cidrs.update(cidrs)
+                log(f"  Parsed {len(cidrs)} CIDRs")
+        return unchanged
+    
+    if plain_sources:
+        unchanged = download_and_parse(plain_sources, old_validators)
+        if unchanged and len(unchanged) == len(plain_sources):
+            log("  Sources not modified, keeping existing lists")
+            if current is not None:
+                current['services'][service_id] = kept
+            return
+        if unchanged:
+            # Other sources changed, so the lists are rebuilt and need these bodies too
+            download_and_parse(unchanged, {})
     
     # Add extra domains from sources to domains file
     if extra_domains:
@@ -345,15 +541,15 @@ def process_service(service):
     if all_domains:
         domains_file = LISTS_DIR / f"{service_id}_domains.txt"
         with open(domains_file, 'w') as f:
-            for domain in all_domains:
-                f.write(f"{domain}\n")
-        log(f"  Saved {len(all_domains)} unique domains")
+            f.write('\n'.join(all_domains) + '\n')
+        written.append(domains_file.name)
+        log(f"  Saved {len(all_domains)} unique domains ({len(custom_domains)} custom)")
     
     # Add static IP ranges to CIDRs and normalize them
     for ip_range in ip_ranges:
         normalized = normalize_ip_to_cidr(ip_range)
         if normalized:
-            all_cidrs.add(normalized)
+            all_cidrs.add(ip_network(normalized))
     
     # Merge overlapping CIDR networks
     if all_cidrs:
@@ -362,13 +558,16 @@ def process_service(service):
         log(f"  After merging: {len(merged_cidrs)} unique CIDRs (removed {len(all_cidrs) - len(merged_cidrs)} duplicates/overlaps)")
         all_cidrs = merged_cidrs
     
-    # Save CIDRs to file
+    # Save CIDRs to file (merge_cidr_networks returns them in network order)
     if all_cidrs:
         cidrs_file = LISTS_DIR / f"{service_id}.txt"
         with open(cidrs_file, 'w') as f:
-            for cidr in sorted(all_cidrs):
-                f.write(f"{cidr}\n")
+            f.write('\n'.join(map(str, all_cidrs)) + '\n')
+        written.append(cidrs_file.name)
         log(f"  Total: {len(all_cidrs)} unique CIDRs saved to {cidrs_file}")
+    
+    if current is not None:
+        current['services'][service_id] = {'fingerprint': fingerprint, 'files': written}
 
 def check_nftset_support():
     """Check if dnsmasq supports nftset directive"""
@@ -378,7 +577,7 @@ def check_nftset_support():
     except Exception:
         return False
 
-def generate_dnsmasq_config():
+def generate_dnsmasq_config(services_data=None):
     """Generate dnsmasq nftset configuration"""
     
     # Check if dnsmasq supports nftset
@@ -401,17 +600,16 @@ def generate_dnsmasq_config():
         log("Removing old config: /etc/dnsmasq.d/pinpoint.conf")
         old_config.unlink()
     
-    # Collect all domains from enabled services
+    # Collect all domains and ids of enabled services in one pass
     all_domains = set()
+    enabled_service_ids = set()
     
-    if SERVICES_FILE.exists():
-        with open(SERVICES_FILE) as f:
-            data = json.load(f)
-        
-        for service in data.get('services', []):
-            if service.get('enabled', False):
-                domains = service.get('domains', [])
-                all_domains.update(domains)
+    if services_data is None:
+        services_data = load_services()
+    for service in services_data.get('services', []):
+        if service.get('enabled', False):
+            all_domains.update(service.get('domains', []))
+            enabled_service_ids.add(service.get('id', ''))
     
     # Also check for custom domains file (legacy)
     custom_file = DATA_DIR / "domains.json"
@@ -445,32 +643,16 @@ def generate_dnsmasq_config():
         ""
     ]
     
-    # Track which services are enabled
-    enabled_service_ids = set()
-    if SERVICES_FILE.exists():
-        with open(SERVICES_FILE) as f:
-            data = json.load(f)
-        for service in data.get('services', []):
-            if service.get('enabled', False):
-                enabled_service_ids.add(service.get('id', ''))
-    
     for domain in sorted(all_domains):
         if domain:
             config_lines.append(f"nftset=/{domain}/4#inet#pinpoint#tunnel_ips")
     
     # Block IPv6 for YouTube/Google Video domains to force IPv4
     # ONLY if youtube or youtubemusic service is enabled
-    youtube_services = {'youtube', 'youtubemusic', 'googlevideo'}
-    if enabled_service_ids & youtube_services:
-        youtube_domains = [
-            "googlevideo.com", "youtube.com", "music.youtube.com", 
-            "ytimg.com", "ggpht.com", "youtubei.googleapis.com",
-            "wide-youtube.l.google.com", "youtube-ui.l.google.com"
-        ]
+    if enabled_service_ids & _YOUTUBE_SERVICES:
         config_lines.append("")
         config_lines.append("# Block IPv6 for YouTube to force IPv4 routing")
-        for domain in youtube_domains:
-            config_lines.append(f"address=/{domain}/::")
+        config_lines.extend(_YOUTUBE_V6_LINES)
     
     # Write config
     DNSMASQ_CONF.parent.mkdir(parents=True, exist_ok=True)
@@ -479,34 +661,69 @@ def generate_dnsmasq_config():
     
     log(f"Saved {len(all_domains)} domains to {DNSMASQ_CONF}")
 
-def load_nftables_sets():
+def nft_script(script):
+    """Run an nft script through a single `nft -f -` call (applied as one transaction)"""
+    result = subprocess.run(["nft", "-f", "-"], input=script, capture_output=True, text=True)
+    return result.returncode == 0
+
+def nft_add_elements(set_name, elements, flush=False):
+    """Add elements to an inet pinpoint set in one transaction, return how many were loaded"""
+    elements = list(elements)
+    script = f"flush set inet pinpoint {set_name}\n" if flush else ""
+    if elements:
+        script += f"add element inet pinpoint {set_name} {{ {', '.join(elements)} }}\n"
+    if not script:
+        return 0
+    if nft_script(script):
+        return len(elements)
+    
+    # One malformed or overlapping entry rejects the whole batch - retry one by one so the rest still load
+    if flush:
+        subprocess.run(["nft", "flush", "set", "inet", "pinpoint", set_name], capture_output=True)
+    loaded = 0
+    for element in elements:
+        result = subprocess.run(
+            ["nft", "add", "element", "inet", "pinpoint", set_name, "{", element, "}"],
+            capture_output=True
+        )
+        if result.returncode == 0:
+            loaded += 1
+    return loaded
+
+def load_nftables_sets(services_data=None):
     """Load IP CIDRs into nftables sets"""
     log("Loading nftables sets...")
     
-    # Flush existing set
-    subprocess.run(["nft", "flush", "set", "inet", "pinpoint", "tunnel_nets"], 
-                   capture_output=True)
-    
     # Get list of enabled services
+    if services_data is None:
+        services_data = load_services()
     enabled_services = set()
-    if SERVICES_FILE.exists():
-        with open(SERVICES_FILE) as f:
-            data = json.load(f)
-        for service in data.get('services', []):
-            if service.get('enabled', False):
-                enabled_services.add(service.get('id', ''))
+    for service in services_data.get('services', []):
+        if service.get('enabled', False):
+            enabled_services.add(service.get('id', ''))
+    
+    # Collect everything first, then flush and fill the set with one nft call
+    cidrs = set()
+    
+    # Split list files into CIDR and static files in a single directory pass
+    cidr_files = []
+    static_files = []
+    try:
+        with os.scandir(LISTS_DIR) as it:
+            for entry in it:
+                name = entry.name
+                if not name.endswith(".txt") or "_domains" in name:
+                    continue
+                if name.endswith("_static.txt"):
+                    static_files.append(entry.path)
+                elif "_static" not in name:
+                    cidr_files.append(entry.path)
+    except FileNotFoundError:
+        pass
     
     # Load CIDR files only for enabled services
-    loaded = 0
-    for cidr_file in LISTS_DIR.glob("*.txt"):
-        # Skip domain files
-        if "_domains" in cidr_file.name:
-            continue
-        if "_static" in cidr_file.name:
-            continue
-        
-        # Check if this file belongs to an enabled service
-        service_id = cidr_file.stem  # filename without extension
+    for cidr_file in cidr_files:
+        service_id = os.path.basename(cidr_file)[:-len(".txt")]
         if service_id not in enabled_services:
             continue
         
@@ -514,18 +731,11 @@ def load_nftables_sets():
             for line in f:
                 cidr = line.strip()
                 if cidr and '/' in cidr:
-                    result = subprocess.run(
-                        ["nft", "add", "element", "inet", "pinpoint", 
-                         "tunnel_nets", "{", cidr, "}"],
-                        capture_output=True
-                    )
-                    if result.returncode == 0:
-                        loaded += 1
+                    cidrs.add(cidr)
     
     # Also load static files (only for enabled services)
-    for static_file in LISTS_DIR.glob("*_static.txt"):
-        # Check if this file belongs to an enabled service
-        service_id = static_file.stem.replace("_static", "")
+    for static_file in static_files:
+        service_id = os.path.basename(static_file)[:-len("_static.txt")]
         if service_id not in enabled_services:
             continue
             
@@ -535,13 +745,7 @@ def load_nftables_sets():
                 if cidr:
                     if '/' not in cidr:
                         cidr = f"{cidr}/32"
-                    result = subprocess.run(
-                        ["nft", "add", "element", "inet", "pinpoint", 
-                         "tunnel_nets", "{", cidr, "}"],
-                        capture_output=True
-                    )
-                    if result.returncode == 0:
-                        loaded += 1
+                    cidrs.add(cidr)
     
     # Load custom IPs from domains.json (legacy)
     custom_file = DATA_DIR / "domains.json"
@@ -556,13 +760,7 @@ def load_nftables_sets():
             if ip:
                 if '/' not in ip:
                     ip = f"{ip}/32"
-                result = subprocess.run(
-                    ["nft", "add", "element", "inet", "pinpoint", 
-                     "tunnel_nets", "{", ip, "}"],
-                    capture_output=True
-                )
-                if result.returncode == 0:
-                    loaded += 1
+                cidrs.add(ip)
     
     # Load IPs from custom services
     custom_services_file = DATA_DIR / "custom_services.json"
@@ -575,44 +773,24 @@ def load_nftables_sets():
                     if ip:
                         if '/' not in ip:
                             ip = f"{ip}/32"
-                        result = subprocess.run(
-                            ["nft", "add", "element", "inet", "pinpoint", 
-                             "tunnel_nets", "{", ip, "}"],
-                            capture_output=True
-                        )
-                        if result.returncode == 0:
-                            loaded += 1
+                        cidrs.add(ip)
     
     # Add essential Meta/Instagram IP ranges ONLY if instagram or meta service is enabled
     # These are critical because ISP DNS hijacking returns CDN IPs that don't work through VPN
-    meta_services = {'instagram', 'meta', 'facebook', 'whatsapp'}
-    if enabled_services & meta_services:  # If any Meta service is enabled
-        essential_ranges = [
-            "31.13.24.0/21",      # Facebook
-            "31.13.64.0/18",      # Facebook/Instagram
-            "157.240.0.0/16",     # Meta
-            "179.60.192.0/22",    # Meta
-            "185.60.216.0/22",    # Meta
-            "66.220.144.0/20",    # Facebook
-            "69.63.176.0/20",     # Facebook
-            "69.171.224.0/19",    # Facebook
-            "74.119.76.0/22",     # Facebook
-            "102.132.96.0/20",    # Meta
-            "129.134.0.0/16",     # Meta
-            "147.75.208.0/20",    # Meta
-            "163.70.128.0/17",    # Meta
-        ]
-        
-        for cidr in essential_ranges:
-            result = subprocess.run(
-                ["nft", "add", "element", "inet", "pinpoint", 
-                 "tunnel_nets", "{", cidr, "}"],
-                capture_output=True
-            )
-            if result.returncode == 0:
-                loaded += 1
-    
-    log(f"Loaded {loaded} CIDRs to nftables")
+    if enabled_services & _META_SERVICES:  # If any Meta service is enabled
+        cidrs.update(_META_ESSENTIAL_RANGES)
+    
+    # Services overlap a lot - dedupe and merge adjacent/contained ranges across all of them
+    nets = set()
+    for cidr in cidrs:
+        try:
+            nets.add(IPv4Network(cidr, strict=False))
+        except ValueError:
+            continue
+    collapsed = [str(net) for net in collapse_addresses(nets)]
+    
+    loaded = nft_add_elements("tunnel_nets", collapsed, flush=True)
+    log(f"Loaded {loaded} CIDRs to nftables (merged from {len(cidrs)})")
 
 def restart_dnsmasq():
     """Restart dnsmasq to apply new config"""
@@ -636,45 +814,43 @@ def clean_device_rules():
     if result.returncode != 0:
         return
     
-    # Find and delete rules with device comments
-    import re
+    # Find rules with device comments
     handles_to_delete = []
-    for line in result.stdout.split('\n'):
+    for line in iter_lines(result.stdout):
         if 'pinpoint: device' in line:
-            # Extract handle number
-            match = re.search(r'# handle (\d+)', line)
+            match = _HANDLE_RE.search(line)
             if match:
                 handles_to_delete.append(match.group(1))
     
-    # Delete rules by handle (in reverse order to avoid reordering issues)
-    for handle in reversed(handles_to_delete):
-        subprocess.run(
-            ["nft", "delete", "rule", "inet", "pinpoint", "prerouting", "handle", handle],
-            capture_output=True
-        )
-    
-    if handles_to_delete:
-        log(f"Removed {len(handles_to_delete)} old device rules")
-    
-    # Also clean up device-specific sets
+    # Find device-specific sets
+    sets_to_delete = []
     result = subprocess.run(
         ["nft", "list", "sets", "inet", "pinpoint"],
         capture_output=True, text=True
     )
-    
     if result.returncode == 0:
-        for line in result.stdout.split('\n'):
-            if 'set device_' in line:
-                match = re.search(r'set (device_\w+)', line)
-                if match:
-                    set_name = match.group(1)
-                    subprocess.run(
-                        ["nft", "delete", "set", "inet", "pinpoint", set_name],
-                        capture_output=True
-                    )
-                    log(f"Removed old device set: {set_name}")
+        for line in iter_lines(result.stdout):
+            match = _DEVICE_SET_RE.search(line)
+            if match:
+                sets_to_delete.append(match.group(1))
+    
+    # Rules go first (they reference the sets), all in one transaction
+    commands = [f"delete rule inet pinpoint prerouting handle {handle}" for handle in reversed(handles_to_delete)]
+    commands += [f"delete set inet pinpoint {set_name}" for set_name in sets_to_delete]
+    if not commands:
+        return
+    
+    if not nft_script('\n'.join(commands) + '\n'):
+        # Fall back to one command at a time so a single stale object doesn't block the rest
+        for command in commands:
+            subprocess.run(["nft"] + command.split(), capture_output=True)
+    
+    if handles_to_delete:
+        log(f"Removed {len(handles_to_delete)} old device rules")
+    for set_name in sets_to_delete:
+        log(f"Removed old device set: {set_name}")
 
-def generate_device_rules():
+def generate_device_rules(services_data=None):
     """Generate nftables rules for device-specific routing"""
     log("Generating device routing rules...")
     
@@ -696,12 +872,9 @@ def generate_device_rules():
         return
     
     # Get enabled services and their domains for custom mode
-    services_data = {}
-    if SERVICES_FILE.exists():
-        with open(SERVICES_FILE) as f:
-            svc_data = json.load(f)
-        for svc in svc_data.get('services', []):
-            services_data[svc['id']] = svc
+    if services_data is None:
+        services_data = load_services()
+    services_by_id = {svc['id']: svc for svc in services_data.get('services', [])}
     
     # Build nftables rules
     nft_rules = []
@@ -711,6 +884,8 @@ def generate_device_rules():
     
     # Create sets for devices with custom services
     device_sets = {}
+    # List file CIDRs per service, read once even when several devices share a service
+    service_cidrs = {}
     
     for device in enabled_devices:
         device_id = device['id']
@@ -741,19 +916,23 @@ def generate_device_rules():
             device_cidrs.update(device.get('custom_ips', []))
             
             for svc_id in device_services:
-                svc = services_data.get(svc_id, {})
+                svc = services_by_id.get(svc_id, {})
                 device_domains.update(svc.get('domains', []))
                 device_domains.update(svc.get('custom_domains', []))
                 device_cidrs.update(svc.get('custom_ips', []))
                 
                 # Load CIDRs from list files
-                list_file = LISTS_DIR / f"{svc_id}.txt"
-                if list_file.exists():
-                    with open(list_file) as f:
-                        for line in f:
-                            cidr = line.strip()
-                            if cidr:
-                                device_cidrs.add(cidr)
+                if svc_id not in service_cidrs:
+                    cidrs = set()
+                    list_file = LISTS_DIR / f"{svc_id}.txt"
+                    if list_file.exists():
+                        with open(list_file) as f:
+                            for line in f:
+                                cidr = line.strip()
+                                if cidr:
+                                    cidrs.add(cidr)
+                    service_cidrs[svc_id] = frozenset(cidrs)
+                device_cidrs |= service_cidrs[svc_id]
             
             # Only add if there are domains, IPs, or services
             if device_domains or device_cidrs or device_services:
@@ -765,46 +944,45 @@ def generate_device_rules():
                     'cidrs': device_cidrs
                 }
     
-    # Write rules to file
-    DEVICES_NFT.parent.mkdir(parents=True, exist_ok=True)
-    with open(DEVICES_NFT, 'w') as f:
-        f.write('\n'.join(nft_rules) + '\n')
-    
-    # Apply simple rules (vpn_all, direct_all)
-    for line in nft_rules:
-        if line.startswith('add rule'):
-            cmd = ['nft'] + line.split()
-            subprocess.run(cmd, capture_output=True)
-    
-    # Handle custom device sets
+    # Custom devices: own set, mark rule and a return so global rules don't apply
+    device_elements = {}
     for device_id, dev_data in device_sets.items():
         set_name = dev_data['set_name']
         device_ip = dev_data['ip']
         
-        # Create IP set for this device
-        subprocess.run(['nft', 'add', 'set', 'inet', 'pinpoint', set_name, 
-                       '{', 'type', 'ipv4_addr;', 'flags', 'interval;', '}'], 
-                       capture_output=True)
-        
-        # Add CIDRs to the set
+        nets = set()
         for cidr in dev_data['cidrs']:
-            subprocess.run(['nft', 'add', 'element', 'inet', 'pinpoint', 
-                           set_name, '{', cidr, '}'], capture_output=True)
-        
-        # Add rule to mark traffic from this device to IPs in its set
-        subprocess.run(['nft', 'add', 'rule', 'inet', 'pinpoint', 'prerouting',
-                       'ip', 'saddr', device_ip, 'ip', 'daddr', f'@{set_name}',
-                       'meta', 'mark', 'set', '0x100', 'counter',
-                       'comment', f'"pinpoint: device {device_id} custom"'],
-                       capture_output=True)
-        
-        # Add return rule so global rules don't apply to this device
-        subprocess.run(['nft', 'add', 'rule', 'inet', 'pinpoint', 'prerouting',
-                       'ip', 'saddr', device_ip, 'return',
-                       'comment', f'"pinpoint: device {device_id} skip global"'],
-                       capture_output=True)
+            try:
+                nets.add(IPv4Network(cidr, strict=False))
+            except ValueError:
+                continue
+        elements = [str(net) for net in collapse_addresses(nets)]
+        device_elements[set_name] = elements
         
-        log(f"  Device {dev_data['name']}: {len(dev_data['cidrs'])} CIDRs, {len(dev_data['domains'])} domains (custom only)")
+        nft_rules.append(f"# Device: {dev_data['name']} - Custom services")
+        nft_rules.append(f"add set inet pinpoint {set_name} {{ type ipv4_addr; flags interval; }}")
+        if elements:
+            nft_rules.append(f"add element inet pinpoint {set_name} {{ {', '.join(elements)} }}")
+        nft_rules.append(f"add rule inet pinpoint prerouting ip saddr {device_ip} ip daddr @{set_name} meta mark set 0x100 counter comment \"pinpoint: device {device_id} custom\"")
+        nft_rules.append(f"add rule inet pinpoint prerouting ip saddr {device_ip} return comment \"pinpoint: device {device_id} skip global\"")
+    
+    # Write rules to file and apply them as one transaction
+    script = '\n'.join(nft_rules) + '\n'
+    DEVICES_NFT.parent.mkdir(parents=True, exist_ok=True)
+    with open(DEVICES_NFT, 'w') as f:
+        f.write(script)
+    
+    if not nft_script(script):
+        # Fall back to one statement at a time so one bad device doesn't drop the rest
+        log("Batch apply of device rules failed, applying one by one")
+        for line in nft_rules:
+            if line.startswith('add ') and not line.startswith('add element'):
+                nft_script(line + '\n')
+        for set_name, elements in device_elements.items():
+            nft_add_elements(set_name, elements)
+    
+    for dev_data in device_sets.values():
+        log(f"  Device {dev_data['name']}: {len(device_elements[dev_data['set_name']])} CIDRs, {len(dev_data['domains'])} domains (custom only)")
     
     log(f"Applied rules for {len(enabled_devices)} devices")
 
@@ -870,16 +1048,10 @@ def update_services_from_github():
                 domains = parse_domains_list(content)
                 all_domains.update(domains)
             else:
-                cidrs = parse_content(content, 'auto')
-                for cidr in cidrs:
-                    normalized = normalize_ip_to_cidr(cidr)
-                    if normalized:
-                        all_cidrs.add(normalized)
+                all_cidrs.update(parse_content(content, 'auto'))
         
-        # Merge overlapping CIDRs
-        if all_cidrs:
-            merged_cidrs = merge_cidr_networks(all_cidrs)
-            all_cidrs = merged_cidrs
+        # Merge overlapping CIDRs (returned in network order)
+        all_cidrs = [str(net) for net in merge_cidr_networks(all_cidrs)]
         
         # Remove duplicate domains
         all_domains = sorted(set(domain.lower() for domain in all_domains))
@@ -888,7 +1060,7 @@ def update_services_from_github():
         if service_id in existing_services:
             service = existing_services[service_id]
             # Update IPs and domains, preserve other settings
-            service['ip_ranges'] = sorted(list(all_cidrs))
+            service['ip_ranges'] = all_cidrs
             service['domains'] = all_domains
         else:
             service = {
@@ -896,7 +1068,7 @@ def update_services_from_github():
                 "name": service_name,
                 "enabled": False,
                 "domains": all_domains,
-                "ip_ranges": sorted(list(all_cidrs)),
+                "ip_ranges": all_cidrs,
                 "sources": []
             }
         
@@ -935,7 +1107,8 @@ def update_single_service(service_id):
     
     # Process the service
     try:
-        process_service(service)
+        with download_pool() as pool:
+            process_service(service, pool)
         log(f"Successfully updated {service_id}")
     except Exception as e:
         log(f"Error processing {service_id}: {e}")
@@ -975,35 +1148,46 @@ def update_all(update_github=False):
         log(f"Services file not found: {SERVICES_FILE}")
         return 1
     
-    with open(SERVICES_FILE) as f:
-        data = json.load(f)
+    # Parsed once and shared by every stage so they all see the same service state
+    data = load_services()
     
-    # Process each service
-    for service in data.get('services', []):
-        try:
-            process_service(service)
-        except Exception as e:
-            log(f"Error processing {service.get('id')}: {e}")
+    services = data.get('services', [])
+    
+    # Body copies from older versions are no longer used - only validators are kept
+    shutil.rmtree(DATA_DIR / "cache", ignore_errors=True)
+    previous = load_sources_state()
+    current = {'validators': {}, 'services': {}}
+    
+    # Process each service (one download pool for the whole run)
+    with download_pool() as pool:
+        for service in services:
+            try:
+                process_service(service, pool, previous, current)
+            except Exception as e:
+                log(f"Error processing {service.get('id')}: {e}")
+    
+    # Only sources and services seen in this run are kept
+    save_sources_state(current)
     
     # Generate dnsmasq config
-    generate_dnsmasq_config()
+    generate_dnsmasq_config(data)
     
     # Load nftables sets
-    load_nftables_sets()
+    load_nftables_sets(data)
     
     # Generate and apply device-specific rules
-    generate_device_rules()
+    generate_device_rules(data)
     
     # Restart dnsmasq
     restart_dnsmasq()
     
     # Save last update timestamp
-    save_update_status()
+    save_update_status(data)
     
     log("=== Update complete ===")
     return 0
 
-def save_update_status():
+def save_update_status(services_data=None):
     """Save last update timestamp to status file"""
     from datetime import datetime
     status_file = DATA_DIR / "status.json"
@@ -1016,14 +1200,13 @@ def save_update_status():
     if LISTS_DIR.exists():
         for f in LISTS_DIR.glob("*.txt"):
             if "_domains" in f.name:
-                total_domains += sum(1 for _ in open(f))
+                total_domains += f.read_bytes().count(b"\n")
             elif "_static" not in f.name:
-                total_cidrs += sum(1 for _ in open(f))
+                total_cidrs += f.read_bytes().count(b"\n")
     
-    if SERVICES_FILE.exists():
-        with open(SERVICES_FILE) as f:
-            data = json.load(f)
-        services_count = len([s for s in data.get('services', []) if s.get('enabled', False)])
+    if services_data is None:
+        services_data = load_services()
+    services_count = sum(1 for s in services_data.get('services', []) if s.get('enabled', False))
     
     status = {
         "last_update": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -1043,7 +1226,7 @@ def show_status():
     print("=== Downloaded Lists ===")
     if LISTS_DIR.exists():
         for f in sorted(LISTS_DIR.glob("*.txt")):
-            count = sum(1 for _ in open(f))
+            count = f.read_bytes().count(b"\n")
             size = f.stat().st_size
             print(f"  {f.name}: {count} entries ({size} bytes)")
     else:
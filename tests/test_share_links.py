@@ -0,0 +1,39 @@
+import base64
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import tunnels  # noqa: E402
+
+
+def _ss_userinfo(method: str, password: str) -> str:
+    return base64.urlsafe_b64encode(f"{method}:{password}".encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("link, server, port", [
+    ("hy2://pw@[::1]:443/?sni=x", "::1", 443),
+    ("hysteria2://pw@[2001:db8::1]:8443?sni=x#name", "2001:db8::1", 8443),
+    ("trojan://pw@[::1]:443/?sni=x#name", "::1", 443),
+    ("vless://uuid@[::1]:443/?type=ws&path=%2Fws#name", "::1", 443),
+    ("vless://uuid@[fe80::1]:8080?type=grpc", "fe80::1", 8080),
+    (f"ss://{_ss_userinfo('aes-256-gcm', 'pw')}@[2001:db8::2]:8388/#name", "2001:db8::2", 8388),
+    ("trojan://pw@example.com:443?sni=x#name", "example.com", 443),
+])
+def test_bracketed_ipv6_and_plain_hosts(link, server, port):
+    tunnel = tunnels.parse_share_link(link)
+    assert tunnel is not None
+    assert tunnel["server"] == server
+    assert tunnel["port"] == port
+
+
+@pytest.mark.parametrize("link", [
+    "trojan://pw@[::1]:/?sni=x",
+    "trojan://pw@[::1]443",
+    "trojan://pw@[]:443",
+    "vless://uuid@[::1:443",
+])
+def test_malformed_bracketed_hosts_rejected(link):
+    assert tunnels.parse_share_link(link) is None